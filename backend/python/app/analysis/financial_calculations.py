@@ -272,12 +272,9 @@ class FinancialCalculationEngine:
             
         returns = np.array(returns, dtype=np.float64)
         
-        # Sort returns in ascending order
-        sorted_returns = np.sort(returns)
-        
-        # Find VaR at specified confidence level
-        var_index = int(confidence_level * len(sorted_returns))
-        var = sorted_returns[var_index]
+        # Find VaR at specified confidence level (a selection, not a full sort)
+        var_index = int(confidence_level * len(returns))
+        var = np.partition(returns, var_index)[var_index]
         
         return float(var)
 
@@ -302,6 +299,164 @@ class FinancialCalculationEngine:
         
         return float(expected_shortfall)
 
+    def align_price_histories(self, price_histories: Dict[str, Any]) -> Tuple[List[str], np.ndarray]:
+        """
+        Align holding price histories on their common calendar
+        
+        Args:
+            price_histories: {symbol: list of {date, close|price|adjClose} records,
+                             {date: price} mapping or list of prices}
+            
+        Returns:
+            (dates, prices[T, n]) in the order of price_histories; undated
+            lists are aligned on their most recent observations and get
+            index labels instead of dates
+        """
+        if not price_histories:
+            raise ValueError("No price histories provided")
+            
+        series = {}
+        for symbol, history in price_histories.items():
+            if isinstance(history, pd.Series):
+                series[symbol] = history.astype(np.float64)
+            elif isinstance(history, dict):
+                series[symbol] = pd.Series(history, dtype=np.float64)
+            elif len(history) > 0 and isinstance(history[0], dict):
+                series[symbol] = pd.Series(
+                    [r.get('adjClose', r.get('close', r.get('price'))) for r in history],
+                    index=[str(r['date'])[:10] for r in history], dtype=np.float64
+                )
+            else:
+                series[symbol] = pd.Series(np.array(history, dtype=np.float64))
+                
+        dated = all(not isinstance(s.index, pd.RangeIndex) for s in series.values())
+        if not dated:
+            length = min(len(s) for s in series.values())
+            series = {symbol: pd.Series(s.values[len(s) - length:]) for symbol, s in series.items()}
+            
+        frame = pd.concat(series, axis=1, join='inner')
+        if dated:
+            frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+        frame = frame[(frame > 0).all(axis=1)].dropna()
+        
+        if len(frame) < 2:
+            raise ValueError("Price histories share fewer than 2 dates")
+            
+        return [str(d) for d in frame.index], frame.to_numpy(dtype=np.float64)
+
+    def calculate_portfolio_returns(self, price_histories: Dict[str, Any], 
+                                  weights: Dict[str, float]) -> Tuple[List[str], np.ndarray]:
+        """
+        Portfolio return series from aligned holding histories, in one matrix product
+        
+        Args:
+            price_histories: Price history per symbol (see align_price_histories)
+            weights: Portfolio weights by symbol (fractions of portfolio value)
+            
+        Returns:
+            (dates, portfolio returns) with one return per common date after the first
+        """
+        symbols = [symbol for symbol in weights if symbol in price_histories]
+        missing = [symbol for symbol in weights if symbol not in price_histories and weights[symbol] != 0]
+        if missing:
+            raise ValueError(f"Missing price history for: {', '.join(missing)}")
+            
+        dates, prices = self.align_price_histories({symbol: price_histories[symbol] for symbol in symbols})
+        returns = prices[1:] / prices[:-1] - 1
+        portfolio_returns = returns @ np.array([weights[symbol] for symbol in symbols], dtype=np.float64)
+        
+        return dates[1:], portfolio_returns
+
+    def calculate_portfolio_var(self, price_histories: Dict[str, Any], weights: Dict[str, float],
+                              confidence_level: float = 0.05, portfolio_value: Optional[float] = None,
+                              window: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Portfolio Value at Risk and Expected Shortfall by historical simulation
+        
+        Args:
+            price_histories: Price history per symbol (see align_price_histories)
+            weights: Portfolio weights by symbol (fractions of portfolio value)
+            confidence_level: Risk level (0.05 = 5% VaR, 0.01 = 1% VaR)
+            portfolio_value: Optional value to express VaR and ES as P&L amounts
+            window: Optional number of most recent returns to use
+            
+        Returns:
+            Dictionary with var and expected_shortfall (as returns, same sign
+            convention as calculate_var), amounts when portfolio_value is given,
+            and the observation window
+        """
+        if not 0 < confidence_level < 1:
+            raise ValueError("Confidence level must be between 0 and 1")
+            
+        dates, portfolio_returns = self.calculate_portfolio_returns(price_histories, weights)
+        if window:
+            dates, portfolio_returns = dates[-window:], portfolio_returns[-window:]
+            
+        var = self.calculate_var(portfolio_returns, confidence_level)
+        expected_shortfall = self.calculate_expected_shortfall(portfolio_returns, confidence_level)
+        
+        return {
+            'var': var,
+            'expected_shortfall': expected_shortfall,
+            'var_amount': var * portfolio_value if portfolio_value else None,
+            'expected_shortfall_amount': expected_shortfall * portfolio_value if portfolio_value else None,
+            'confidence_level': confidence_level,
+            'observations': int(len(portfolio_returns)),
+            'start_date': dates[0],
+            'end_date': dates[-1]
+        }
+
+    def calculate_rolling_var(self, returns: List[float], window: int = 250, 
+                            confidence_level: float = 0.05) -> Dict[str, Any]:
+        """
+        Rolling historical-simulation VaR with a breach backtest
+        
+        Args:
+            returns: Return series (e.g. from calculate_portfolio_returns)
+            window: Returns used for each VaR estimate
+            confidence_level: Risk level (0.05 = 5% VaR, 0.01 = 1% VaR)
+            
+        Returns:
+            Dictionary with the VaR series (VaR for day t uses the window
+            before t), breaches (positions in the VaR series where the realized
+            return fell below it) and the Kupiec proportion-of-failures test
+        """
+        if not self.validate_input(returns, 'return_series'):
+            raise ValueError("Invalid return series input")
+        if not 0 < confidence_level < 1:
+            raise ValueError("Confidence level must be between 0 and 1")
+            
+        returns = np.array(returns, dtype=np.float64)
+        if len(returns) <= window:
+            raise ValueError("Return series must be longer than the VaR window")
+            
+        # Every window at once, each reduced to one order statistic
+        var_index = int(confidence_level * window)
+        windows = np.lib.stride_tricks.sliding_window_view(returns[:-1], window)
+        var_series = np.partition(windows, var_index, axis=1)[:, var_index]
+        realized = returns[window:]
+        breaches = realized < var_series
+        
+        # Kupiec POF: likelihood ratio of the observed breach rate against the expected one
+        n_obs = len(realized)
+        n_breaches = int(breaches.sum())
+        observed_rate = n_breaches / n_obs
+        log_null = (n_obs - n_breaches) * np.log(1 - confidence_level) + n_breaches * np.log(confidence_level)
+        log_alt = ((n_obs - n_breaches) * np.log(1 - observed_rate) if n_breaches < n_obs else 0.0) + \
+                  (n_breaches * np.log(observed_rate) if n_breaches > 0 else 0.0)
+        likelihood_ratio = max(-2 * (log_null - log_alt), 0.0)
+        
+        return {
+            'var_series': var_series.tolist(),
+            'breaches': np.flatnonzero(breaches).tolist(),
+            'breach_count': n_breaches,
+            'breach_rate': float(observed_rate),
+            'expected_breach_rate': confidence_level,
+            'kupiec_statistic': float(likelihood_ratio),
+            'kupiec_p_value': float(stats.chi2.sf(likelihood_ratio, df=1)),
+            'window': window
+        }
+
     def calculate_beta(self, asset_returns: List[float], market_returns: List[float]) -> float:
         """
         Calculate beta (systematic risk measure)
@@ -5,16 +5,24 @@ Implements regime-aware portfolio optimization and dynamic allocation
 Part of Phase 5: AI-Powered Investment Intelligence
 """
 
+import os
 import sys
 import json
+import time
+import hashlib
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 import warnings
 warnings.filterwarnings('ignore')
 
 try:
-    from scipy.optimize import minimize, differential_evolution
+    from scipy.optimize import minimize, differential_evolution, linprog
+    from scipy import sparse
+    from scipy.linalg import cho_factor, cho_solve
+    from scipy.cluster.hierarchy import linkage, leaves_list
+    from scipy.spatial.distance import squareform
     from scipy.stats import norm
     import cvxpy as cp  # For convex optimization (optional)
     CVXPY_AVAILABLE = True
@@ -22,6 +30,9 @@ except ImportError:
     CVXPY_AVAILABLE = False
     print(json.dumps({"warning": "CVXPY not available - using scipy optimization only"}))
 
+from risk_model import RiskModelCache, covariance_version
+from scenario_model import ScenarioCache
+
 class DynamicAllocationService:
     def __init__(self):
         # Risk tolerance levels by regime
@@ -48,6 +59,109 @@ class DynamicAllocationService:
             'var_confidence': 0.05,       # 5% VaR confidence level
             'rebalancing_threshold': 0.05  # 5% drift threshold for rebalancing
         }
+        
+        # Optimizer settings
+        self.optimizer_params = {
+            'risk_aversion': 3.0,      # Quadratic-utility risk aversion (starting point when a risk target is set)
+            'target_risk_bisections': 60,       # Risk-aversion bisection steps to meet a risk target
+            'target_risk_tolerance': 1e-6,      # Volatility gap to the risk target that ends the bisection
+            'target_risk_max_aversion': 1e8,    # Risk-aversion search range [1 / max, max]
+            'qp_max_iterations': 500,  # Active-set iterations before falling back to SLSQP
+            'qp_tolerance': 1e-10,
+            'bl_tau': 0.025,                # Black-Litterman prior scaling
+            'bl_default_confidence': 0.5,   # Confidence of views without one (and of ML absolute views)
+            'erc_max_iterations': 50,       # Newton steps for the risk parity solver
+            'erc_tolerance': 1e-12,         # Stop when half the squared Newton decrement is below this
+            'erc_max_dispersion': 0.1,      # Largest contribution gap of capped weights, as a share of the smallest budget
+            'hrp_linkage': 'single',        # Linkage for hierarchical risk parity clustering
+            'time_budget_ms': 3000          # After this, iterative methods are replaced by HRP (0 = no budget)
+        }
+        self.solver_diagnostics = {}
+        self.black_litterman_views = []
+        self.risk_budgets = {}  # Risk parity budgets by symbol (equal when empty)
+        
+        # Allocation methods (selectable by name) and their ensemble shares
+        self.ensemble_method_weights = {
+            'mean_variance': 0.25,
+            'risk_parity': 0.25,
+            'black_litterman': 0.2,
+            'minimum_variance': 0.15,
+            'hrp': 0.15,
+            'cvar': 0.2
+        }
+        # CVaR runs on request, and by default in the regimes listed in cvar_params
+        self.default_allocation_methods = [name for name in self.ensemble_method_weights if name != 'cvar']
+        self.allocation_methods = list(self.default_allocation_methods)
+        self.iterative_methods = ('mean_variance', 'risk_parity', 'minimum_variance', 'cvar')
+        self.factor_cache = {}
+        
+        # Asset-class flags for heuristic correlations: a symbol's class code is
+        # the bit mask of the lists it matches (substring match, so TQQQ counts
+        # as equity), and the class-by-class table holds the pairwise rules of
+        # class_pair_correlation for every pair of codes
+        self.asset_class_flags = ('equity', 'bond', 'commodity', 'intl')
+        self.asset_class_symbols = {
+            'equity': ['SPY', 'QQQ', 'IWM', 'VTI', 'AAPL', 'MSFT', 'GOOGL'],
+            'bond': ['TLT', 'BND', 'AGG', 'IEF', 'SHY'],
+            'commodity': ['GLD', 'SLV', 'USO', 'DBC'],
+            'intl': ['EFA', 'EEM', 'VEA', 'VWO']
+        }
+        self.asset_class_lookup = {}
+        n_codes = 2 ** len(self.asset_class_flags)
+        self.asset_class_correlations = np.array([
+            [self.class_pair_correlation(code1, code2) for code2 in range(n_codes)] for code1 in range(n_codes)
+        ])
+        
+        # Return-based covariance (falls back to asset-class heuristics without history)
+        self.covariance_params = {
+            'method': 'ledoit_wolf',   # 'ledoit_wolf', 'ewma' or 'sample'
+            'window': 252,             # Trading days of returns
+            'ewma_lambda': 0.94
+        }
+        self.risk_model = RiskModelCache('/tmp/risk_model_cache/')
+        self.covariance_details = {}
+        
+        # Batch allocation (many portfolios sharing one risk model)
+        self.batch_params = {
+            'max_workers': None,            # Defaults to all cores
+            'chunk_size': 25,               # Portfolios per worker task
+            'min_parallel_portfolios': 50   # Smaller batches run in-process
+        }
+        
+        # Efficient frontier sweeps, cached per (universe, covariance version)
+        self.frontier_params = {
+            'n_points': 20,
+            'mode': 'return',    # 'return' (target-return QPs) or 'risk' (target-risk SLSQP)
+            'cache_path': '/tmp/frontier_cache/'
+        }
+        self.frontier_cache = {}
+        
+        # Rebalancing: 'threshold' scales trades to max_turnover; 'cost_aware' solves for trades net of costs
+        self.rebalancing_params = {
+            'mode': 'threshold',
+            'default_cost_bps': 10.0,       # Per-asset one-way cost when not listed
+            'transaction_costs_bps': {},    # {symbol: bps}
+            'turnover_budget': self.allocation_constraints['max_turnover'],
+            'max_bisections': 60            # Turnover-price bisection steps when the budget binds
+        }
+        
+        # Scenario-based CVaR (Rockafellar-Uryasev LP); variance understates tail risk in stressed regimes
+        self.cvar_params = {
+            'confidence': 0.95,
+            'scenario_source': 'auto',      # 'historical', 'monte_carlo' or 'auto' (history when long enough)
+            'n_scenarios': 10000,
+            'horizon_days': 1,
+            'student_t_dof': 5,             # Monte Carlo tails (None = normal)
+            'seed': 42,
+            'regimes': ['Bear', 'Volatile'],
+            'lp_method': 'highs-ipm',
+            'max_rounds': 50,               # Scenario-generation rounds before giving up
+            'tolerance': 1e-10
+        }
+        self.scenario_model = ScenarioCache('/tmp/scenario_cache/')
+        self.price_histories = {}
+        self.scenario_set = None  # (universe, scenarios, details) shared by a batch
+        self.scenario_details = {}
 
     def calculate_dynamic_allocation(self, input_data):
         """
@@ -60,6 +174,14 @@ class DynamicAllocationService:
             ml_predictions = input_data.get('ml_predictions', {})
             risk_adjustment = input_data.get('risk_adjustment', 1.0)
             portfolio_data = input_data.get('portfolio_data', {})
+            price_histories = self.collect_price_histories(input_data)
+            self.covariance_params.update(input_data.get('covariance', {}))
+            self.black_litterman_views = input_data.get('black_litterman_views', [])
+            self.risk_budgets = input_data.get('risk_budgets', {})
+            self.select_allocation_methods(input_data)
+            self.rebalancing_params.update(input_data.get('rebalancing', {}))
+            self.cvar_params.update(input_data.get('cvar', {}))
+            self.price_histories = price_histories
             
             print(f"⚖️ Calculating dynamic allocation for {market_regime} regime...")
             
@@ -74,64 +196,384 @@ class DynamicAllocationService:
             expected_returns = self.extract_expected_returns(ml_predictions, symbols)
             
             # Estimate covariance matrix
-            covariance_matrix = self.estimate_covariance_matrix(symbols, ml_predictions)
+            covariance_matrix = self.estimate_covariance_matrix(symbols, ml_predictions, price_histories)
             
-            # Apply regime-based risk adjustment
-            adjusted_risk_target = self.calculate_adjusted_risk_target(market_regime, regime_confidence)
-            
-            # Calculate optimal allocation using multiple methods
-            optimization_results = self.optimize_portfolio_allocation(
-                symbols, expected_returns, covariance_matrix, current_weights, adjusted_risk_target
+            return self.allocate_portfolio(
+                symbols, current_weights, expected_returns, covariance_matrix, market_regime, regime_confidence
             )
             
-            # Apply regime-specific tilts
-            regime_adjusted_weights = self.apply_regime_tilts(
-                optimization_results['optimal_weights'], market_regime, regime_confidence
-            )
+        except Exception as e:
+            print(f"❌ Error in dynamic allocation: {str(e)}")
+            return self.generate_fallback_allocation(current_weights, market_regime)
+
+    def calculate_batch_allocation(self, input_data):
+        """
+        Allocate many portfolios against one shared risk model.
+        Expected returns, covariance and its Cholesky factor are built once over
+        the union of symbols; each portfolio is solved on its slice, in worker
+        processes when the batch is large enough.
+        """
+        try:
+            portfolios = input_data.get('portfolios', [])
+            market_regime = input_data.get('market_regime', 'Stable')
+            regime_confidence = input_data.get('regime_confidence', 0.7)
+            ml_predictions = input_data.get('ml_predictions', {})
+            self.covariance_params.update(input_data.get('covariance', {}))
+            self.batch_params.update(input_data.get('batch', {}))
+            self.black_litterman_views = input_data.get('black_litterman_views', [])
+            self.risk_budgets = input_data.get('risk_budgets', {})
+            self.select_allocation_methods(input_data)
+            self.rebalancing_params.update(input_data.get('rebalancing', {}))
+            self.cvar_params.update(input_data.get('cvar', {}))
+            self.price_histories = self.collect_price_histories(input_data)
+            
+            portfolios = [p for p in portfolios if p.get('current_weights')]
+            if not portfolios:
+                return {"error": "No portfolios with current weights provided"}
+            
+            started = time.perf_counter()
+            print(f"⚖️ Calculating batch allocation for {len(portfolios)} portfolios ({market_regime} regime)...")
+            
+            # Union universe in first-seen order
+            universe = list(dict.fromkeys(symbol for p in portfolios for symbol in p['current_weights']))
+            
+            expected_returns = self.extract_expected_returns(ml_predictions, universe)
+            covariance_matrix = self.estimate_covariance_matrix(universe, ml_predictions, self.price_histories)
+            # A union wider than the return window is singular; the portfolios
+            # slice the repaired matrix so their Sigma matches the shared factor
+            covariance_matrix, cholesky_factor = positive_definite_cholesky(covariance_matrix)
+            
+            # One scenario matrix for the whole universe when any portfolio runs CVaR
+            scenario_set = None
+            if any('cvar' in self.methods_for_regime(p.get('market_regime') or market_regime) for p in portfolios):
+                scenarios = self.scenarios_for(
+                    universe, np.array([expected_returns[symbol] for symbol in universe]), covariance_matrix
+                )
+                scenario_set = (universe, scenarios, self.scenario_details)
+            risk_model_seconds = time.perf_counter() - started
+            
+            context = {
+                'universe': universe,
+                'expected_returns': expected_returns,
+                'covariance_matrix': covariance_matrix,
+                'cholesky_factor': cholesky_factor,
+                'covariance_details': self.covariance_details,
+                'market_regime': market_regime,
+                'regime_confidence': regime_confidence,
+                'black_litterman_views': self.black_litterman_views,
+                'risk_budgets': self.risk_budgets,
+                'allocation_methods': self.allocation_methods,
+                'scenario_set': scenario_set,
+                'settings': {
+                    'allocation_constraints': self.allocation_constraints,
+                    'risk_params': self.risk_params,
+                    'optimizer_params': self.optimizer_params,
+                    'rebalancing_params': self.rebalancing_params,
+                    'cvar_params': self.cvar_params
+                }
+            }
             
-            # Validate and constrain allocation
-            final_weights = self.apply_allocation_constraints(
-                regime_adjusted_weights, current_weights, symbols
-            )
+            tasks = [
+                (str(p.get('id', index)), p['current_weights'], p.get('market_regime'), p.get('regime_confidence'))
+                for index, p in enumerate(portfolios)
+            ]
+            chunk_size = max(1, int(self.batch_params['chunk_size']))
+            chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+            
+            solve_started = time.perf_counter()
+            workers = self.batch_workers(len(tasks))
+            results = {}
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker,
+                                         initargs=(context,)) as executor:
+                    for chunk_results in executor.map(run_batch_chunk, chunks):
+                        results.update(chunk_results)
+            else:
+                for chunk in chunks:
+                    results.update(self.allocate_batch_chunk(context, chunk))
+            solve_seconds = time.perf_counter() - solve_started
+            
+            # Ex-ante risk of every current and recommended portfolio from the shared factor
+            position = {symbol: i for i, symbol in enumerate(universe)}
+            current_matrix = np.zeros((len(tasks), len(universe)))
+            optimal_matrix = np.zeros((len(tasks), len(universe)))
+            for row, (portfolio_id, current_weights, _, _) in enumerate(tasks):
+                for symbol, weight in current_weights.items():
+                    current_matrix[row, position[symbol]] = weight
+                for symbol, weight in results[portfolio_id].get('optimal_weights', {}).items():
+                    optimal_matrix[row, position[symbol]] = weight
+            current_risk = np.linalg.norm(current_matrix @ cholesky_factor, axis=1)
+            optimal_risk = np.linalg.norm(optimal_matrix @ cholesky_factor, axis=1)
+            
+            total_seconds = time.perf_counter() - started
+            return {
+                "success": True,
+                "results": results,
+                "universe": universe,
+                "covariance_model": self.covariance_details,
+                "risk_summary": {
+                    "average_current_risk": float(current_risk.mean()),
+                    "average_optimal_risk": float(optimal_risk.mean()),
+                    "portfolios_with_lower_risk": int(np.sum(optimal_risk < current_risk))
+                },
+                "throughput": {
+                    "portfolios": len(tasks),
+                    "workers": workers,
+                    "risk_model_seconds": round(risk_model_seconds, 4),
+                    "solve_seconds": round(solve_seconds, 4),
+                    "total_seconds": round(total_seconds, 4),
+                    "portfolios_per_second": round(len(tasks) / total_seconds, 2) if total_seconds > 0 else None
+                },
+                "timestamp": datetime.now().isoformat()
+            }
             
-            # Calculate expected portfolio metrics
-            portfolio_metrics = self.calculate_portfolio_metrics(
-                final_weights, expected_returns, covariance_matrix
-            )
+        except Exception as e:
+            print(f"❌ Error in batch allocation: {str(e)}")
+            return {"success": False, "error": str(e), "results": {}, "timestamp": datetime.now().isoformat()}
+
+    def batch_workers(self, n_portfolios):
+        """Worker processes for a batch; small batches run in-process"""
+        if n_portfolios < self.batch_params['min_parallel_portfolios']:
+            return 1
+        max_workers = self.batch_params['max_workers'] or os.cpu_count() or 1
+        chunks = -(-n_portfolios // max(1, int(self.batch_params['chunk_size'])))
+        return max(1, min(int(max_workers), chunks))
+
+    def allocate_batch_chunk(self, context, chunk):
+        """
+        Solve a chunk of batch portfolios on slices of the shared expected
+        returns and covariance; each slice's Cholesky factor comes from the
+        union factor (slice_cholesky), so no portfolio refactorizes its Sigma
+        """
+        position = {symbol: i for i, symbol in enumerate(context['universe'])}
+        self.covariance_details = context['covariance_details']
+        self.black_litterman_views = context['black_litterman_views']
+        self.risk_budgets = context['risk_budgets']
+        self.allocation_methods = context['allocation_methods']
+        self.scenario_set = context['scenario_set']
+        results = {}
+        
+        for portfolio_id, current_weights, market_regime, regime_confidence in chunk:
+            market_regime = market_regime or context['market_regime']
+            regime_confidence = context['regime_confidence'] if regime_confidence is None else regime_confidence
+            try:
+                symbols = list(current_weights.keys())
+                index = np.array([position[symbol] for symbol in symbols])
+                covariance_matrix = context['covariance_matrix'][np.ix_(index, index)]
+                self.cache_covariance_factor(
+                    covariance_version(covariance_matrix),
+                    (slice_cholesky(context['cholesky_factor'], index), False), source='shared'
+                )
+                results[portfolio_id] = self.allocate_portfolio(
+                    symbols, current_weights,
+                    {symbol: context['expected_returns'][symbol] for symbol in symbols},
+                    covariance_matrix, market_regime, regime_confidence
+                )
+            except Exception as e:
+                print(f"⚠️ Error allocating portfolio {portfolio_id}: {str(e)}")
+                results[portfolio_id] = self.generate_fallback_allocation(current_weights, market_regime)
+        
+        return results
+
+    def calculate_efficient_frontier(self, input_data):
+        """
+        Mean-variance efficient frontier: n_points target-return (or target-risk)
+        portfolios between the minimum-variance and maximum-return portfolios,
+        each solve warm-started from the previous point. Frontiers are cached
+        per (universe, covariance version).
+        """
+        try:
+            symbols = input_data.get('symbols') or list(input_data.get('current_weights', {}).keys())
+            ml_predictions = input_data.get('ml_predictions', {})
+            self.covariance_params.update(input_data.get('covariance', {}))
+            self.frontier_params.update(input_data.get('frontier', {}))
+            mode = self.frontier_params['mode']
+            n_points = max(2, int(self.frontier_params['n_points']))
             
-            # Generate regime justification
-            regime_justification = self.generate_regime_justification(
-                market_regime, current_weights, final_weights, regime_confidence
-            )
+            if not symbols:
+                return {"error": "No symbols provided"}
+            if mode not in ('return', 'risk'):
+                return {"error": f"Unknown frontier mode: {mode}"}
+            
+            print(f"📈 Calculating {n_points}-point efficient frontier ({mode} targets) for {len(symbols)} assets...")
             
-            # Calculate Sharpe ratio improvement
-            sharpe_improvement = self.calculate_sharpe_improvement(
-                current_weights, final_weights, expected_returns, covariance_matrix
+            expected_returns = self.extract_expected_returns(ml_predictions, symbols)
+            covariance_matrix = self.estimate_covariance_matrix(
+                symbols, ml_predictions, self.collect_price_histories(input_data)
             )
+            mu = np.array([expected_returns[symbol] for symbol in symbols], dtype=float)
             
-            return {
+            cache_key = self.frontier_cache_key(symbols, covariance_matrix, mu, mode, n_points)
+            cached = self.load_frontier(cache_key)
+            if cached is not None:
+                return {**cached, "cache": "hit"}
+            
+            started = time.perf_counter()
+            points, failed_targets = self.trace_efficient_frontier(mu, covariance_matrix, n_points, mode)
+            solve_time_ms = round((time.perf_counter() - started) * 1000, 3)
+            
+            for point in points:
+                point['weights'] = dict(zip(symbols, point['weights'].tolist()))
+            
+            result = {
                 "success": True,
-                "optimal_weights": final_weights,
-                "expected_return": portfolio_metrics['expected_return'],
-                "expected_risk": portfolio_metrics['expected_risk'],
-                "sharpe_ratio": portfolio_metrics['sharpe_ratio'],
-                "sharpe_improvement": sharpe_improvement,
-                "regime_justification": regime_justification,
-                "optimization_method": optimization_results['method'],
-                "allocation_changes": self.calculate_allocation_changes(current_weights, final_weights),
-                "risk_metrics": self.calculate_risk_metrics(final_weights, covariance_matrix),
-                "rebalancing_needed": self.check_rebalancing_needed(current_weights, final_weights),
-                "regime_adjustments": {
-                    "market_regime": market_regime,
-                    "risk_adjustment": adjusted_risk_target,
-                    "regime_confidence": regime_confidence
-                },
+                "mode": mode,
+                "n_points": len(points),
+                "frontier": points,
+                "failed_targets": failed_targets,
+                "min_variance_point": 0,
+                "max_sharpe_point": int(np.argmax([point['sharpe_ratio'] for point in points])),
+                "covariance_model": self.covariance_details,
+                "solve_time_ms": solve_time_ms,
+                "total_iterations": int(sum(point['iterations'] for point in points)),
                 "timestamp": datetime.now().isoformat()
             }
+            self.save_frontier(cache_key, result)
+            return {**result, "cache": "miss"}
             
         except Exception as e:
-            print(f"❌ Error in dynamic allocation: {str(e)}")
-            return self.generate_fallback_allocation(current_weights, market_regime)
+            print(f"❌ Error calculating efficient frontier: {str(e)}")
+            return {"success": False, "error": str(e), "frontier": [], "timestamp": datetime.now().isoformat()}
+
+    def trace_efficient_frontier(self, mu, sigma, n_points, mode='return'):
+        """
+        Sweep the frontier from the minimum-variance to the maximum-return
+        portfolio. Target-return points are budget + return constrained QPs;
+        target-risk points maximize return under a variance cap (SLSQP).
+        Each point starts from the previous converged point's weights; targets
+        where SLSQP fails are left out. Returns (points, failed targets)
+        """
+        n_assets = len(mu)
+        min_weight = self.allocation_constraints['min_weight']
+        max_weight = self.allocation_constraints['max_weight']
+        lower = np.full(n_assets, min_weight)
+        upper = np.full(n_assets, max_weight)
+        
+        min_var_weights, min_var_iterations = self.solve_box_qp(2 * sigma, np.zeros(n_assets), lower, upper)
+        if min_var_weights is None:
+            min_var_weights, min_var_iterations = self.minimum_variance_optimization(sigma), 0
+        
+        max_return_weights = self.max_return_portfolio(mu, lower, upper)
+        
+        if mode == 'return':
+            targets = np.linspace(mu @ min_var_weights, mu @ max_return_weights, n_points)
+        else:
+            targets = np.linspace(np.sqrt(min_var_weights @ sigma @ min_var_weights),
+                                  np.sqrt(max_return_weights @ sigma @ max_return_weights), n_points)
+        
+        points = [self.frontier_point(targets[0], min_var_weights, mu, sigma, 'qp_active_set', min_var_iterations)]
+        previous = min_var_weights
+        failed_targets = []
+        
+        for target in targets[1:-1]:
+            if mode == 'return':
+                weights, iterations = self.solve_box_qp(
+                    2 * sigma, np.zeros(n_assets), lower, upper, A_eq=mu, b_eq=target, w0=previous
+                )
+                solver = 'qp_active_set'
+                if weights is None:
+                    weights, iterations = self.frontier_slsqp(mu, sigma, target, mode, previous)
+                    solver = 'slsqp'
+            else:
+                weights, iterations = self.frontier_slsqp(mu, sigma, target, mode, previous)
+                solver = 'slsqp'
+            
+            if weights is None:
+                failed_targets.append(float(target))
+                continue
+            points.append(self.frontier_point(target, weights, mu, sigma, solver, iterations))
+            previous = weights
+        
+        points.append(self.frontier_point(targets[-1], max_return_weights, mu, sigma, 'closed_form', 0))
+        if failed_targets:
+            print(f"⚠️ SLSQP did not converge for {len(failed_targets)} frontier targets; points skipped")
+        return points, failed_targets
+
+    def max_return_portfolio(self, mu, lower, upper):
+        """Maximum return under box + budget: fill the highest expected returns first"""
+        weights = lower.copy()
+        remaining = 1.0 - lower.sum()
+        for i in np.argsort(-mu):
+            weights[i] += min(upper[i] - lower[i], remaining)
+            remaining -= weights[i] - lower[i]
+            if remaining <= 0:
+                break
+        return weights
+
+    def frontier_slsqp(self, mu, sigma, target, mode, x0):
+        """
+        SLSQP frontier point with analytic gradients, warm-started at x0:
+        min variance at a target return, or max return under a risk cap.
+        Returns (weights, iterations), with weights None when SLSQP fails
+        """
+        n_assets = len(mu)
+        bounds = [(self.allocation_constraints['min_weight'], self.allocation_constraints['max_weight'])] * n_assets
+        constraints = [{'type': 'eq', 'fun': lambda w: np.sum(w) - 1, 'jac': lambda w: np.ones_like(w)}]
+        
+        if mode == 'return':
+            objective = lambda w: np.dot(w, sigma @ w)
+            gradient = lambda w: 2 * (sigma @ w)
+            constraints.append({'type': 'eq', 'fun': lambda w: np.dot(w, mu) - target, 'jac': lambda w: mu})
+        else:
+            objective = lambda w: -np.dot(w, mu)
+            gradient = lambda w: -mu
+            constraints.append({'type': 'ineq', 'fun': lambda w: target ** 2 - np.dot(w, sigma @ w),
+                                'jac': lambda w: -2 * (sigma @ w)})
+        
+        result = minimize(objective, x0, jac=gradient, method='SLSQP', bounds=bounds, constraints=constraints)
+        return (result.x if result.success else None), int(result.nit)
+
+    def frontier_point(self, target, weights, mu, sigma, solver, iterations):
+        expected_return = float(mu @ weights)
+        expected_risk = float(np.sqrt(max(weights @ sigma @ weights, 0.0)))
+        return {
+            'target': float(target),
+            'expected_return': expected_return,
+            'expected_risk': expected_risk,
+            'sharpe_ratio': (expected_return - 0.02) / expected_risk if expected_risk > 0 else 0.0,
+            'weights': weights,
+            'solver': solver,
+            'iterations': int(iterations)
+        }
+
+    def frontier_cache_key(self, symbols, covariance_matrix, mu, mode, n_points):
+        """
+        (universe, covariance version) plus the inputs that change the sweep:
+        expected returns, weight bounds, mode and point count
+        """
+        universe = hashlib.sha1(json.dumps(list(symbols)).encode()).hexdigest()[:12]
+        settings = hashlib.sha1(np.concatenate([
+            mu, [self.allocation_constraints['min_weight'], self.allocation_constraints['max_weight'], n_points]
+        ]).tobytes() + mode.encode()).hexdigest()[:12]
+        return f"{universe}_{covariance_version(covariance_matrix)}_{settings}"
+
+    def load_frontier(self, cache_key):
+        if cache_key in self.frontier_cache:
+            return self.frontier_cache[cache_key]
+        cache_path = self.frontier_params['cache_path']
+        path = os.path.join(cache_path, f"{cache_key}.json") if cache_path else None
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.frontier_cache[cache_key] = json.load(f)
+                return self.frontier_cache[cache_key]
+            except Exception as e:
+                print(f"⚠️ Could not read cached frontier: {str(e)}")
+        return None
+
+    def save_frontier(self, cache_key, result):
+        self.frontier_cache[cache_key] = result
+        cache_path = self.frontier_params['cache_path']
+        if not cache_path:
+            return
+        try:
+            os.makedirs(cache_path, exist_ok=True)
+            path = os.path.join(cache_path, f"{cache_key}.json")
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(result, f)
+            os.replace(f"{path}.tmp", path)
+        except Exception as e:
+            print(f"⚠️ Could not cache frontier: {str(e)}")
 
     def extract_expected_returns(self, ml_predictions, symbols):
         """
@@ -190,16 +632,139 @@ class DynamicAllocationService:
         else:
             return 0.08  # 8% default for equities
 
-    def estimate_covariance_matrix(self, symbols, ml_predictions):
+    def allocate_portfolio(self, symbols, current_weights, expected_returns, covariance_matrix,
+                           market_regime, regime_confidence):
         """
-        Estimate covariance matrix for portfolio optimization
+        Optimize one portfolio given expected returns and a covariance matrix
+        aligned with `symbols`
         """
+        # Apply regime-based risk adjustment
+        adjusted_risk_target = self.calculate_adjusted_risk_target(market_regime, regime_confidence)
+        
+        # Calculate optimal allocation using multiple methods
+        optimization_results = self.optimize_portfolio_allocation(
+            symbols, expected_returns, covariance_matrix, current_weights, adjusted_risk_target,
+            self.methods_for_regime(market_regime)
+        )
+        
+        # Apply regime-specific tilts
+        regime_adjusted_weights = self.apply_regime_tilts(
+            optimization_results['optimal_weights'], market_regime, regime_confidence
+        )
+        
+        # Validate and constrain allocation
+        cost_aware = self.rebalancing_params['mode'] == 'cost_aware'
+        final_weights = self.apply_allocation_constraints(
+            regime_adjusted_weights, current_weights, symbols, enforce_turnover=not cost_aware
+        )
+        
+        # Trade toward the constrained target net of transaction costs and within the turnover budget
+        rebalancing_optimization = None
+        if cost_aware:
+            rebalanced_weights, rebalancing_optimization = self.cost_aware_rebalance(
+                final_weights, current_weights, covariance_matrix, symbols
+            )
+            if rebalanced_weights is not None:
+                final_weights = rebalanced_weights
+            else:
+                final_weights = self.apply_allocation_constraints(regime_adjusted_weights, current_weights, symbols)
+        
+        # Calculate expected portfolio metrics
+        portfolio_metrics = self.calculate_portfolio_metrics(
+            final_weights, expected_returns, covariance_matrix
+        )
+        
+        # Generate regime justification
+        regime_justification = self.generate_regime_justification(
+            market_regime, current_weights, final_weights, regime_confidence
+        )
+        
+        # Calculate Sharpe ratio improvement
+        sharpe_improvement = self.calculate_sharpe_improvement(
+            current_weights, final_weights, expected_returns, covariance_matrix
+        )
+        
+        return {
+            "success": True,
+            "optimal_weights": final_weights,
+            "expected_return": portfolio_metrics['expected_return'],
+            "expected_risk": portfolio_metrics['expected_risk'],
+            "sharpe_ratio": portfolio_metrics['sharpe_ratio'],
+            "sharpe_improvement": sharpe_improvement,
+            "regime_justification": regime_justification,
+            "optimization_method": optimization_results['method'],
+            "individual_methods": optimization_results.get('individual_methods', {}),
+            "covariance_model": self.covariance_details,
+            "allocation_changes": self.calculate_allocation_changes(current_weights, final_weights),
+            "risk_metrics": self.calculate_risk_metrics(final_weights, covariance_matrix),
+            "rebalancing_needed": self.check_rebalancing_needed(current_weights, final_weights),
+            "rebalancing_optimization": rebalancing_optimization,
+            "regime_adjustments": {
+                "market_regime": market_regime,
+                "risk_adjustment": adjusted_risk_target,
+                "regime_confidence": regime_confidence
+            },
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def select_allocation_methods(self, input_data):
+        """
+        Methods to run, by name ('allocation_methods': list or single name), and
+        an optional solve-time budget ('time_budget_ms')
+        """
+        methods = input_data.get('allocation_methods')
+        if isinstance(methods, str):
+            methods = [methods]
+        if methods:
+            unknown = [name for name in methods if name not in self.ensemble_method_weights]
+            if unknown:
+                print(f"⚠️ Ignoring unknown allocation methods: {', '.join(unknown)}")
+            self.allocation_methods = [name for name in methods if name in self.ensemble_method_weights] or list(self.default_allocation_methods)
+        if 'time_budget_ms' in input_data:
+            self.optimizer_params['time_budget_ms'] = float(input_data['time_budget_ms'])
+
+    def methods_for_regime(self, market_regime):
+        """Selected methods, plus CVaR in stressed regimes when none were chosen explicitly"""
+        if self.allocation_methods == self.default_allocation_methods and market_regime in self.cvar_params['regimes']:
+            return self.allocation_methods + ['cvar']
+        return self.allocation_methods
+
+    def collect_price_histories(self, input_data):
+        """
+        Price histories keyed by symbol, from `price_history` or from the
+        `price_history` of each holding in portfolio_data
+        """
+        price_histories = dict(input_data.get('price_history', {}) or {})
+        for holding in input_data.get('portfolio_data', {}).get('holdings', []) or []:
+            symbol = holding.get('symbol')
+            if symbol and symbol not in price_histories and holding.get('price_history'):
+                price_histories[symbol] = holding['price_history']
+        return price_histories
+
+    def estimate_covariance_matrix(self, symbols, ml_predictions, price_histories=None):
+        """
+        Estimate covariance matrix for portfolio optimization: from aligned
+        return histories when every symbol has one, else from asset-class heuristics
+        """
+        if price_histories and all(symbol in price_histories for symbol in symbols):
+            try:
+                covariance_matrix, details = self.risk_model.get_covariance(
+                    symbols, price_histories,
+                    window=int(self.covariance_params['window']),
+                    method=self.covariance_params['method'],
+                    ewma_lambda=self.covariance_params['ewma_lambda']
+                )
+                if covariance_matrix is not None:
+                    self.covariance_details = details
+                    return covariance_matrix
+                print(f"⚠️ Only {details['observations']} aligned returns, using heuristic covariance")
+            except Exception as e:
+                print(f"⚠️ Error estimating covariance from returns: {str(e)}")
+        
+        self.covariance_details = {'method': 'heuristic', 'source': 'asset_class'}
         try:
             n_assets = len(symbols)
             
-            # In production, this would use historical price data
-            # For now, create a realistic covariance matrix based on asset correlations
-            
             # Default volatilities by asset type
             volatilities = {}
             for symbol in symbols:
@@ -212,26 +777,15 @@ class DynamicAllocationService:
                 else:
                     volatilities[symbol] = 0.18  # 18% default volatility
             
-            # Create correlation matrix with realistic correlations
-            correlation_matrix = np.eye(n_assets)
-            
-            for i in range(n_assets):
-                for j in range(i + 1, n_assets):
-                    symbol_i, symbol_j = symbols[i], symbols[j]
-                    
-                    # Estimate correlation based on asset classes
-                    correlation = self.estimate_asset_correlation(symbol_i, symbol_j)
-                    correlation_matrix[i, j] = correlation
-                    correlation_matrix[j, i] = correlation
+            # Create correlation matrix from the class-by-class correlation table
+            correlation_matrix = self.build_class_correlation_matrix(symbols)
             
             # Convert to covariance matrix
             vol_vector = np.array([volatilities[symbol] for symbol in symbols])
             covariance_matrix = np.outer(vol_vector, vol_vector) * correlation_matrix
             
-            # Ensure positive semi-definite
-            eigenvalues, eigenvectors = np.linalg.eigh(covariance_matrix)
-            eigenvalues = np.maximum(eigenvalues, 1e-8)  # Floor eigenvalues
-            covariance_matrix = eigenvectors @ np.diag(eigenvalues) @ eigenvectors.T
+            # Ensure positive definite
+            covariance_matrix, _ = positive_definite_cholesky(covariance_matrix)
             
             return covariance_matrix
             
@@ -241,48 +795,67 @@ class DynamicAllocationService:
             n_assets = len(symbols)
             return np.eye(n_assets) * 0.18**2  # 18% volatility for all assets
 
-    def estimate_asset_correlation(self, symbol1, symbol2):
+    def asset_class_code(self, symbol):
         """
-        Estimate correlation between two assets based on their characteristics
+        Asset-class code for one symbol: bit k is set when the symbol contains a
+        ticker of the k-th class list. Classified once per symbol.
         """
-        # Asset class mappings
-        equity_symbols = ['SPY', 'QQQ', 'IWM', 'VTI', 'AAPL', 'MSFT', 'GOOGL']
-        bond_symbols = ['TLT', 'BND', 'AGG', 'IEF', 'SHY']
-        commodity_symbols = ['GLD', 'SLV', 'USO', 'DBC']
-        international_symbols = ['EFA', 'EEM', 'VEA', 'VWO']
-        
-        # Check asset classes
-        s1_equity = any(eq in symbol1.upper() for eq in equity_symbols)
-        s2_equity = any(eq in symbol2.upper() for eq in equity_symbols)
-        
-        s1_bond = any(bond in symbol1.upper() for bond in bond_symbols)
-        s2_bond = any(bond in symbol2.upper() for bond in bond_symbols)
-        
-        s1_commodity = any(comm in symbol1.upper() for comm in commodity_symbols)
-        s2_commodity = any(comm in symbol2.upper() for comm in commodity_symbols)
-        
-        s1_intl = any(intl in symbol1.upper() for intl in international_symbols)
-        s2_intl = any(intl in symbol2.upper() for intl in international_symbols)
+        key = symbol.upper()
+        code = self.asset_class_lookup.get(key)
+        if code is None:
+            code = sum(
+                1 << bit for bit, class_name in enumerate(self.asset_class_flags)
+                if any(ticker in key for ticker in self.asset_class_symbols[class_name])
+            )
+            self.asset_class_lookup[key] = code
+        return code
+
+    def class_pair_correlation(self, code1, code2):
+        """Heuristic correlation between two asset-class codes (flag bit masks)"""
+        flags1 = {name for bit, name in enumerate(self.asset_class_flags) if code1 & (1 << bit)}
+        flags2 = {name for bit, name in enumerate(self.asset_class_flags) if code2 & (1 << bit)}
+        both = lambda name: name in flags1 and name in flags2
+        across = lambda a, b: (a in flags1 and b in flags2) or (b in flags1 and a in flags2)
         
         # Correlation rules
-        if s1_equity and s2_equity:
-            if s1_intl or s2_intl:
+        if both('equity'):
+            if 'intl' in flags1 or 'intl' in flags2:
                 return 0.7  # US-International equity correlation
             else:
                 return 0.85  # US equity correlation
-        elif s1_bond and s2_bond:
+        elif both('bond'):
             return 0.8  # Bond correlation
-        elif s1_commodity and s2_commodity:
+        elif both('commodity'):
             return 0.6  # Commodity correlation
-        elif (s1_equity and s2_bond) or (s1_bond and s2_equity):
+        elif across('equity', 'bond'):
             return -0.2  # Stock-bond negative correlation
-        elif (s1_equity and s2_commodity) or (s1_commodity and s2_equity):
+        elif across('equity', 'commodity'):
             return 0.3  # Stock-commodity correlation
-        elif (s1_bond and s2_commodity) or (s1_commodity and s2_bond):
+        elif across('bond', 'commodity'):
             return 0.1  # Bond-commodity correlation
         else:
             return 0.5  # Default moderate correlation
 
+    def classify_asset_classes(self, symbols):
+        """Asset-class code array for a list of symbols"""
+        return np.array([self.asset_class_code(symbol) for symbol in symbols], dtype=np.intp)
+
+    def build_class_correlation_matrix(self, symbols):
+        """
+        Correlation matrix by fancy-indexing the class-by-class table with the
+        symbols' class codes; O(n) classification plus one O(n^2) gather
+        """
+        codes = self.classify_asset_classes(symbols)
+        correlation_matrix = self.asset_class_correlations[np.ix_(codes, codes)]
+        np.fill_diagonal(correlation_matrix, 1.0)
+        return correlation_matrix
+
+    def estimate_asset_correlation(self, symbol1, symbol2):
+        """
+        Estimate correlation between two assets based on their asset classes
+        """
+        return float(self.asset_class_correlations[self.asset_class_code(symbol1), self.asset_class_code(symbol2)])
+
     def calculate_adjusted_risk_target(self, market_regime, regime_confidence):
         """
         Calculate risk target adjusted for market regime
@@ -306,7 +879,8 @@ class DynamicAllocationService:
             print(f"⚠️ Error calculating adjusted risk target: {str(e)}")
             return self.risk_params['target_volatility']
 
-    def optimize_portfolio_allocation(self, symbols, expected_returns, covariance_matrix, current_weights, risk_target):
+    def optimize_portfolio_allocation(self, symbols, expected_returns, covariance_matrix, current_weights, risk_target,
+                                      allocation_methods=None):
         """
         Optimize portfolio allocation using multiple methods
         """
@@ -318,31 +892,55 @@ class DynamicAllocationService:
             sigma = covariance_matrix
             current_w = np.array([current_weights.get(symbol, 0) for symbol in symbols])
             
-            # Method 1: Mean-Variance Optimization (Markowitz)
-            mv_weights = self.mean_variance_optimization(mu, sigma, risk_target)
-            
-            # Method 2: Risk Parity
-            rp_weights = self.risk_parity_optimization(sigma)
+            self.solver_diagnostics = {}
             
-            # Method 3: Black-Litterman (simplified)
-            bl_weights = self.black_litterman_optimization(mu, sigma, current_w)
+            risk_budgets = None
+            if self.risk_budgets:
+                risk_budgets = np.array([self.risk_budgets.get(symbol, 1.0 / n_assets) for symbol in symbols])
+            P, Q, view_confidences = self.build_view_matrices(symbols, self.black_litterman_views)
             
-            # Method 4: Minimum Variance
-            min_var_weights = self.minimum_variance_optimization(sigma)
+            methods = {
+                'mean_variance': lambda: self.mean_variance_optimization(mu, sigma, risk_target),
+                'risk_parity': lambda: self.risk_parity_optimization(sigma, risk_budgets),
+                'black_litterman': lambda: self.black_litterman_optimization(mu, sigma, current_w, P, Q, view_confidences),
+                'minimum_variance': lambda: self.minimum_variance_optimization(sigma),
+                'hrp': lambda: self.hrp_optimization(sigma),
+                'cvar': lambda: self.cvar_optimization(symbols, mu, sigma)
+            }
+            selected = [name for name in (allocation_methods or self.allocation_methods) if name in methods]
+            selected = selected or list(self.default_allocation_methods)
+            
+            # Iterative solvers give way to HRP once the solve-time budget is spent
+            started = time.perf_counter()
+            budget_ms = self.optimizer_params['time_budget_ms']
+            method_weights = {}
+            hrp_weights = None
+            for name in selected:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                if name in self.iterative_methods and budget_ms and elapsed_ms > budget_ms:
+                    if hrp_weights is None:
+                        hrp_weights = self.timed_method('hrp', methods['hrp'])
+                    method_weights[name] = hrp_weights
+                    self.solver_diagnostics[name] = {
+                        'solver': 'hrp', 'replaced_by': 'hrp', 'reason': 'time_budget_exceeded', 'solve_time_ms': 0.0
+                    }
+                    continue
+                method_weights[name] = self.timed_method(name, methods[name])
+                if name == 'hrp':
+                    hrp_weights = method_weights[name]
             
             # Ensemble the methods based on market conditions
-            ensemble_weights = self.ensemble_optimization_methods(
-                mv_weights, rp_weights, bl_weights, min_var_weights, symbols
-            )
+            ensemble_weights = self.ensemble_optimization_methods(method_weights, symbols)
             
             return {
                 'optimal_weights': dict(zip(symbols, ensemble_weights)),
-                'method': 'ensemble',
+                'method': 'ensemble' if len(method_weights) > 1 else selected[0],
                 'individual_methods': {
-                    'mean_variance': dict(zip(symbols, mv_weights)),
-                    'risk_parity': dict(zip(symbols, rp_weights)),
-                    'black_litterman': dict(zip(symbols, bl_weights)),
-                    'minimum_variance': dict(zip(symbols, min_var_weights))
+                    name: {
+                        'weights': dict(zip(symbols, weights)),
+                        **self.solver_diagnostics.get(name, {})
+                    }
+                    for name, weights in method_weights.items()
                 }
             }
             
@@ -355,37 +953,199 @@ class DynamicAllocationService:
                 'method': 'equal_weight_fallback'
             }
 
-    def mean_variance_optimization(self, mu, sigma, risk_target):
+    def timed_method(self, name, method, *args):
+        """
+        Run one optimization method and record its solve time (ms) under solver_diagnostics
+        """
+        started = time.perf_counter()
+        weights = method(*args)
+        diagnostics = self.solver_diagnostics.setdefault(name, {})
+        diagnostics['solve_time_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        diagnostics.setdefault('solver', 'closed_form')
+        return weights
+
+    def record_solver(self, name, solver, **details):
+        """Record which solver produced a method's weights"""
+        self.solver_diagnostics.setdefault(name, {}).update({'solver': solver, **details})
+
+    def solve_box_qp(self, Q, c, lower, upper, A_eq=None, b_eq=None, w0=None, budget=True):
         """
-        Markowitz mean-variance optimization
+        Solve min 0.5 w'Qw - c'w  s.t. sum(w) = 1, A_eq w = b_eq, lower <= w <= upper
+        (the sum(w) = 1 row is dropped with budget=False) with a primal active-set method. The working set holds the assets pinned
+        at a bound; each iteration solves the equality-constrained KKT system on
+        the free assets, steps until a bound blocks, and releases the bound with
+        the worst multiplier once the step vanishes.
+        `w0` warm-starts from a nearby solution: its bound-active assets seed the
+        working set, and any equality residual it leaves is closed by the steps.
+        Returns (weights, iterations) or (None, iterations) if it did not converge.
+        """
+        n = len(c)
+        lower = np.broadcast_to(np.asarray(lower, dtype=float), (n,))
+        upper = np.broadcast_to(np.asarray(upper, dtype=float), (n,))
+        if budget and (lower.sum() > 1 + 1e-12 or upper.sum() < 1 - 1e-12):
+            return None, 0  # Infeasible bounds
+        
+        A = np.ones((1, n)) if budget else np.empty((0, n))
+        b = np.ones(1) if budget else np.empty(0)
+        if A_eq is not None:
+            A = np.vstack([A, np.atleast_2d(A_eq)])
+            b = np.concatenate([b, np.atleast_1d(np.asarray(b_eq, dtype=float))])
+        m = len(b)
+        
+        tol = self.optimizer_params['qp_tolerance']
+        at_lower = np.zeros(n, dtype=bool)
+        at_upper = np.zeros(n, dtype=bool)
+        
+        if w0 is not None:
+            w = np.clip(np.asarray(w0, dtype=float), lower, upper)
+            at_lower = w <= lower + 1e-9
+            at_upper = (w >= upper - 1e-9) & ~at_lower
+            w = np.where(at_lower, lower, np.where(at_upper, upper, w))
+        elif not budget:
+            w = np.clip(np.zeros(n), lower, upper)  # Equality residual is closed by the steps
+        else:
+            # Budget-feasible start: equal weights clipped to the box, residual spread over the headroom
+            w = np.clip(np.ones(n) / n, lower, upper)
+            residual = 1.0 - w.sum()
+            if residual > 0:
+                w += (upper - w) * residual / (upper - w).sum()
+            elif residual < 0:
+                w += (w - lower) * residual / (w - lower).sum()
+        
+        for iteration in range(1, self.optimizer_params['qp_max_iterations'] + 1):
+            gradient = Q @ w - c
+            residual = b - A @ w
+            free = ~(at_lower | at_upper)
+            n_free = int(free.sum())
+            
+            step = np.zeros(n)
+            if n_free > 0:
+                # [Q_FF A_F'; A_F 0] [p_F; nu] = [-g_F; b - Aw]
+                kkt = np.zeros((n_free + m, n_free + m))
+                kkt[:n_free, :n_free] = Q[np.ix_(free, free)]
+                kkt[:n_free, n_free:] = A[:, free].T
+                kkt[n_free:, :n_free] = A[:, free]
+                rhs = np.concatenate([-gradient[free], residual])
+                try:
+                    solution = np.linalg.solve(kkt, rhs)
+                except np.linalg.LinAlgError:
+                    solution = np.linalg.lstsq(kkt, rhs, rcond=None)[0]
+                step[free] = solution[:n_free]
+            
+            if np.max(np.abs(step)) <= tol:
+                residual = b - A @ w
+                if np.max(np.abs(residual)) > 1e-9:
+                    # The free assets cannot close the equality residual: release
+                    # the bound whose move into the box reduces it the most
+                    direction = np.where(at_lower, 1.0, np.where(at_upper, -1.0, 0.0))
+                    gain = (residual @ A) * direction
+                    release = int(np.argmax(gain))
+                    if gain[release] <= 0:
+                        return None, iteration
+                    at_lower[release] = at_upper[release] = False
+                    continue
+                
+                # Stationary on the working set: check bound multipliers
+                if n_free > 0:
+                    nu = np.linalg.lstsq(A[:, free].T, -gradient[free], rcond=None)[0]
+                elif m == 1:
+                    # Interval of nu keeping every multiplier g_i + a_i nu on the right side
+                    a = A[0]
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        bound = -gradient / a
+                    lower_side = (at_lower & (a > 0)) | (at_upper & (a < 0))
+                    upper_side = (at_lower & (a < 0)) | (at_upper & (a > 0))
+                    nu_low = np.max(bound[lower_side]) if lower_side.any() else -np.inf
+                    nu_high = np.min(bound[upper_side]) if upper_side.any() else np.inf
+                    nu = np.array([np.clip(0.0, nu_low, nu_high) if nu_low <= nu_high else 0.5 * (nu_low + nu_high)])
+                else:
+                    nu = np.zeros(m)
+                multipliers = gradient + A.T @ nu  # >= 0 at lower bounds, <= 0 at upper bounds
+                violation = np.where(at_lower, -multipliers, 0.0) + np.where(at_upper, multipliers, 0.0)
+                worst = int(np.argmax(violation))
+                if violation[worst] <= 1e-9 * max(1.0, np.max(np.abs(gradient))):
+                    return np.clip(w, lower, upper), iteration
+                at_lower[worst] = at_upper[worst] = False
+                continue
+            
+            # Ratio test against the bounds of the free assets
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratios = np.where(step < -tol, (lower - w) / step,
+                                  np.where(step > tol, (upper - w) / step, np.inf))
+            blocking = int(np.argmin(ratios))
+            alpha = min(1.0, max(ratios[blocking], 0.0))
+            w = w + alpha * step
+            if alpha < 1.0:
+                if step[blocking] < 0:
+                    at_lower[blocking] = True
+                    w[blocking] = lower[blocking]
+                else:
+                    at_upper[blocking] = True
+                    w[blocking] = upper[blocking]
+        
+        return None, self.optimizer_params['qp_max_iterations']
+
+    def mean_variance_optimization(self, mu, sigma, risk_target=None):
+        """
+        Markowitz mean-variance optimization of the quadratic utility
+        mu'w - (risk_aversion / 2) w'Sigma w, solved as a QP. With a risk target
+        the risk aversion is tuned until the portfolio risk meets the target
+        (the maximum-return portfolio at that risk). SLSQP on return minus a
+        risk-target penalty, with analytic gradient, is the fallback.
         """
         try:
             n_assets = len(mu)
-            
-            # Objective: maximize return for given risk target
-            def objective(weights):
-                portfolio_return = np.dot(weights, mu)
-                portfolio_risk = np.sqrt(np.dot(weights, np.dot(sigma, weights)))
-                
-                # Penalty for deviating from risk target
-                risk_penalty = 100 * (portfolio_risk - risk_target)**2
+            min_weight = self.allocation_constraints['min_weight']
+            max_weight = self.allocation_constraints['max_weight']
+            
+            if risk_target is not None:
+                weights, iterations, risk_aversion = self.target_risk_qp(mu, sigma, risk_target, min_weight, max_weight)
+                if weights is not None:
+                    self.record_solver('mean_variance', 'qp_active_set', iterations=iterations,
+                                       risk_aversion=risk_aversion)
+                    return weights
+            else:
+                risk_aversion = self.optimizer_params['risk_aversion']
+                weights, iterations = self.solve_box_qp(risk_aversion * sigma, mu, min_weight, max_weight)
+                if weights is not None:
+                    self.record_solver('mean_variance', 'qp_active_set', iterations=iterations)
+                    return weights
+            
+            if risk_target is None:
+                objective = lambda w: -np.dot(w, mu) + 0.5 * risk_aversion * np.dot(w, sigma @ w)
+                gradient = lambda w: -mu + risk_aversion * (sigma @ w)
+            else:
+                # Objective: maximize return for given risk target
+                def objective(weights):
+                    portfolio_return = np.dot(weights, mu)
+                    portfolio_risk = np.sqrt(np.dot(weights, np.dot(sigma, weights)))
+                    
+                    # Penalty for deviating from risk target
+                    risk_penalty = 100 * (portfolio_risk - risk_target)**2
+                    
+                    return -portfolio_return + risk_penalty
                 
-                return -portfolio_return + risk_penalty
+                def gradient(weights):
+                    sigma_w = sigma @ weights
+                    portfolio_risk = np.sqrt(np.dot(weights, sigma_w))
+                    if portfolio_risk <= 0:
+                        return -mu
+                    return -mu + 200 * (portfolio_risk - risk_target) * sigma_w / portfolio_risk
             
             # Constraints
             constraints = [
-                {'type': 'eq', 'fun': lambda w: np.sum(w) - 1},  # Weights sum to 1
+                {'type': 'eq', 'fun': lambda w: np.sum(w) - 1, 'jac': lambda w: np.ones_like(w)},  # Weights sum to 1
             ]
             
             # Bounds
-            bounds = [(self.allocation_constraints['min_weight'], 
-                      self.allocation_constraints['max_weight']) for _ in range(n_assets)]
+            bounds = [(min_weight, max_weight) for _ in range(n_assets)]
             
             # Initial guess (equal weights)
             x0 = np.ones(n_assets) / n_assets
             
             # Optimize
-            result = minimize(objective, x0, method='SLSQP', bounds=bounds, constraints=constraints)
+            result = minimize(objective, x0, jac=gradient, method='SLSQP', bounds=bounds, constraints=constraints)
+            self.record_solver('mean_variance', 'slsqp', iterations=int(result.nit))
             
             if result.success:
                 return result.x
@@ -397,73 +1157,167 @@ class DynamicAllocationService:
             print(f"⚠️ Error in mean-variance optimization: {str(e)}")
             return np.ones(len(mu)) / len(mu)
 
-    def risk_parity_optimization(self, sigma):
+    def target_risk_qp(self, mu, sigma, risk_target, min_weight, max_weight):
         """
-        Risk parity optimization (equal risk contribution)
+        Quadratic-utility QP with the risk aversion found by bisection (in log
+        space) so that the portfolio volatility equals risk_target; portfolio
+        risk falls as risk aversion grows. Each solve warm-starts from the last.
+        Targets below the minimum-variance risk give the minimum-variance
+        portfolio, targets above the maximum-return risk the maximum-return one.
+        Returns (weights, total iterations, risk aversion); weights are None if a
+        QP did not converge, the risk aversion is None at the minimum-variance end.
+        """
+        n_assets = len(mu)
+        lower = np.full(n_assets, min_weight)
+        upper = np.full(n_assets, max_weight)
+        risk = lambda w: float(np.sqrt(max(w @ sigma @ w, 0.0)))
+        
+        min_var_weights, total = self.solve_box_qp(2 * sigma, np.zeros(n_assets), lower, upper)
+        if min_var_weights is None:
+            return None, total, None
+        if risk(min_var_weights) >= risk_target:
+            return min_var_weights, total, None
+        max_return_weights = self.max_return_portfolio(mu, lower, upper)
+        if risk(max_return_weights) <= risk_target:
+            return max_return_weights, total, 0.0
+        
+        # Bisect log risk aversion: risk(low) > target >= risk(high), keeping the
+        # last solution on the target side of the bracket
+        high = np.log(self.optimizer_params['target_risk_max_aversion'])
+        low = -high
+        best = previous = min_var_weights
+        for _ in range(self.optimizer_params['target_risk_bisections']):
+            middle = 0.5 * (low + high)
+            weights, iterations = self.solve_box_qp(np.exp(middle) * sigma, mu, lower, upper, w0=previous)
+            total += iterations
+            if weights is None:
+                return None, total, None
+            previous = weights
+            if risk(weights) > risk_target:
+                low = middle
+            else:
+                high, best = middle, weights
+                if risk_target - risk(weights) <= self.optimizer_params['target_risk_tolerance']:
+                    break
+        
+        return best, total, round(float(np.exp(high)), 6)
+
+    def risk_parity_optimization(self, sigma, risk_budgets=None):
+        """
+        Equal (or budgeted) risk contribution portfolio. Newton's method on the
+        strictly convex log-barrier form
+            min 0.5 y'Sigma y - sum(b_i log y_i),  y > 0,  w = y / sum(y)
+        whose optimum has w_i (Sigma w)_i proportional to b_i. Each step is one
+        Cholesky solve, so it scales to large universes where SLSQP stalls.
+        Weights above max_weight are capped afterwards, which gives up exact
+        parity when the cap binds (see bounds_binding); the result then only
+        counts as converged while its dispersion stays within erc_max_dispersion.
         """
         try:
             n_assets = sigma.shape[0]
-            
-            def risk_budget_objective(weights):
-                portfolio_vol = np.sqrt(np.dot(weights, np.dot(sigma, weights)))
-                marginal_contrib = np.dot(sigma, weights) / portfolio_vol
-                contrib = weights * marginal_contrib
+            budgets = np.ones(n_assets) if risk_budgets is None else np.maximum(np.asarray(risk_budgets, dtype=float), 1e-12)
+            budgets = budgets / budgets.sum()
+            tol = self.optimizer_params['erc_tolerance']
+            
+            objective = lambda y: 0.5 * y @ sigma @ y - budgets @ np.log(y)
+            y = budgets / np.sqrt(np.diag(sigma))
+            y *= np.sqrt(1.0 / (y @ sigma @ y))  # Start on the right scale: y'Sigma y = sum(b) = 1
+            value = objective(y)
+            converged = False
+            
+            for iteration in range(1, self.optimizer_params['erc_max_iterations'] + 1):
+                gradient = sigma @ y - budgets / y
+                hessian = sigma + np.diag(budgets / y ** 2)
+                step = -cho_solve(cho_factor(hessian), gradient)
+                decrement = -gradient @ step
+                if decrement / 2 <= tol:
+                    converged = True
+                    break
                 
-                # Risk parity: each asset should contribute equally to total risk
-                target_contrib = portfolio_vol / n_assets
-                return np.sum((contrib - target_contrib) ** 2)
-            
-            # Constraints
-            constraints = [{'type': 'eq', 'fun': lambda w: np.sum(w) - 1}]
-            
-            # Bounds
-            bounds = [(0.01, self.allocation_constraints['max_weight']) for _ in range(n_assets)]
-            
-            # Initial guess
-            x0 = np.ones(n_assets) / n_assets
-            
-            # Optimize
-            result = minimize(risk_budget_objective, x0, method='SLSQP', bounds=bounds, constraints=constraints)
+                # Backtracking line search that keeps y strictly positive
+                shrinking = step < 0
+                t = min(1.0, 0.99 * np.min(-y[shrinking] / step[shrinking])) if shrinking.any() else 1.0
+                while t > 1e-12:
+                    candidate = y + t * step
+                    candidate_value = objective(candidate)
+                    if candidate_value <= value - 0.25 * t * decrement:
+                        break
+                    t *= 0.5
+                if t <= 1e-12:
+                    break  # Line search stalled; keep the current iterate
+                y, value = candidate, candidate_value
+            
+            # Hold the ERC solution to the max_weight cap (the barrier keeps every
+            # weight positive), so the reported dispersion is that of the
+            # weights actually returned
+            unconstrained_weights = y / y.sum()
+            weights = capped_weights(
+                unconstrained_weights, 0.0, max(self.allocation_constraints['max_weight'], 1.0 / n_assets)
+            )
+            dispersion = contribution_dispersion(weights, sigma, budgets)
+            bounds_binding = bool(np.any(np.abs(weights - unconstrained_weights) > 1e-12))
+            if bounds_binding and dispersion > self.optimizer_params['erc_max_dispersion'] * budgets.min():
+                converged = False
+            self.record_solver('risk_parity', 'newton_log_barrier', iterations=iteration, converged=converged,
+                               contribution_dispersion=dispersion,
+                               unconstrained_dispersion=contribution_dispersion(unconstrained_weights, sigma, budgets),
+                               bounds_binding=bounds_binding)
+            
+            if not converged and bounds_binding:
+                print(f"⚠️ Risk parity capped at max_weight misses its budgets (dispersion {dispersion:.2e})")
+            elif not converged:
+                print(f"⚠️ Risk parity did not converge in {iteration} iterations (dispersion {dispersion:.2e})")
             
-            if result.success:
-                return result.x
-            else:
-                return np.ones(n_assets) / n_assets
+            return weights
                 
         except Exception as e:
             print(f"⚠️ Error in risk parity optimization: {str(e)}")
             return np.ones(sigma.shape[0]) / sigma.shape[0]
 
-    def black_litterman_optimization(self, mu, sigma, current_weights):
+    def black_litterman_optimization(self, mu, sigma, current_weights, P=None, Q=None, confidences=None):
         """
-        Simplified Black-Litterman optimization
+        Black-Litterman with explicit views: pick matrix P (k x n), view returns Q
+        and per-view confidences in (0, 1]. Without views the ML expected returns
+        are absolute views at the default confidence. Uses the view-space form
+            mu_BL = pi + tau Sigma P' (P tau Sigma P' + Omega)^-1 (Q - P pi)
+        so only a k x k system is factorized, then solves (delta Sigma) w = mu_BL
+        with a Cholesky factor of Sigma cached per covariance version.
         """
         try:
             n_assets = len(mu)
-            
-            # Risk aversion parameter
-            risk_aversion = 3.0
-            
-            # Market implied returns (simplified)
-            market_returns = risk_aversion * np.dot(sigma, current_weights)
-            
-            # Views and confidence (simplified - use ML predictions as views)
-            tau = 0.025  # Scaling factor
-            omega = tau * sigma  # Uncertainty in views
-            
-            # Black-Litterman formula (simplified)
-            bl_precision = np.linalg.inv(tau * sigma)
-            view_precision = np.linalg.inv(omega)
-            
-            bl_mu = np.linalg.inv(bl_precision + view_precision) @ (
-                bl_precision @ market_returns + view_precision @ mu
-            )
+            risk_aversion = self.optimizer_params['risk_aversion']
+            tau = self.optimizer_params['bl_tau']
+            
+            # Market implied returns from the current (long-only) weights
+            market_weights = np.maximum(np.asarray(current_weights, dtype=float), 0)
+            market_weights = market_weights / market_weights.sum() if market_weights.sum() > 0 else np.ones(n_assets) / n_assets
+            implied_returns = risk_aversion * (sigma @ market_weights)
+            
+            if P is None:
+                P, Q = np.eye(n_assets), np.asarray(mu, dtype=float)
+            P = np.atleast_2d(np.asarray(P, dtype=float))
+            Q = np.atleast_1d(np.asarray(Q, dtype=float))
+            if confidences is None:
+                confidences = np.full(len(Q), self.optimizer_params['bl_default_confidence'])
+            confidences = np.clip(np.asarray(confidences, dtype=float), 1e-6, 1.0)
+            
+            # View uncertainty: Omega_kk = tau p_k Sigma p_k' (1 - c_k) / c_k
+            scaled_sigma_p = tau * (sigma @ P.T)
+            view_variance = np.einsum('kn,nk->k', P, scaled_sigma_p)
+            omega = view_variance * (1 - confidences) / confidences
+            
+            view_factor = cho_factor(P @ scaled_sigma_p + np.diag(omega))
+            bl_mu = implied_returns + scaled_sigma_p @ cho_solve(view_factor, Q - P @ implied_returns)
             
             # Optimize with adjusted returns
-            bl_weights = np.linalg.inv(risk_aversion * sigma) @ bl_mu
+            sigma_factor, factorization = self.covariance_factor(sigma)
+            bl_weights = cho_solve(sigma_factor, bl_mu) / risk_aversion
+            self.record_solver('black_litterman', 'cholesky', views=int(len(Q)), factorization=factorization)
             
             # Normalize weights
             bl_weights = np.maximum(bl_weights, 0)  # No short selling
+            if bl_weights.sum() <= 0:
+                return market_weights
             bl_weights = bl_weights / np.sum(bl_weights)
             
             return bl_weights
@@ -472,29 +1326,139 @@ class DynamicAllocationService:
             print(f"⚠️ Error in Black-Litterman optimization: {str(e)}")
             return current_weights
 
+    def covariance_factor(self, sigma):
+        """
+        Cholesky factor of a covariance matrix, cached per covariance version.
+        Returns (cho_factor result, 'cached' | 'computed' | 'shared'), where
+        'shared' factors were derived from a batch's union factor
+        """
+        version = covariance_version(sigma)
+        if version in self.factor_cache:
+            factor, source = self.factor_cache[version]
+            return factor, source or 'cached'
+        
+        factor = cho_factor(sigma)
+        self.cache_covariance_factor(version, factor)
+        return factor, 'computed'
+
+    def cache_covariance_factor(self, version, factor, source=None):
+        """Keep a factor for a covariance version (at most 16, oldest dropped)"""
+        if len(self.factor_cache) >= 16:
+            self.factor_cache.pop(next(iter(self.factor_cache)))
+        self.factor_cache[version] = (factor, source)
+
+    def build_view_matrices(self, symbols, views):
+        """
+        Pick matrix, view returns and confidences from view dicts:
+          {'assets': {'QQQ': 1, 'SPY': -1}, 'return': 0.02, 'confidence': 0.6}  (relative)
+          {'asset': 'TLT', 'return': 0.04, 'confidence': 0.8}                     (absolute)
+        Views on symbols outside `symbols` are skipped. Returns (None, None, None) without views.
+        """
+        position = {symbol: i for i, symbol in enumerate(symbols)}
+        rows, returns, confidences = [], [], []
+        
+        for view in views or []:
+            assets = view.get('assets') or ({view['asset']: 1.0} if view.get('asset') else {})
+            if not assets or any(symbol not in position for symbol in assets):
+                continue
+            row = np.zeros(len(symbols))
+            for symbol, pick in assets.items():
+                row[position[symbol]] = float(pick)
+            rows.append(row)
+            returns.append(float(view.get('return', 0.0)))
+            confidences.append(float(view.get('confidence', self.optimizer_params['bl_default_confidence'])))
+        
+        if not rows:
+            return None, None, None
+        return np.array(rows), np.array(returns), np.array(confidences)
+
+    def hrp_optimization(self, sigma):
+        """
+        Hierarchical risk parity: single-linkage clustering on the correlation
+        distance sqrt((1 - rho) / 2), quasi-diagonal ordering from the dendrogram
+        leaves, then recursive bisection that splits weight between the two
+        halves in inverse proportion to their inverse-variance cluster variances.
+        No matrix inversion or iterative optimizer.
+        """
+        try:
+            n_assets = sigma.shape[0]
+            if n_assets == 1:
+                return np.ones(1)
+            
+            # Correlation distance and clustering
+            volatilities = np.sqrt(np.diag(sigma))
+            correlation = np.clip(sigma / np.outer(volatilities, volatilities), -1.0, 1.0)
+            distance = np.sqrt(np.clip((1.0 - correlation) / 2.0, 0.0, None))
+            np.fill_diagonal(distance, 0.0)
+            linkage_matrix = linkage(squareform(distance, checks=False), method=self.optimizer_params['hrp_linkage'])
+            order = leaves_list(linkage_matrix)
+            
+            # Recursive bisection over the quasi-diagonal order
+            weights = np.ones(n_assets)
+            clusters = [order]
+            while clusters:
+                next_clusters = []
+                for cluster in clusters:
+                    if len(cluster) < 2:
+                        continue
+                    left, right = cluster[:len(cluster) // 2], cluster[len(cluster) // 2:]
+                    left_variance = self.cluster_variance(sigma, left)
+                    right_variance = self.cluster_variance(sigma, right)
+                    alpha = 1.0 - left_variance / (left_variance + right_variance)
+                    weights[left] *= alpha
+                    weights[right] *= 1.0 - alpha
+                    next_clusters.extend([left, right])
+                clusters = next_clusters
+            
+            self.record_solver('hrp', 'recursive_bisection', clusters=int(n_assets - 1))
+            return weights / weights.sum()
+            
+        except Exception as e:
+            print(f"⚠️ Error in HRP optimization: {str(e)}")
+            return np.ones(sigma.shape[0]) / sigma.shape[0]
+
+    def cluster_variance(self, sigma, cluster):
+        """Variance of the inverse-variance portfolio of a cluster"""
+        sub_sigma = sigma[np.ix_(cluster, cluster)]
+        inverse_variance = 1.0 / np.diag(sub_sigma)
+        inverse_variance /= inverse_variance.sum()
+        return float(inverse_variance @ sub_sigma @ inverse_variance)
+
     def minimum_variance_optimization(self, sigma):
         """
-        Minimum variance optimization
+        Minimum variance optimization - a pure QP, solved with the active-set
+        QP solver; SLSQP with analytic gradient is the fallback
         """
         try:
             n_assets = sigma.shape[0]
+            min_weight = self.allocation_constraints['min_weight']
+            max_weight = self.allocation_constraints['max_weight']
+            
+            # min w'Sigma w  ==  min 0.5 w'(2 Sigma)w
+            weights, iterations = self.solve_box_qp(2 * sigma, np.zeros(n_assets), min_weight, max_weight)
+            if weights is not None:
+                self.record_solver('minimum_variance', 'qp_active_set', iterations=iterations)
+                return weights
             
             # Objective: minimize portfolio variance
             def objective(weights):
                 return np.dot(weights, np.dot(sigma, weights))
             
+            def gradient(weights):
+                return 2 * (sigma @ weights)
+            
             # Constraints
-            constraints = [{'type': 'eq', 'fun': lambda w: np.sum(w) - 1}]
+            constraints = [{'type': 'eq', 'fun': lambda w: np.sum(w) - 1, 'jac': lambda w: np.ones_like(w)}]
             
             # Bounds
-            bounds = [(self.allocation_constraints['min_weight'], 
-                      self.allocation_constraints['max_weight']) for _ in range(n_assets)]
+            bounds = [(min_weight, max_weight) for _ in range(n_assets)]
             
             # Initial guess
             x0 = np.ones(n_assets) / n_assets
             
             # Optimize
-            result = minimize(objective, x0, method='SLSQP', bounds=bounds, constraints=constraints)
+            result = minimize(objective, x0, jac=gradient, method='SLSQP', bounds=bounds, constraints=constraints)
+            self.record_solver('minimum_variance', 'slsqp', iterations=int(result.nit))
             
             if result.success:
                 return result.x
@@ -505,26 +1469,130 @@ class DynamicAllocationService:
             print(f"⚠️ Error in minimum variance optimization: {str(e)}")
             return np.ones(sigma.shape[0]) / sigma.shape[0]
 
-    def ensemble_optimization_methods(self, mv_weights, rp_weights, bl_weights, min_var_weights, symbols):
+    def cvar_optimization(self, symbols, mu, sigma):
         """
-        Ensemble multiple optimization methods
+        Minimum CVaR over return scenarios (Rockafellar-Uryasev):
+            min  zeta + 1 / ((1 - beta) S) * sum(u_s)
+            s.t. u_s >= -r_s'w - zeta, u_s >= 0, sum(w) = 1, lower <= w <= upper
+        Only tail scenarios (loss above zeta) carry weight at the optimum, so the
+        LP is solved over a working set of scenarios, seeded with the worst
+        losses of the minimum variance portfolio. Scenarios whose loss exceeds
+        zeta at the working-set solution are added and the LP re-solved; when
+        none are left the solution is optimal for all S scenarios.
+        """
+        try:
+            n_assets = len(symbols)
+            scenarios = self.scenarios_for(symbols, mu, sigma)
+            n_scenarios = len(scenarios)
+            beta = self.cvar_params['confidence']
+            tail = int(np.ceil((1 - beta) * n_scenarios))
+            tail_weight = 1.0 / ((1 - beta) * n_scenarios)
+            lower = self.allocation_constraints['min_weight']
+            upper = self.allocation_constraints['max_weight']
+            
+            seed, _ = self.solve_box_qp(2 * sigma, np.zeros(n_assets), lower, upper)
+            if seed is None:
+                seed = np.ones(n_assets) / n_assets
+            active = np.zeros(n_scenarios, dtype=bool)
+            active[np.argsort(scenarios @ seed)[:min(n_scenarios, int(1.5 * tail))]] = True
+            
+            lp_iterations = 0
+            for rounds in range(1, int(self.cvar_params['max_rounds']) + 1):
+                result = self.solve_cvar_lp(scenarios[active], tail_weight, lower, upper)
+                if result is None:
+                    break
+                weights, zeta, iterations = result
+                lp_iterations += iterations
+                
+                losses = -(scenarios @ weights)
+                violated = np.flatnonzero(~active & (losses > zeta + self.cvar_params['tolerance']))
+                if len(violated) == 0:
+                    tail_losses = np.maximum(losses - zeta, 0.0)
+                    self.record_solver(
+                        'cvar', 'highs_lp_scenario_generation', rounds=rounds, lp_iterations=int(lp_iterations),
+                        scenarios=int(n_scenarios), working_set=int(active.sum()),
+                        var=float(zeta), cvar=float(zeta + tail_weight * tail_losses.sum()),
+                        confidence=beta, scenario_model=self.scenario_details
+                    )
+                    return weights
+                
+                # Add the worst violated scenarios, at most half a tail per round
+                worst = violated[np.argsort(-losses[violated])][:max(1, tail // 2)]
+                active[worst] = True
+            
+            print("⚠️ CVaR LP failed or did not converge, using equal weights")
+            self.record_solver('cvar', 'highs_lp_scenario_generation', converged=False)
+            return np.ones(n_assets) / n_assets
+            
+        except Exception as e:
+            print(f"⚠️ Error in CVaR optimization: {str(e)}")
+            return np.ones(sigma.shape[0]) / sigma.shape[0]
+
+    def solve_cvar_lp(self, scenarios, tail_weight, lower, upper):
+        """
+        Rockafellar-Uryasev LP over the given scenarios with HiGHS, variables
+        (w, zeta, u). The constraint matrix is sparse apart from the scenario
+        block: -R | -1 | -I. Returns (weights, zeta, iterations) or None.
+        """
+        n_scenarios, n_assets = scenarios.shape
+        objective = np.concatenate([np.zeros(n_assets), [1.0], np.full(n_scenarios, tail_weight)])
+        A_ub = sparse.hstack([
+            sparse.csr_matrix(-scenarios),
+            sparse.csr_matrix(-np.ones((n_scenarios, 1))),
+            -sparse.identity(n_scenarios, format='csr')
+        ], format='csr')
+        A_eq = sparse.csr_matrix((np.ones(n_assets), (np.zeros(n_assets, dtype=int), np.arange(n_assets))),
+                                 shape=(1, n_assets + 1 + n_scenarios))
+        bounds = np.empty((n_assets + 1 + n_scenarios, 2))
+        bounds[:n_assets] = (lower, upper)
+        bounds[n_assets] = (-np.inf, np.inf)
+        bounds[n_assets + 1:] = (0.0, np.inf)
+        
+        result = linprog(objective, A_ub=A_ub, b_ub=np.zeros(n_scenarios), A_eq=A_eq, b_eq=[1.0],
+                         bounds=bounds, method=self.cvar_params['lp_method'])
+        if result.status != 0:
+            return None
+        return result.x[:n_assets], float(result.x[n_assets]), int(result.nit)
+
+    def scenarios_for(self, symbols, mu, sigma):
+        """
+        Scenario returns for `symbols`: sliced from the batch's shared matrix when
+        it covers them, else from the scenario cache
+        """
+        if self.scenario_set is not None:
+            universe, scenarios, details = self.scenario_set
+            position = {symbol: i for i, symbol in enumerate(universe)}
+            if all(symbol in position for symbol in symbols):
+                self.scenario_details = details
+                return scenarios[:, [position[symbol] for symbol in symbols]]
+        
+        scenarios, self.scenario_details = self.scenario_model.get_scenarios(
+            symbols,
+            source=self.cvar_params['scenario_source'],
+            price_histories=self.price_histories,
+            mu=mu, cov=sigma,
+            n_scenarios=int(self.cvar_params['n_scenarios']),
+            horizon_days=int(self.cvar_params['horizon_days']),
+            dof=self.cvar_params['student_t_dof'],
+            seed=self.cvar_params['seed']
+        )
+        return scenarios
+
+    def ensemble_optimization_methods(self, method_weights, symbols):
+        """
+        Ensemble multiple optimization methods: blend the weights of the methods
+        that ran, using their ensemble shares renormalized to sum to one
         """
         try:
             # Weights for different methods based on market conditions
-            method_weights = {
-                'mean_variance': 0.3,
-                'risk_parity': 0.3,
-                'black_litterman': 0.2,
-                'minimum_variance': 0.2
-            }
+            shares = {name: self.ensemble_method_weights.get(name, 0.0) for name in method_weights}
+            total_share = sum(shares.values())
+            if total_share <= 0:
+                shares = {name: 1.0 for name in method_weights}
+                total_share = float(len(method_weights))
             
             # Combine methods
-            ensemble = (
-                method_weights['mean_variance'] * mv_weights +
-                method_weights['risk_parity'] * rp_weights +
-                method_weights['black_litterman'] * bl_weights +
-                method_weights['minimum_variance'] * min_var_weights
-            )
+            ensemble = sum(shares[name] / total_share * np.asarray(weights) for name, weights in method_weights.items())
             
             # Ensure non-negative and normalized
             ensemble = np.maximum(ensemble, 0)
@@ -601,9 +1669,10 @@ class DynamicAllocationService:
             print(f"⚠️ Error applying regime tilts: {str(e)}")
             return optimal_weights
 
-    def apply_allocation_constraints(self, weights, current_weights, symbols):
+    def apply_allocation_constraints(self, weights, current_weights, symbols, enforce_turnover=True):
         """
-        Apply allocation constraints and limits
+        Apply allocation constraints and limits. The turnover scaling is skipped
+        when cost-aware rebalancing enforces the turnover budget instead.
         """
         try:
             constrained_weights = weights.copy()
@@ -633,7 +1702,7 @@ class DynamicAllocationService:
             total_turnover = sum(abs(constrained_weights[symbol] - current_weights.get(symbol, 0)) 
                                for symbol in symbols)
             
-            if total_turnover > self.allocation_constraints['max_turnover']:
+            if enforce_turnover and total_turnover > self.allocation_constraints['max_turnover']:
                 # Scale down changes to meet turnover constraint
                 turnover_scale = self.allocation_constraints['max_turnover'] / total_turnover
                 
@@ -655,6 +1724,101 @@ class DynamicAllocationService:
             print(f"⚠️ Error applying constraints: {str(e)}")
             return weights
 
+    def cost_aware_rebalance(self, target_weights, current_weights, sigma, symbols):
+        """
+        Trade from the current portfolio toward the target, net of costs:
+            min  (delta/2) (w - w*)' Sigma (w - w*) + sum(c_i |w_i - w0_i|)
+            s.t. sum(w) = 1, lower <= w <= upper, sum|w - w0| <= turnover budget
+        Splitting trades into buys and sells (w = w0 + b - s, b, s >= 0) makes it
+        a box-constrained QP in (b, s). It starts from b = s = 0 (the current
+        portfolio), so when costs outweigh the benefit of trading it stops after
+        the first multiplier check. When the uncapped solution exceeds the
+        turnover budget, a price on turnover is added to the costs and bisected
+        until the budget binds; each step is a warm-started solve of the same QP.
+        Returns (weights dict, details) or (None, details) if the QP fails.
+        """
+        started = time.perf_counter()
+        n_assets = len(symbols)
+        w0 = np.array([current_weights.get(symbol, 0.0) for symbol in symbols], dtype=float)
+        target = np.array([target_weights.get(symbol, 0.0) for symbol in symbols], dtype=float)
+        lower = np.full(n_assets, self.allocation_constraints['min_weight'])
+        upper = np.full(n_assets, self.allocation_constraints['max_weight'])
+        cost_bps = self.rebalancing_params['transaction_costs_bps']
+        costs = np.array([cost_bps.get(symbol, self.rebalancing_params['default_cost_bps']) for symbol in symbols]) / 10000
+        turnover_budget = self.rebalancing_params['turnover_budget']
+        
+        # Tracking-risk Hessian, with a tiny ridge so buys and sells of one asset never tie
+        H = self.optimizer_params['risk_aversion'] * sigma
+        H = H + np.eye(n_assets) * 1e-10 * max(np.trace(H) / n_assets, 1e-12)
+        drift = H @ (w0 - target)
+        Q = np.block([[H, -H], [-H, H]])
+        c = -np.concatenate([drift + costs, -drift + costs])
+        
+        x_lower = np.concatenate([np.maximum(lower - w0, 0), np.maximum(w0 - upper, 0)])
+        x_upper = np.concatenate([np.maximum(upper - w0, 0), np.maximum(w0 - lower, 0)])
+        budget_row = np.concatenate([np.ones(n_assets), -np.ones(n_assets)])
+        budget_rhs = 1.0 - w0.sum()
+        
+        def solve(turnover_price, start):
+            # A price on turnover is an extra linear cost on every buy and sell
+            return self.solve_box_qp(Q, c - turnover_price, x_lower, x_upper, A_eq=budget_row, b_eq=budget_rhs,
+                                     w0=start, budget=False)
+        
+        x, iterations = solve(0.0, x_lower)
+        details = {'solver': 'qp_active_set', 'iterations': int(iterations), 'turnover_budget': float(turnover_budget)}
+        if x is None:
+            details.update({'converged': False, 'solve_time_ms': round((time.perf_counter() - started) * 1000, 3)})
+            return None, details
+        
+        # Turnover budget: bisect on the turnover price, which lowers turnover monotonically
+        budget_met = True
+        turnover_price = 0.0
+        if x.sum() > turnover_budget + 1e-9:
+            price_low, price_high = 0.0, 2 * np.max(np.abs(drift)) + 1e-6
+            capped, steps = solve(price_high, x)
+            iterations += steps
+            while capped is not None and capped.sum() > turnover_budget + 1e-9 and price_high < 1e3:
+                price_low, price_high = price_high, price_high * 2
+                capped, steps = solve(price_high, capped)
+                iterations += steps
+            
+            if capped is None or capped.sum() > turnover_budget + 1e-9:
+                budget_met = False  # Bounds force more turnover than the budget allows
+                x = capped if capped is not None else x
+            else:
+                x = capped
+                for _ in range(self.rebalancing_params['max_bisections']):
+                    if x.sum() >= turnover_budget - 1e-10:
+                        break
+                    price = 0.5 * (price_low + price_high)
+                    candidate, steps = solve(price, x)
+                    iterations += steps
+                    if candidate is None:
+                        break
+                    if candidate.sum() > turnover_budget + 1e-9:
+                        price_low = price
+                    else:
+                        price_high, x = price, candidate
+                turnover_price = price_high
+            details['iterations'] = int(iterations)
+        
+        trades = x[:n_assets] - x[n_assets:]
+        trades[np.abs(trades) < 1e-10] = 0.0
+        weights = w0 + trades
+        gap = weights - target
+        details.update({
+            'converged': True,
+            'turnover': float(np.abs(trades).sum()),
+            'turnover_price': float(turnover_price),
+            'turnover_budget_met': budget_met,
+            'estimated_cost': float(costs @ np.abs(trades)),
+            'trades': int(np.sum(np.abs(trades) > 1e-6)),
+            'no_trade': bool(np.all(np.abs(trades) <= 1e-6)),
+            'tracking_error_to_target': float(np.sqrt(max(gap @ sigma @ gap, 0.0))),
+            'solve_time_ms': round((time.perf_counter() - started) * 1000, 3)
+        })
+        return dict(zip(symbols, weights.tolist())), details
+
     def calculate_portfolio_metrics(self, weights, expected_returns, covariance_matrix):
         """
         Calculate expected portfolio metrics
@@ -770,7 +1934,7 @@ class DynamicAllocationService:
             threshold = self.risk_params['rebalancing_threshold']
             
             return {
-                'rebalancing_needed': total_drift > threshold,
+                'rebalancing_needed': bool(total_drift > threshold),
                 'total_drift': total_drift,
                 'drift_threshold': threshold,
                 'drift_percentage': total_drift * 100
@@ -903,18 +2067,94 @@ class DynamicAllocationService:
         }
 
 
+def positive_definite_cholesky(covariance_matrix, eigenvalue_floor=1e-8):
+    """
+    (covariance, lower Cholesky factor), repairing the covariance with floored
+    eigenvalues only when the factorization fails
+    """
+    try:
+        return covariance_matrix, np.linalg.cholesky(covariance_matrix)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance_matrix)
+        eigenvalues = np.maximum(eigenvalues, eigenvalue_floor)  # Floor eigenvalues
+        repaired = (eigenvectors * eigenvalues) @ eigenvectors.T
+        repaired = (repaired + repaired.T) / 2
+        return repaired, np.linalg.cholesky(repaired)
+
+
+def capped_weights(weights, lower, upper):
+    """
+    Fully invested weights within [lower, upper]: assets pushed past a bound
+    are fixed at it and the rest rescaled in proportion to fill the budget
+    """
+    capped = np.asarray(weights, dtype=float).copy()
+    fixed = np.zeros(len(capped), dtype=bool)
+    for _ in range(len(capped)):
+        free = ~fixed
+        capped[free] = weights[free] * (1.0 - capped[fixed].sum()) / weights[free].sum()
+        over, under = free & (capped > upper), free & (capped < lower)
+        if not (over.any() or under.any()):
+            break
+        capped[over], capped[under] = upper, lower
+        fixed |= over | under
+    return capped
+
+
+def contribution_dispersion(weights, sigma, budgets):
+    """Largest gap between a weight's share of portfolio variance and its risk budget"""
+    sigma_w = sigma @ weights
+    return float(np.max(np.abs(weights * sigma_w / (weights @ sigma_w) - budgets)))
+
+
+def slice_cholesky(cholesky_factor, index):
+    """
+    Upper Cholesky factor R of Sigma[index, index] from the lower factor L of
+    the full Sigma: Sigma[index, index] = L[index] L[index]', so R is the
+    triangular part of a QR of L[index]' (only the first max(index) + 1
+    columns of L are non-zero in those rows)
+    """
+    rows = cholesky_factor[index, :int(np.max(index)) + 1]
+    r = np.linalg.qr(rows.T, mode='r')
+    return r * np.where(np.diag(r) < 0, -1.0, 1.0)[:, None]
+
+
+# Batch worker state: one service and the shared risk model per worker process
+BATCH_CONTEXT = {}
+
+
+def init_batch_worker(context):
+    service = DynamicAllocationService()
+    for name, settings in context['settings'].items():
+        getattr(service, name).update(settings)
+    BATCH_CONTEXT['service'] = service
+    BATCH_CONTEXT['context'] = context
+
+
+def run_batch_chunk(chunk):
+    return BATCH_CONTEXT['service'].allocate_batch_chunk(BATCH_CONTEXT['context'], chunk)
+
+
 def main():
     """Main entry point for the dynamic allocation service"""
     try:
         # Read input from command line
-        if len(sys.argv) > 1:
+        if len(sys.argv) > 1 and os.path.isfile(sys.argv[1]):
+            # PythonBridge passes a temp file path (price histories make payloads large)
+            with open(sys.argv[1], 'r') as f:
+                input_data = json.load(f)
+        elif len(sys.argv) > 1:
             input_data = json.loads(sys.argv[1])
         else:
             input_data = json.loads(sys.stdin.read())
         
         # Create service instance and calculate allocation
         allocation_service = DynamicAllocationService()
-        result = allocation_service.calculate_dynamic_allocation(input_data)
+        if input_data.get('action') == 'batch' or 'portfolios' in input_data:
+            result = allocation_service.calculate_batch_allocation(input_data)
+        elif input_data.get('action') == 'efficient_frontier':
+            result = allocation_service.calculate_efficient_frontier(input_data)
+        else:
+            result = allocation_service.calculate_dynamic_allocation(input_data)
         
         # Output result as JSON
         print(json.dumps(result, indent=2))
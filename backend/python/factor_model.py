@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Factor Model for Portfolio AI
+Holding returns regressed on a factor set (market, sector ETFs, size, value,
+rates) for betas, alpha and residual risk, solved for all holdings with one
+multi-target least-squares call; portfolio exposures are weighted sums
+Part of Phase 5: AI-Powered Investment Intelligence
+"""
+
+import sys
+import json
+import numpy as np
+from datetime import datetime
+
+from risk_model import TRADING_DAYS, align_returns, history_coverage
+
+# Factors whose history is a level (yield, spread) and moves by daily change
+LEVEL_FACTORS = ('rates',)
+
+# Factor histories are keyed by factor name, either one proxy history (SPY for
+# 'market', ^TNX for 'rates') or a long/short pair, e.g.
+#   'size':  {'long': IWM, 'short': SPY}    small minus large
+#   'value': {'long': IWD, 'short': IWF}    value minus growth
+# 'sector:<name>' proxies (XLK, XLF, ...) given alone are taken relative to the
+# market so sector betas measure exposure beyond the market beta.
+SECTOR_PREFIX = 'sector:'
+
+
+def factor_legs(factor_history):
+    """Factor names with their (long, short or None) proxy histories, in input order"""
+    legs = {}
+    for factor, history in factor_history.items():
+        if isinstance(history, dict) and history.get('long'):
+            legs[factor] = (history['long'], history.get('short'))
+        elif isinstance(history, list) and history:
+            short = None
+            if factor.startswith(SECTOR_PREFIX) and isinstance(factor_history.get('market'), list):
+                short = factor_history['market']
+            legs[factor] = (history, short)
+    return legs
+
+
+def factor_sample(asset_histories, legs, window):
+    """
+    Aligned daily returns[T, m] of the given assets and factor moves[T, k]
+    (long leg minus short leg) over their common dates
+    """
+    histories = dict(asset_histories)
+    leg_keys = []
+    for factor, (long_history, short_history) in legs.items():
+        histories[f"long:{factor}"] = long_history
+        short_key = None
+        if short_history is not None:
+            short_key = f"short:{factor}"
+            histories[short_key] = short_history
+        leg_keys.append((f"long:{factor}", short_key))
+    keys = list(histories)
+    _, moves = align_returns(histories, keys, window,
+                             differenced={f"{leg}:{factor}" for factor in LEVEL_FACTORS for leg in ('long', 'short')})
+
+    column = {key: j for j, key in enumerate(keys)}
+    factor_moves = np.column_stack([
+        moves[:, column[long_key]] - (moves[:, column[short_key]] if short_key else 0.0)
+        for long_key, short_key in leg_keys
+    ]) if len(moves) else np.empty((0, len(leg_keys)))
+    return moves[:, :len(asset_histories)], factor_moves
+
+
+def estimate_factor_model(price_histories, symbols, factor_history, reference_betas=None,
+                          window=TRADING_DAYS, min_observations=60):
+    """
+    Regress daily returns of every symbol on the factor moves with an intercept.
+    Symbols whose histories cover the window (history_coverage) share one
+    aligned sample and one least-squares problem with a column per symbol;
+    each shorter history is regressed on its own overlap with the factors, so
+    it does not cut the sample of the rest. Symbols without enough history are
+    not regressed: their market beta is the reference beta (1.0 by default)
+    and other exposures are zero.
+
+    Returns a dict of per-symbol arrays: betas[n, k], alpha and
+    residual_volatility (annualized), r_squared, regressed, observations,
+    plus the factors and their annualized covariance and summed moves over
+    the shared sample.
+    """
+    legs = factor_legs(factor_history or {})
+    factors = list(legs)
+    n_symbols, n_factors = len(symbols), len(factors)
+
+    model = {
+        'symbols': list(symbols),
+        'factors': factors,
+        'betas': np.zeros((n_symbols, n_factors)),
+        'alpha': np.zeros(n_symbols),
+        'residual_volatility': np.zeros(n_symbols),
+        'r_squared': np.zeros(n_symbols),
+        'regressed': np.zeros(n_symbols, dtype=bool),
+        'observations': np.zeros(n_symbols, dtype=int),
+        'factor_covariance': np.zeros((n_factors, n_factors)),
+        'factor_totals': np.zeros(n_factors),
+        'details': {'source': 'reference_beta', 'factors': factors, 'regressed': 0, 'observations': 0}
+    }
+    if 'market' in factors:
+        model['betas'][:, factors.index('market')] = reference_betas if reference_betas is not None else 1.0
+
+    eligible = [i for i, symbol in enumerate(symbols) if len(price_histories.get(symbol) or []) > min_observations]
+    if not factors or not eligible:
+        return model
+
+    # Full-window histories in one sample, then each short history on its own
+    covered = history_coverage([len(price_histories[symbols[i]]) for i in eligible], window)
+    groups = [[i for i, full in zip(eligible, covered) if full]] + [[i] for i, full in zip(eligible, covered) if not full]
+    shared_observations = 0
+    for group in filter(None, groups):
+        asset_returns, factor_moves = factor_sample(
+            {f"asset:{i}": price_histories[symbols[i]] for i in group}, legs, window
+        )
+        T = len(asset_returns)
+        if T < max(min_observations, n_factors + 2):
+            shared_observations = shared_observations or int(T)
+            continue
+
+        design = np.column_stack([np.ones(T), factor_moves])
+        coefficients = np.linalg.lstsq(design, asset_returns, rcond=None)[0]
+        residuals = asset_returns - design @ coefficients
+        residual_sum_squares = np.einsum('ij,ij->j', residuals, residuals)
+        centered = asset_returns - asset_returns.mean(axis=0)
+        total_sum_squares = np.einsum('ij,ij->j', centered, centered)
+
+        model['betas'][group] = coefficients[1:].T
+        model['alpha'][group] = coefficients[0] * TRADING_DAYS
+        model['residual_volatility'][group] = np.sqrt(residual_sum_squares / (T - n_factors - 1) * TRADING_DAYS)
+        model['r_squared'][group] = 1.0 - np.divide(
+            residual_sum_squares, total_sum_squares, out=np.ones(len(group)), where=total_sum_squares > 0
+        )
+        model['regressed'][group] = True
+        model['observations'][group] = T
+
+        # Factor risk and moves come from the longest sample that was fit
+        if T > model['details']['observations']:
+            model['factor_covariance'] = np.cov(factor_moves, rowvar=False).reshape(n_factors, n_factors) * TRADING_DAYS
+            model['factor_totals'] = factor_moves.sum(axis=0)
+            model['details']['observations'] = int(T)
+
+    regressed = np.flatnonzero(model['regressed'])
+    if not len(regressed):
+        model['details']['observations'] = shared_observations
+        return model
+
+    short = [symbols[i] for i in regressed if model['observations'][i] < model['details']['observations']]
+    model['details'] = {
+        'source': 'regression', 'factors': factors, 'regressed': int(len(regressed)),
+        'observations': model['details']['observations'], 'short_history': short
+    }
+    return model
+
+
+def slice_factor_model(model, index):
+    """The model restricted to rows `index` (one account of a shared universe)"""
+    sliced = dict(model, symbols=[model['symbols'][i] for i in index])
+    for key in ('betas', 'alpha', 'residual_volatility', 'r_squared', 'regressed', 'observations'):
+        sliced[key] = model[key][index]
+    if model['details']['source'] == 'regression':
+        held = {model['symbols'][i] for i in index}
+        sliced['details'] = {**model['details'], 'regressed': int(sliced['regressed'].sum()),
+                             'short_history': [symbol for symbol in model['details']['short_history'] if symbol in held]}
+    return sliced
+
+
+def portfolio_exposures(weights, model):
+    """
+    Factor exposures w @ betas of one portfolio (weights as fractions), its
+    alpha, systematic and residual volatility (residuals taken as independent),
+    and the arithmetic return attribution over the estimation window:
+    summed daily return = alpha part + sum of exposure x summed factor move.
+    """
+    weights = np.asarray(weights, dtype=float)
+    exposures = weights @ model['betas']
+    alpha = float(weights @ model['alpha'])
+    systematic_variance = float(exposures @ model['factor_covariance'] @ exposures)
+    residual_variance = float((weights * weights) @ (model['residual_volatility'] ** 2))
+    total_variance = systematic_variance + residual_variance
+
+    contributions = exposures * model['factor_totals']
+    observations = model['details'].get('observations', 0)
+    alpha_contribution = alpha / TRADING_DAYS * observations
+
+    return {
+        'exposures': {factor: round(float(value), 4) for factor, value in zip(model['factors'], exposures)},
+        'alpha': round(alpha, 4),
+        'systematic_volatility': round(float(np.sqrt(max(systematic_variance, 0.0))), 4),
+        'residual_volatility': round(float(np.sqrt(max(residual_variance, 0.0))), 4),
+        'total_volatility': round(float(np.sqrt(max(total_variance, 0.0))), 4),
+        'systematic_share': round(systematic_variance / total_variance, 4) if total_variance > 0 else 0,
+        'regressed_weight': round(float(weights[model['regressed']].sum()), 4),
+        'return_attribution': {
+            'factors': {factor: round(float(value), 4) for factor, value in zip(model['factors'], contributions)},
+            'alpha': round(alpha_contribution, 4),
+            'total': round(float(contributions.sum()) + alpha_contribution, 4),
+            'observations': observations
+        }
+    }
+
+
+def holding_exposures(symbols, model):
+    """Per-holding betas, alpha, residual volatility and fit"""
+    return [
+        {
+            'symbol': symbol,
+            'betas': {factor: round(float(value), 4) for factor, value in zip(model['factors'], model['betas'][i])},
+            'alpha': round(float(model['alpha'][i]), 4),
+            'residual_volatility': round(float(model['residual_volatility'][i]), 4),
+            'r_squared': round(float(model['r_squared'][i]), 4),
+            'regressed': bool(model['regressed'][i]),
+            'observations': int(model['observations'][i])
+        }
+        for i, symbol in enumerate(symbols)
+    ]
+
+
+def main():
+    """Factor exposures of holdings (and optionally a weighted portfolio) from a JSON file"""
+    try:
+        if len(sys.argv) < 2:
+            print(json.dumps({'error': 'Usage: python factor_model.py <input.json>'}))
+            sys.exit(1)
+
+        with open(sys.argv[1], 'r') as f:
+            input_data = json.load(f)
+
+        price_histories = input_data.get('price_history', {})
+        symbols = input_data.get('symbols') or list(price_histories.keys())
+        model = estimate_factor_model(
+            price_histories, symbols, input_data.get('factor_history', {}),
+            window=int(input_data.get('window', TRADING_DAYS))
+        )
+
+        result = {
+            'success': True,
+            'holdings': holding_exposures(symbols, model),
+            'model': model['details'],
+            'timestamp': datetime.now().isoformat()
+        }
+        if input_data.get('weights'):
+            weights = np.array([float(input_data['weights'].get(symbol, 0)) for symbol in symbols])
+            result['portfolio'] = portfolio_exposures(weights, model)
+
+        print(json.dumps(result, indent=2))
+
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': str(e)}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
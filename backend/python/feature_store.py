@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Feature Store for ML Predictions Service
+Persists the daily feature matrix as memory-mapped, date-partitioned arrays
+Part of Phase 5: AI-Powered Investment Intelligence
+"""
+
+import os
+import sys
+import json
+import shutil
+import numpy as np
+from collections import namedtuple
+from datetime import datetime
+
+MANIFEST_NAME = 'manifest.json'
+STATE_NAME = 'indicator_state.json'
+
+# Rows of a read window. features/close/symbol_ids are row-aligned; rows for
+# dates[k] live in [offsets[k], offsets[k + 1]).
+FeatureWindow = namedtuple('FeatureWindow', ['dates', 'offsets', 'symbol_ids', 'features', 'close', 'symbols'])
+
+
+class IncrementalIndicatorState:
+    """
+    Per-symbol running indicator state so a new day's technical features can be
+    derived from the previous state and one new close, without the full history
+    """
+
+    def __init__(self, state=None, rsi_period=14, band_period=20, vol_halflife=20):
+        self.rsi_period = rsi_period
+        self.band_period = band_period
+        self.vol_decay = 0.5 ** (1.0 / vol_halflife)
+        self.fast_alpha = 2.0 / (12 + 1)
+        self.slow_alpha = 2.0 / (26 + 1)
+        self.symbols = state or {}
+
+    def update(self, symbol, close):
+        """
+        Fold one close into the symbol state and return its technical features
+        """
+        close = float(close)
+        s = self.symbols.get(symbol)
+
+        if s is None:
+            s = {
+                'last_close': close,
+                'avg_gain': 0.0,
+                'avg_loss': 0.0,
+                'ewma_var': 0.0,
+                'ema_fast': close,
+                'ema_slow': close,
+                'window': [close],
+                'count': 1
+            }
+            self.symbols[symbol] = s
+            return self.technical_features(s)
+
+        ret = close / s['last_close'] - 1.0 if s['last_close'] > 0 else 0.0
+        change = close - s['last_close']
+
+        # Wilder smoothing for RSI averages
+        period = min(s['count'], self.rsi_period)
+        s['avg_gain'] = (s['avg_gain'] * (period - 1) + max(change, 0.0)) / period
+        s['avg_loss'] = (s['avg_loss'] * (period - 1) + max(-change, 0.0)) / period
+
+        s['ewma_var'] = self.vol_decay * s['ewma_var'] + (1 - self.vol_decay) * ret ** 2
+        s['ema_fast'] += self.fast_alpha * (close - s['ema_fast'])
+        s['ema_slow'] += self.slow_alpha * (close - s['ema_slow'])
+
+        s['window'].append(close)
+        if len(s['window']) > self.band_period:
+            s['window'] = s['window'][-self.band_period:]
+
+        s['last_close'] = close
+        s['count'] += 1
+
+        return self.technical_features(s)
+
+    def technical_features(self, s):
+        """
+        Technical feature dict in the shape MLPredictionsService expects
+        """
+        if s['avg_loss'] > 0:
+            rsi = 100 - 100 / (1 + s['avg_gain'] / s['avg_loss'])
+        else:
+            rsi = 100.0 if s['avg_gain'] > 0 else 50.0
+
+        window = np.asarray(s['window'], dtype=float)
+        momentum = s['last_close'] / window[0] - 1.0 if window[0] > 0 else 0.0
+
+        band_std = window.std()
+        if band_std > 0:
+            lower = window.mean() - 2 * band_std
+            bollinger_position = (s['last_close'] - lower) / (4 * band_std)
+        else:
+            bollinger_position = 0.5
+
+        return {
+            'rsi': rsi,
+            'momentum': momentum,
+            'volatility': float(np.sqrt(s['ewma_var'] * 252)),
+            'bollinger_position': float(bollinger_position),
+            'macd': {'macd': (s['ema_fast'] - s['ema_slow']) / s['last_close'] if s['last_close'] > 0 else 0.0}
+        }
+
+    def to_dict(self):
+        return self.symbols
+
+
+class FeatureStore:
+    """
+    Append-only feature store partitioned by trading date.
+
+    Every appended day is written to its own segment directory, then published
+    by atomically replacing the manifest, so readers only ever see complete
+    partitions. Compaction merges segments into one contiguous segment so a
+    training window is a plain slice of a memory-mapped array.
+    """
+
+    def __init__(self, root_path, feature_columns=None):
+        self.root_path = root_path
+        self.segments_path = os.path.join(root_path, 'segments')
+        os.makedirs(self.segments_path, exist_ok=True)
+
+        self.manifest = self.load_manifest()
+        if feature_columns is not None:
+            if self.manifest['feature_columns'] and self.manifest['feature_columns'] != list(feature_columns):
+                raise ValueError("Feature columns do not match the existing store")
+            self.manifest['feature_columns'] = list(feature_columns)
+
+        self._symbol_index = {symbol: i for i, symbol in enumerate(self.manifest['symbols'])}
+
+    # Manifest handling
+    def load_manifest(self):
+        path = os.path.join(self.root_path, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+        return {
+            'version': 1,
+            'feature_columns': [],
+            'symbols': [],
+            'segments': [],
+            'state_segment': None,
+            'updated': None
+        }
+
+    def write_manifest(self):
+        self.manifest['updated'] = datetime.now().isoformat()
+        self.atomic_write_json(os.path.join(self.root_path, MANIFEST_NAME), self.manifest)
+
+    def atomic_write_json(self, path, payload):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(payload, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @property
+    def dates(self):
+        return [date for segment in self.manifest['segments'] for date in segment['dates']]
+
+    @property
+    def last_date(self):
+        segments = self.manifest['segments']
+        return segments[-1]['dates'][-1] if segments else None
+
+    def symbol_id(self, symbol):
+        if symbol not in self._symbol_index:
+            self._symbol_index[symbol] = len(self.manifest['symbols'])
+            self.manifest['symbols'].append(symbol)
+        return self._symbol_index[symbol]
+
+    # Indicator state
+    def load_indicator_state(self):
+        segment_name = self.manifest.get('state_segment')
+        if not segment_name:
+            return IncrementalIndicatorState()
+        with open(os.path.join(self.segments_path, segment_name, STATE_NAME), 'r') as f:
+            return IncrementalIndicatorState(json.load(f))
+
+    # Writes
+    def append_day(self, date, closes, build_row):
+        """
+        Append one trading day.
+
+        Args:
+            date: ISO date string, must be later than the last stored date
+            closes: {symbol: close} for the day
+            build_row: callable(symbol, technical_features) -> feature list
+        """
+        date = str(date)[:10]
+        last_date = self.last_date
+        if last_date is not None and date <= last_date:
+            raise ValueError(f"Date {date} is not after the last stored date {last_date}")
+        if not closes:
+            raise ValueError("No closes provided")
+
+        state = self.load_indicator_state()
+        n_features = len(self.manifest['feature_columns'])
+
+        symbols = sorted(closes.keys())
+        features = np.zeros((len(symbols), n_features), dtype=np.float32)
+        close = np.empty(len(symbols), dtype=np.float64)
+        symbol_ids = np.empty(len(symbols), dtype=np.int32)
+
+        for row, symbol in enumerate(symbols):
+            technical = state.update(symbol, closes[symbol])
+            values = list(build_row(symbol, technical))[:n_features]
+            features[row, :len(values)] = values
+            close[row] = float(closes[symbol])
+            symbol_ids[row] = self.symbol_id(symbol)
+
+        segment_name = date
+        self.write_segment(segment_name, features, close, symbol_ids, state=state.to_dict())
+
+        self.manifest['segments'].append({
+            'name': segment_name,
+            'dates': [date],
+            'offsets': [0, len(symbols)]
+        })
+        self.manifest['state_segment'] = segment_name
+        self.write_manifest()
+
+        return len(symbols)
+
+    def write_segment(self, segment_name, features, close, symbol_ids, state=None):
+        segment_path = os.path.join(self.segments_path, segment_name)
+        # A leftover directory means a previous writer died before publishing
+        if os.path.exists(segment_path):
+            shutil.rmtree(segment_path)
+        os.makedirs(segment_path)
+
+        np.save(os.path.join(segment_path, 'features.npy'), features)
+        np.save(os.path.join(segment_path, 'close.npy'), close)
+        np.save(os.path.join(segment_path, 'symbol_ids.npy'), symbol_ids)
+        if state is not None:
+            self.atomic_write_json(os.path.join(segment_path, STATE_NAME), state)
+
+    # Reads
+    def open_segment(self, segment):
+        segment_path = os.path.join(self.segments_path, segment['name'])
+        return (
+            np.load(os.path.join(segment_path, 'features.npy'), mmap_mode='r'),
+            np.load(os.path.join(segment_path, 'close.npy'), mmap_mode='r'),
+            np.load(os.path.join(segment_path, 'symbol_ids.npy'), mmap_mode='r')
+        )
+
+    def read_window(self, start_date=None, end_date=None, last_n=None):
+        """
+        Read the rows for a date range (or the last N dates) as a FeatureWindow.
+        When the range falls in one segment the arrays are memory-mapped slices.
+        """
+        self.manifest = self.load_manifest()
+        all_dates = self.dates
+        if last_n is not None:
+            selected = all_dates[-last_n:] if last_n > 0 else []
+        else:
+            selected = [d for d in all_dates
+                        if (start_date is None or d >= start_date) and (end_date is None or d <= end_date)]
+
+        n_features = len(self.manifest['feature_columns'])
+        if not selected:
+            return FeatureWindow(
+                np.array([], dtype='datetime64[D]'), np.zeros(1, dtype=np.int64),
+                np.empty(0, dtype=np.int32), np.empty((0, n_features), dtype=np.float32),
+                np.empty(0), list(self.manifest['symbols'])
+            )
+
+        first, last = selected[0], selected[-1]
+        parts = []
+        dates = []
+        offsets = [0]
+
+        for segment in self.manifest['segments']:
+            seg_dates = segment['dates']
+            if seg_dates[-1] < first or seg_dates[0] > last:
+                continue
+
+            lo = np.searchsorted(seg_dates, first, side='left')
+            hi = np.searchsorted(seg_dates, last, side='right')
+            row_lo = segment['offsets'][lo]
+            row_hi = segment['offsets'][hi]
+
+            features, close, symbol_ids = self.open_segment(segment)
+            parts.append((features[row_lo:row_hi], close[row_lo:row_hi], symbol_ids[row_lo:row_hi]))
+
+            base = offsets[-1]
+            for k in range(lo, hi):
+                dates.append(seg_dates[k])
+                offsets.append(base + segment['offsets'][k + 1] - row_lo)
+
+        if len(parts) == 1:
+            features, close, symbol_ids = parts[0]
+        else:
+            features = np.concatenate([p[0] for p in parts])
+            close = np.concatenate([p[1] for p in parts])
+            symbol_ids = np.concatenate([p[2] for p in parts])
+
+        return FeatureWindow(
+            np.array(dates, dtype='datetime64[D]'), np.array(offsets, dtype=np.int64),
+            symbol_ids, features, close, list(self.manifest['symbols'])
+        )
+
+    # Maintenance
+    def compact(self, keep_recent=0):
+        """
+        Merge every segment except the most recent `keep_recent` into one
+        contiguous segment. Returns the number of segments merged.
+        """
+        self.manifest = self.load_manifest()
+        segments = self.manifest['segments']
+        cut = len(segments) - keep_recent if keep_recent > 0 else len(segments)
+        to_merge = segments[:cut]
+        if len(to_merge) < 2:
+            return 0
+
+        features, close, symbol_ids = [], [], []
+        dates, offsets = [], [0]
+        for segment in to_merge:
+            seg_features, seg_close, seg_ids = self.open_segment(segment)
+            features.append(np.asarray(seg_features))
+            close.append(np.asarray(seg_close))
+            symbol_ids.append(np.asarray(seg_ids))
+            base = offsets[-1]
+            dates.extend(segment['dates'])
+            offsets.extend(base + o for o in segment['offsets'][1:])
+
+        merged_name = f"{dates[0]}_{dates[-1]}_c{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        state = None
+        if self.manifest.get('state_segment') in {s['name'] for s in to_merge}:
+            state_path = os.path.join(self.segments_path, self.manifest['state_segment'], STATE_NAME)
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+
+        self.write_segment(merged_name, np.concatenate(features), np.concatenate(close),
+                           np.concatenate(symbol_ids), state=state)
+
+        self.manifest['segments'] = [{
+            'name': merged_name,
+            'dates': dates,
+            'offsets': [int(o) for o in offsets]
+        }] + segments[cut:]
+        if state is not None:
+            self.manifest['state_segment'] = merged_name
+        self.write_manifest()
+
+        # Old segments are unreachable once the manifest is published
+        for segment in to_merge:
+            shutil.rmtree(os.path.join(self.segments_path, segment['name']), ignore_errors=True)
+
+        return len(to_merge)
+
+    def info(self):
+        self.manifest = self.load_manifest()
+        segments = self.manifest['segments']
+        return {
+            'root_path': self.root_path,
+            'feature_columns': self.manifest['feature_columns'],
+            'symbols': len(self.manifest['symbols']),
+            'segments': len(segments),
+            'dates': sum(len(s['dates']) for s in segments),
+            'rows': sum(s['offsets'][-1] for s in segments),
+            'first_date': segments[0]['dates'][0] if segments else None,
+            'last_date': self.last_date,
+            'updated': self.manifest.get('updated')
+        }
+
+
+def main():
+    """Maintenance entry point: feature_store.py <store_path> [info|compact] [keep_recent]"""
+    try:
+        if len(sys.argv) < 3 or sys.argv[2] not in ('info', 'compact'):
+            print(json.dumps({'error': 'Usage: python feature_store.py <store_path> [info|compact] [keep_recent]'}))
+            sys.exit(1)
+
+        store = FeatureStore(sys.argv[1])
+        if sys.argv[2] == 'compact':
+            keep_recent = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+            merged = store.compact(keep_recent=keep_recent)
+            print(json.dumps({'success': True, 'segments_merged': merged, 'store': store.info()}, indent=2))
+        else:
+            print(json.dumps(store.info(), indent=2))
+
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': str(e)}))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
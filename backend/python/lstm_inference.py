@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+LSTM Inference for ML Predictions Service
+Pure-NumPy forward pass for the exported Keras LSTM, so serving never imports TensorFlow
+Part of Phase 5: AI-Powered Investment Intelligence
+"""
+
+import os
+import json
+import numpy as np
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+ACTIVATIONS = {
+    'sigmoid': sigmoid,
+    'hard_sigmoid': hard_sigmoid,
+    'tanh': np.tanh,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'linear': lambda x: x
+}
+
+
+def export_keras_lstm(model, path, metadata=None):
+    """
+    Export the weights of a Sequential [LSTM..., Dropout..., Dense...] Keras
+    model to an .npz file readable by NumpyLSTMModel. Only reads layer configs
+    and weights, so it does not import TensorFlow itself.
+    """
+    layers = []
+    arrays = {}
+
+    for layer in model.layers:
+        kind = layer.__class__.__name__
+        config = layer.get_config()
+
+        if kind == 'Dropout':
+            continue  # Inactive at inference
+        if kind not in ('LSTM', 'Dense'):
+            raise ValueError(f"Unsupported layer for NumPy export: {kind}")
+
+        index = len(layers)
+        weights = layer.get_weights()
+        spec = {'type': kind, 'activation': config.get('activation', 'linear')}
+
+        if kind == 'LSTM':
+            spec.update({
+                'units': int(config['units']),
+                'recurrent_activation': config.get('recurrent_activation', 'sigmoid'),
+                'return_sequences': bool(config.get('return_sequences', False))
+            })
+            arrays[f'l{index}_kernel'], arrays[f'l{index}_recurrent'], arrays[f'l{index}_bias'] = weights
+        else:
+            arrays[f'l{index}_kernel'], arrays[f'l{index}_bias'] = weights
+
+        layers.append(spec)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez(
+        path,
+        layers=np.array(json.dumps(layers)),
+        metadata=np.array(json.dumps(metadata or {})),
+        **arrays
+    )
+    return path
+
+
+class NumpyLSTMModel:
+    """
+    Forward pass of an exported Keras LSTM stack. Keras gate order is
+    input, forget, cell, output; dropout layers are dropped at export.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.layers = json.loads(str(data['layers']))
+            self.metadata = json.loads(str(data['metadata']))
+            self.weights = {key: data[key].astype(np.float64) for key in data.files
+                            if key not in ('layers', 'metadata')}
+
+    @property
+    def sequence_length(self):
+        return self.metadata.get('sequence_length')
+
+    def predict(self, X, verbose=0):
+        """
+        X: (samples, timesteps, features) -> (samples, outputs)
+        `verbose` is accepted for drop-in compatibility with Keras predict
+        """
+        h = np.asarray(X, dtype=np.float64)
+
+        for index, spec in enumerate(self.layers):
+            kernel = self.weights[f'l{index}_kernel']
+            bias = self.weights[f'l{index}_bias']
+
+            if spec['type'] == 'LSTM':
+                h = self.lstm_layer(h, kernel, self.weights[f'l{index}_recurrent'], bias, spec)
+            else:
+                h = ACTIVATIONS[spec['activation']](h @ kernel + bias)
+
+        return h
+
+    def lstm_layer(self, X, kernel, recurrent, bias, spec):
+        units = spec['units']
+        activation = ACTIVATIONS[spec['activation']]
+        recurrent_activation = ACTIVATIONS[spec['recurrent_activation']]
+        n_samples, n_steps, _ = X.shape
+
+        # Input projections for every timestep in one matmul
+        projected = X @ kernel + bias
+
+        h = np.zeros((n_samples, units))
+        c = np.zeros((n_samples, units))
+        outputs = np.empty((n_samples, n_steps, units)) if spec['return_sequences'] else None
+
+        for t in range(n_steps):
+            z = projected[:, t, :] + h @ recurrent
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            g = activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * activation(c)
+            if outputs is not None:
+                outputs[:, t, :] = h
+
+        return outputs if outputs is not None else h
+
+
+def load_lstm_model(path):
+    """Load exported LSTM weights, or None when no export exists"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return NumpyLSTMModel(path)
+    except Exception as e:
+        print(f"⚠️ Could not load exported LSTM weights: {str(e)}")
+        return None
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Offline LSTM Training Job for ML Predictions Service
+Trains the Keras LSTM, exports its weights for the NumPy serving path and
+checks the NumPy forward pass against Keras (accuracy, latency, memory)
+Part of Phase 5: AI-Powered Investment Intelligence
+"""
+
+import os
+import sys
+import json
+import time
+import subprocess
+import numpy as np
+from datetime import datetime
+
+try:
+    import tensorflow as tf
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import LSTM, Dense, Dropout
+    from tensorflow.keras.optimizers import Adam
+except ImportError as e:
+    print(json.dumps({"error": f"TensorFlow is required for offline LSTM training: {e}"}))
+    sys.exit(1)
+
+from ml_predictions import MLPredictionsService
+from lstm_inference import export_keras_lstm, NumpyLSTMModel
+
+
+def symbol_sequences(X, y, sequence_length, row_symbols=None, row_dates=None):
+    """
+    Sequences of one symbol's consecutive dates: rows are ordered by symbol,
+    then date, and each window of `sequence_length` rows ending at a row (its
+    own features included) is kept only if every row is the same symbol.
+    Without row keys the rows are taken as one series.
+    """
+    if row_symbols is None:
+        order = np.arange(len(X))
+        symbols = np.zeros(len(X), dtype=int)
+    else:
+        order = np.lexsort((row_dates, row_symbols))
+        symbols = np.asarray(row_symbols)[order]
+
+    ends = np.arange(sequence_length - 1, len(order))
+    same_symbol = symbols[ends - sequence_length + 1] == symbols[ends]
+    windows = np.lib.stride_tricks.sliding_window_view(X[order], sequence_length, axis=0)
+    return windows[same_symbol].transpose(0, 2, 1), np.asarray(y)[order][ends[same_symbol]]
+
+
+def train_lstm_model(X, y, lstm_params, row_symbols=None, row_dates=None):
+    """
+    Train LSTM model for time series prediction
+    """
+    try:
+        # Reshape data for LSTM (samples, timesteps, features) - per symbol, in date order
+        if row_symbols is not None:
+            longest_series = int(np.unique(row_symbols, return_counts=True)[1].max())
+        else:
+            longest_series = len(X)
+        sequence_length = min(lstm_params['sequence_length'], longest_series // 2)
+        if sequence_length < 1:
+            return None, None
+
+        X_lstm, y_lstm = symbol_sequences(X, y, sequence_length, row_symbols, row_dates)
+
+        if len(X_lstm) < 10:  # Not enough data for LSTM
+            return None, None
+
+        # Build LSTM model
+        model = Sequential([
+            LSTM(lstm_params['units'], return_sequences=True, input_shape=(sequence_length, X.shape[1])),
+            Dropout(lstm_params['dropout']),
+            LSTM(lstm_params['units'] // 2, return_sequences=False),
+            Dropout(lstm_params['dropout']),
+            Dense(25, activation='relu'),
+            Dense(y_lstm.shape[1] if y_lstm.ndim > 1 else 1)
+        ])
+
+        model.compile(
+            optimizer=Adam(learning_rate=0.001),
+            loss='mse',
+            metrics=['mae']
+        )
+
+        # Train model
+        model.fit(
+            X_lstm, y_lstm,
+            epochs=lstm_params['epochs'],
+            batch_size=lstm_params['batch_size'],
+            validation_split=0.2,
+            verbose=0
+        )
+
+        return model, X_lstm
+
+    except Exception as e:
+        print(f"⚠️ LSTM training error: {str(e)}")
+        return None, None
+
+
+def compare_forward_passes(keras_model, numpy_model, X_lstm, repeats=20):
+    """
+    Check NumPy outputs against Keras and time both on the same batch
+    """
+    keras_out = keras_model.predict(X_lstm, verbose=0)
+    numpy_out = numpy_model.predict(X_lstm)
+    max_abs_error = float(np.max(np.abs(keras_out - numpy_out)))
+
+    def timed(fn):
+        started = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        return (time.perf_counter() - started) / repeats * 1000
+
+    return {
+        'max_abs_error': max_abs_error,
+        'within_tolerance': bool(np.allclose(keras_out, numpy_out, rtol=1e-4, atol=1e-5)),
+        'batch_size': int(len(X_lstm)),
+        'keras_latency_ms': round(timed(lambda: keras_model.predict(X_lstm, verbose=0)), 3),
+        'numpy_latency_ms': round(timed(lambda: numpy_model.predict(X_lstm)), 3)
+    }
+
+
+def measure_peak_memory(import_statement):
+    """
+    Peak resident memory (MB) of a fresh interpreter that runs one import
+    """
+    code = (
+        "import resource, sys\n"
+        f"{import_statement}\n"
+        "peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+        "print(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024)"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, timeout=300
+    )
+    try:
+        return round(float(result.stdout.strip().splitlines()[-1]), 1)
+    except (ValueError, IndexError):
+        return None
+
+
+def run_training_job(input_data):
+    """
+    Train on the feature store window, export weights and report the comparison
+    """
+    service = MLPredictionsService()
+    horizons = [int(h) for h in input_data.get('prediction_horizons', [1, 5, 21])]
+    store_config = input_data.get('feature_store', {'path': service.feature_store_path})
+    lstm_params = {**service.lstm_params, **input_data.get('lstm_params', {})}
+    output_path = input_data.get('output_path', service.lstm_weights_path)
+
+    X, y, _, _ = service.prepare_training_data_from_store(store_config, {}, [], horizons)
+    if X is None or len(X) == 0:
+        return {"success": False, "error": "No training window available in the feature store"}
+
+    print(f"🧠 Training LSTM on {len(X)} samples, horizons {horizons}...")
+    started = time.perf_counter()
+    row_symbols, row_dates = service.training_rows
+    model, X_lstm = train_lstm_model(X, y, lstm_params, row_symbols, row_dates)
+    training_seconds = time.perf_counter() - started
+    if model is None:
+        return {"success": False, "error": "Not enough data to train the LSTM"}
+
+    export_keras_lstm(model, output_path, metadata={
+        'horizons': horizons,
+        'n_features': int(X.shape[1]),
+        'sequence_length': int(X_lstm.shape[1]),
+        'trained_at': datetime.now().isoformat()
+    })
+
+    comparison = compare_forward_passes(model, NumpyLSTMModel(output_path), X_lstm[:256])
+    comparison['serving_peak_memory_mb'] = measure_peak_memory('import ml_predictions')
+    comparison['tensorflow_peak_memory_mb'] = measure_peak_memory('import tensorflow')
+
+    return {
+        "success": comparison['within_tolerance'],
+        "weights_path": output_path,
+        "training_seconds": round(training_seconds, 2),
+        "prediction_horizons": horizons,
+        "comparison": comparison,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def main():
+    """Main entry point for the offline LSTM training job"""
+    try:
+        if len(sys.argv) > 1 and os.path.isfile(sys.argv[1]):
+            with open(sys.argv[1], 'r') as f:
+                input_data = json.load(f)
+        elif len(sys.argv) > 1:
+            input_data = json.loads(sys.argv[1])
+        else:
+            input_data = {}
+
+        result = run_training_job(input_data)
+        print(json.dumps(result, indent=2))
+
+    except Exception as e:
+        print(json.dumps({"success": False, "error": str(e), "timestamp": datetime.now().isoformat()}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
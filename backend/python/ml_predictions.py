@@ -5,8 +5,10 @@ Implements ensemble models: RandomForest + LSTM + Linear for return predictions
 Part of Phase 5: AI-Powered Investment Intelligence
 """
 
+import os
 import sys
 import json
+import time
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
@@ -17,23 +19,24 @@ try:
     from sklearn.ensemble import RandomForestRegressor
     from sklearn.linear_model import LinearRegression, Ridge
     from sklearn.preprocessing import StandardScaler
-    from sklearn.model_selection import TimeSeriesSplit, cross_val_score
+    from sklearn.model_selection import TimeSeriesSplit
     from sklearn.metrics import mean_squared_error, mean_absolute_error
     import joblib
 except ImportError as e:
     print(json.dumps({"error": f"Required ML libraries not installed: {e}"}))
     sys.exit(1)
 
-# Try to import TensorFlow for LSTM (optional for basic functionality)
-try:
-    import tensorflow as tf
-    from tensorflow.keras.models import Sequential
-    from tensorflow.keras.layers import LSTM, Dense, Dropout
-    from tensorflow.keras.optimizers import Adam
-    LSTM_AVAILABLE = True
-except ImportError:
-    LSTM_AVAILABLE = False
-    print(json.dumps({"warning": "TensorFlow not available - LSTM models disabled"}))
+from feature_store import FeatureStore
+# LSTM is trained offline (lstm_training.py); serving runs the exported weights in NumPy
+from lstm_inference import load_lstm_model
+
+FEATURE_COLUMNS = [
+    'rsi', 'momentum', 'volatility', 'bollinger_pos', 'macd',
+    'pe_ratio', 'pb_ratio', 'roe', 'revenue_growth', 'profit_margin',
+    'market_vol', 'market_momentum', 'sector_rotation',
+    'yield_slope', 'credit_spreads', 'dollar_strength', 'commodity_momentum',
+    'month', 'weekday', 'day'
+]
 
 class MLPredictionsService:
     def __init__(self):
@@ -42,12 +45,16 @@ class MLPredictionsService:
         self.feature_columns = []
         self.target_columns = []
         self.model_cache_path = '/tmp/ml_models_cache/'
+        self.feature_store_path = '/tmp/ml_feature_store/'
+        self.lstm_weights_path = os.path.join(self.model_cache_path, 'lstm_weights.npz')
+        self.lstm_model = load_lstm_model(self.lstm_weights_path)
+        lstm_available = self.lstm_model is not None
         
         # Ensemble configuration
         self.ensemble_weights = {
             'random_forest': 0.4,
-            'lstm': 0.35 if LSTM_AVAILABLE else 0.0,
-            'linear': 0.6 if not LSTM_AVAILABLE else 0.25
+            'lstm': 0.35 if lstm_available else 0.0,
+            'linear': 0.6 if not lstm_available else 0.25
         }
         
         # Model hyperparameters
@@ -56,9 +63,22 @@ class MLPredictionsService:
             'max_depth': 10,
             'min_samples_split': 5,
             'min_samples_leaf': 2,
+            'bootstrap': True,
+            'oob_score': False,  # Out-of-bag error (see get_oob_mse) replaces per-request cross-validation
+            'n_jobs': -1,       # Grow trees on all cores
             'random_state': 42
         }
         
+        # Warm-start configuration: on each new day of data the cached forest
+        # retires its oldest trees and grows the same number on the new window
+        self.warm_start_params = {
+            'trees_per_update': 20
+        }
+        self.training_data_version = None
+        self.training_rows = None  # (symbol ids, date index) of each store training row
+        self.symbol_history = None  # (store features, rows by symbol then date, per requested symbol row bounds)
+        self.training_times = {}
+        
         self.lstm_params = {
             'sequence_length': 30,
             'units': 50,
@@ -68,62 +88,105 @@ class MLPredictionsService:
         }
         
         self.linear_params = {
-            'alpha': 1.0,  # Ridge regression regularization
-            'normalize': True
+            'alpha': 1.0  # Ridge regression regularization (features are standardized by StandardScaler)
         }
 
     def generate_predictions(self, input_data):
         """
-        Main method to generate ML predictions using ensemble models
+        Main method to generate ML predictions using ensemble models.
+        A list of `prediction_horizons` is served by one multi-output training pass.
         """
         try:
             feature_data = input_data.get('feature_data', {})
             symbols = input_data.get('symbols', [])
             prediction_horizon = input_data.get('prediction_horizon', 21)
-            ensemble_weights = input_data.get('ensemble_weights', self.ensemble_weights)
+            multi_horizon = 'prediction_horizons' in input_data
+            horizons = [int(h) for h in input_data.get('prediction_horizons', [prediction_horizon])]
+            requested_weights = input_data.get('ensemble_weights', self.ensemble_weights)
             model_config = input_data.get('model_config', {})
             
             if not symbols:
                 return {"error": "No symbols provided for prediction"}
+            if not horizons:
+                return {"error": "No prediction horizons provided"}
             
-            print(f"🤖 Generating ML predictions for {len(symbols)} symbols, horizon: {prediction_horizon} days")
+            print(f"🤖 Generating ML predictions for {len(symbols)} symbols, horizons: {horizons} days")
             
-            # Prepare training data
-            X, y, symbol_mapping = self.prepare_training_data(feature_data, symbols, prediction_horizon)
+            # Prepare training data - from the persisted feature store when configured
+            X = None
+            training_source = 'feature_store'
+            store_config = input_data.get('feature_store')
+            if store_config:
+                X, y, X_latest, symbol_mapping = self.prepare_training_data_from_store(
+                    store_config, feature_data, symbols, horizons
+                )
             
             if X is None or len(X) == 0:
-                return self.generate_fallback_predictions(symbols, prediction_horizon)
+                X, y, symbol_mapping = self.prepare_training_data(feature_data, symbols, horizons)
+                X_latest = X
+                self.symbol_history = None
+                training_source = 'request_features'
             
-            # Train or load models
-            models = self.train_ensemble_models(X, y, model_config.get('retrain', False))
+            if X is None or len(X) == 0:
+                return self.generate_fallback_predictions(symbols, horizons if multi_horizon else prediction_horizon)
             
-            # Generate predictions
-            predictions = self.make_ensemble_predictions(X, models, symbols, symbol_mapping, ensemble_weights)
+            # Train or load models - one target column per horizon
+            models = self.train_ensemble_models(
+                X, y, model_config.get('retrain', False),
+                cache_key='h' + '-'.join(str(h) for h in horizons) if training_source == 'feature_store' else None,
+                horizons=horizons
+            )
+            ensemble_weights = self.effective_ensemble_weights(requested_weights, models)
             
-            # Calculate confidence scores
-            confidence_scores = self.calculate_confidence_scores(predictions, X, y, models)
+            # Generate predictions for every horizon at once
+            horizon_predictions = self.make_ensemble_predictions(
+                X_latest, models, symbols, symbol_mapping, ensemble_weights, horizons
+            )
             
-            # Validate predictions
-            validated_predictions = self.validate_predictions(predictions, confidence_scores)
+            predictions = {}
+            confidence_scores = {}
+            for h_idx, horizon in enumerate(horizons):
+                # Calculate confidence scores
+                confidence_scores[horizon] = self.calculate_confidence_scores(
+                    horizon_predictions[horizon], X, y, models, h_idx
+                )
+                
+                # Validate predictions
+                predictions[horizon] = self.validate_predictions(horizon_predictions[horizon], confidence_scores[horizon])
             
-            return {
+            result = {
                 "success": True,
-                "predictions": validated_predictions,
                 "model_performance": self.get_model_performance_metrics(models, X, y),
-                "confidence_scores": confidence_scores,
                 "ensemble_weights": ensemble_weights,
-                "prediction_horizon": prediction_horizon,
                 "timestamp": datetime.now().isoformat(),
-                "models_used": list(models.keys())
+                "models_used": list(models.keys()),
+                "training_source": training_source,
+                "training_times": self.training_times
             }
             
+            if multi_horizon:
+                result.update({
+                    "predictions": {f"{h}d": predictions[h] for h in horizons},
+                    "confidence_scores": {f"{h}d": confidence_scores[h] for h in horizons},
+                    "prediction_horizons": horizons
+                })
+            else:
+                result.update({
+                    "predictions": predictions[horizons[0]],
+                    "confidence_scores": confidence_scores[horizons[0]],
+                    "prediction_horizon": prediction_horizon
+                })
+            
+            return result
+            
         except Exception as e:
             print(f"❌ Error in ML predictions: {str(e)}")
-            return self.generate_fallback_predictions(symbols, prediction_horizon, error=str(e))
+            return self.generate_fallback_predictions(symbols, horizons if multi_horizon else prediction_horizon, error=str(e))
 
-    def prepare_training_data(self, feature_data, symbols, horizon):
+    def prepare_training_data(self, feature_data, symbols, horizons):
         """
-        Prepare training data from portfolio and market features
+        Prepare training data from portfolio and market features.
+        y has one column per prediction horizon.
         """
         try:
             print("📊 Preparing training data...")
@@ -143,61 +206,17 @@ class MLPredictionsService:
             for i, symbol in enumerate(symbols):
                 symbol_mapping[i] = symbol
                 
-                # Collect features for this symbol
-                features = []
-                
-                # Technical features (most important for short-term prediction)
-                tech_data = technical_features.get(symbol, {})
-                features.extend([
-                    tech_data.get('rsi', 50) / 100.0,  # Normalize RSI
-                    tech_data.get('momentum', 0),
-                    tech_data.get('volatility', 0.2),
-                    tech_data.get('bollinger_position', 0.5),
-                    tech_data.get('macd', {}).get('macd', 0) if isinstance(tech_data.get('macd'), dict) else 0
-                ])
-                
-                # Fundamental features (for longer-term prediction)
-                fund_data = fundamental_features.get(symbol, {})
-                features.extend([
-                    self.normalize_ratio(fund_data.get('pe_ratio', 20), 50),
-                    self.normalize_ratio(fund_data.get('pb_ratio', 3), 10),
-                    fund_data.get('roe', 0.15),
-                    fund_data.get('revenue_growth', 0.05),
-                    fund_data.get('profit_margin', 0.1)
-                ])
-                
-                # Market features
-                features.extend([
-                    market_features.get('market_volatility', 0.2),
-                    market_features.get('market_momentum', 0),
-                    market_features.get('sector_rotation', {}).get('score', 0) / 100.0
-                ])
-                
-                # Macro features
-                features.extend([
-                    macro_features.get('yield_curve_slope', 0),
-                    macro_features.get('credit_spreads', 0.02),
-                    macro_features.get('dollar_strength', 0),
-                    macro_features.get('commodity_momentum', 0)
-                ])
+                features = self.build_feature_vector(
+                    technical_features.get(symbol, {}),
+                    fundamental_features.get(symbol, {}),
+                    market_features,
+                    macro_features
+                )
                 
-                # Add time-based features
-                current_date = datetime.now()
-                features.extend([
-                    current_date.month / 12.0,  # Seasonal factors
-                    current_date.weekday() / 6.0,  # Day of week
-                    (current_date.day - 1) / 30.0  # Day of month
-                ])
-                
-                # Ensure we have the expected number of features
-                while len(features) < 20:
-                    features.append(0.0)
-                
-                X_data.append(features[:20])  # Limit to 20 features
+                X_data.append(features)
                 
                 # Generate synthetic target (return) - in production this would be historical returns
-                target_return = self.generate_synthetic_target(symbol, horizon, features)
-                y_data.append(target_return)
+                y_data.append([self.generate_synthetic_target(symbol, horizon, features) for horizon in horizons])
             
             if not X_data:
                 return None, None, None
@@ -206,13 +225,7 @@ class MLPredictionsService:
             y = np.array(y_data)
             
             # Store feature column names for later use
-            self.feature_columns = [
-                'rsi', 'momentum', 'volatility', 'bollinger_pos', 'macd',
-                'pe_ratio', 'pb_ratio', 'roe', 'revenue_growth', 'profit_margin',
-                'market_vol', 'market_momentum', 'sector_rotation',
-                'yield_slope', 'credit_spreads', 'dollar_strength', 'commodity_momentum',
-                'month', 'weekday', 'day'
-            ]
+            self.feature_columns = list(FEATURE_COLUMNS)
             
             print(f"✅ Training data prepared: {X.shape[0]} samples, {X.shape[1]} features")
             return X, y, symbol_mapping
@@ -221,39 +234,212 @@ class MLPredictionsService:
             print(f"❌ Error preparing training data: {str(e)}")
             return None, None, None
 
-    def train_ensemble_models(self, X, y, force_retrain=False):
+    def build_feature_vector(self, tech_data, fund_data, market_features, macro_features, as_of=None):
         """
-        Train or load ensemble models
+        Build the 20-column feature vector for one symbol
+        """
+        features = []
+        
+        # Technical features (most important for short-term prediction)
+        features.extend([
+            tech_data.get('rsi', 50) / 100.0,  # Normalize RSI
+            tech_data.get('momentum', 0),
+            tech_data.get('volatility', 0.2),
+            tech_data.get('bollinger_position', 0.5),
+            tech_data.get('macd', {}).get('macd', 0) if isinstance(tech_data.get('macd'), dict) else 0
+        ])
+        
+        # Fundamental features (for longer-term prediction)
+        features.extend([
+            self.normalize_ratio(fund_data.get('pe_ratio', 20), 50),
+            self.normalize_ratio(fund_data.get('pb_ratio', 3), 10),
+            fund_data.get('roe', 0.15),
+            fund_data.get('revenue_growth', 0.05),
+            fund_data.get('profit_margin', 0.1)
+        ])
+        
+        # Market features
+        features.extend([
+            market_features.get('market_volatility', 0.2),
+            market_features.get('market_momentum', 0),
+            market_features.get('sector_rotation', {}).get('score', 0) / 100.0
+        ])
+        
+        # Macro features
+        features.extend([
+            macro_features.get('yield_curve_slope', 0),
+            macro_features.get('credit_spreads', 0.02),
+            macro_features.get('dollar_strength', 0),
+            macro_features.get('commodity_momentum', 0)
+        ])
+        
+        # Add time-based features
+        current_date = as_of or datetime.now()
+        features.extend([
+            current_date.month / 12.0,  # Seasonal factors
+            current_date.weekday() / 6.0,  # Day of week
+            (current_date.day - 1) / 30.0  # Day of month
+        ])
+        
+        # Ensure we have the expected number of features
+        while len(features) < len(FEATURE_COLUMNS):
+            features.append(0.0)
+        
+        return features[:len(FEATURE_COLUMNS)]
+
+    def update_feature_store(self, input_data):
+        """
+        Append the newest trading day to the feature store. Technical features
+        come from the store's incremental indicator state, so only the new
+        day's rows are computed.
+        """
+        try:
+            store_config = input_data.get('feature_store', {})
+            feature_data = input_data.get('feature_data', {})
+            closes = input_data.get('closes', {})
+            date = input_data.get('date', datetime.now().strftime('%Y-%m-%d'))
+            
+            store = FeatureStore(store_config.get('path', self.feature_store_path), FEATURE_COLUMNS)
+            as_of = datetime.strptime(date[:10], '%Y-%m-%d')
+            
+            fundamental_features = feature_data.get('fundamental_features', {})
+            market_features = feature_data.get('market_features', {})
+            macro_features = feature_data.get('macro_features', {})
+            
+            def build_row(symbol, technical):
+                return self.build_feature_vector(
+                    technical, fundamental_features.get(symbol, {}), market_features, macro_features, as_of
+                )
+            
+            rows = store.append_day(date, closes, build_row)
+            
+            return {
+                "success": True,
+                "date": date[:10],
+                "rows_appended": rows,
+                "store": store.info(),
+                "timestamp": datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            print(f"❌ Error updating feature store: {str(e)}")
+            return {"success": False, "error": str(e), "timestamp": datetime.now().isoformat()}
+
+    def prepare_training_data_from_store(self, store_config, feature_data, symbols, horizons):
+        """
+        Slice a training window out of the feature store. Targets are realized
+        forward returns, one column per horizon in trading days; the prediction
+        rows are the latest stored day for each symbol.
+        """
+        self.symbol_history = None
+        try:
+            store = FeatureStore(store_config.get('path', self.feature_store_path), FEATURE_COLUMNS)
+            window_days = int(store_config.get('window_days', 252))
+            max_horizon = max(horizons)
+            window = store.read_window(last_n=window_days + max_horizon)
+            
+            n_dates = len(window.dates)
+            if n_dates <= max_horizon:
+                print("⚠️ Feature store window too short for horizon, using request features")
+                return None, None, None, None
+            
+            print(f"📦 Reading training window from feature store: {n_dates} dates")
+            
+            # Dense date x symbol close panel for forward-return targets
+            rows_per_date = np.diff(window.offsets)
+            row_date = np.repeat(np.arange(n_dates), rows_per_date)
+            close_panel = np.full((n_dates, len(window.symbols)), np.nan)
+            close_panel[row_date, window.symbol_ids] = window.close
+            
+            # Rows with a realized target for every horizon form a contiguous prefix of the window
+            train_end = int(window.offsets[n_dates - max_horizon])
+            train_dates = row_date[:train_end]
+            train_ids = window.symbol_ids[:train_end]
+            y = np.column_stack([
+                close_panel[train_dates + horizon, train_ids] / close_panel[train_dates, train_ids] - 1.0
+                for horizon in horizons
+            ])
+            X = np.asarray(window.features[:train_end], dtype=np.float64)
+            
+            valid = np.isfinite(y).all(axis=1)
+            if not valid.all():
+                X, y = X[valid], y[valid]
+                train_ids, train_dates = train_ids[valid], train_dates[valid]
+            self.training_rows = (np.asarray(train_ids), train_dates)
+            
+            # Latest stored row per requested symbol
+            latest_lo, latest_hi = window.offsets[-2], window.offsets[-1]
+            latest_rows = {int(sid): latest_lo + r for r, sid in enumerate(window.symbol_ids[latest_lo:latest_hi])}
+            symbol_ids = {symbol: i for i, symbol in enumerate(window.symbols)}
+            
+            X_latest = []
+            symbol_mapping = {}
+            for i, symbol in enumerate(symbols):
+                symbol_mapping[i] = symbol
+                row = latest_rows.get(symbol_ids.get(symbol, -1))
+                if row is not None:
+                    X_latest.append(np.asarray(window.features[row], dtype=np.float64))
+                else:
+                    X_latest.append(self.build_feature_vector(
+                        feature_data.get('technical_features', {}).get(symbol, {}),
+                        feature_data.get('fundamental_features', {}).get(symbol, {}),
+                        feature_data.get('market_features', {}),
+                        feature_data.get('macro_features', {})
+                    ))
+            
+            # Each symbol's stored rows in date order, for the LSTM's input
+            # sequences (only for symbols served from their latest stored row)
+            order = np.argsort(window.symbol_ids, kind='stable')
+            sorted_ids = window.symbol_ids[order]
+            bounds = np.zeros((len(symbols), 2), dtype=np.int64)
+            for i, symbol in enumerate(symbols):
+                symbol_id = symbol_ids.get(symbol, -1)
+                if symbol_id in latest_rows:
+                    bounds[i] = np.searchsorted(sorted_ids, [symbol_id, symbol_id + 1])
+            self.symbol_history = (window.features, order, bounds)
+            
+            self.feature_columns = list(FEATURE_COLUMNS)
+            self.training_data_version = str(window.dates[-1])
+            
+            print(f"✅ Training data from store: {X.shape[0]} samples, {X.shape[1]} features")
+            return X, y, np.array(X_latest, dtype=np.float64), symbol_mapping
+            
+        except Exception as e:
+            print(f"⚠️ Error reading feature store: {str(e)}")
+            return None, None, None, None
+
+    def train_ensemble_models(self, X, y, force_retrain=False, cache_key=None, horizons=None):
+        """
+        Train or load ensemble models. With a cache_key the forest is persisted
+        and warm-started on later data instead of refitted from scratch.
         """
         models = {}
+        self.training_times = {}
         
         try:
             # Random Forest Model
-            print("🌲 Training Random Forest model...")
-            rf_model = RandomForestRegressor(**self.rf_params)
-            rf_model.fit(X, y)
+            rf_model = self.fit_random_forest(X, y, force_retrain, cache_key)
             models['random_forest'] = rf_model
+            self.get_oob_mse(models, X, y)
             
             # Linear/Ridge Regression Model
             print("📈 Training Linear Regression model...")
+            started = time.perf_counter()
             linear_model = Ridge(**self.linear_params)
             
             # Scale features for linear model
             scaler = StandardScaler()
             X_scaled = scaler.fit_transform(X)
-            linear_model.fit(X_scaled, y)
+            linear_model.fit(X_scaled, self.fit_target(y))
+            self.record_training_time('linear', started)
             
             models['linear'] = linear_model
             models['scaler'] = scaler
             
-            # LSTM Model (if available)
-            if LSTM_AVAILABLE and len(X) > 50:  # Need sufficient data for LSTM
-                print("🧠 Training LSTM model...")
-                lstm_model = self.train_lstm_model(X, y)
-                if lstm_model is not None:
-                    models['lstm'] = lstm_model
-                else:
-                    print("⚠️ LSTM training failed, using ensemble without LSTM")
+            # Exported LSTM (if trained offline for these features and horizons)
+            lstm_model = self.get_serving_lstm(X.shape[1], horizons)
+            if lstm_model is not None:
+                models['lstm'] = lstm_model
             
             print(f"✅ Ensemble models trained: {list(models.keys())}")
             return models
@@ -263,140 +449,211 @@ class MLPredictionsService:
             # Return simple linear model as fallback
             try:
                 fallback_model = LinearRegression()
-                fallback_model.fit(X, y)
+                fallback_model.fit(X, self.fit_target(y))
                 return {'linear': fallback_model}
             except:
                 return {}
 
-    def train_lstm_model(self, X, y):
+    def fit_random_forest(self, X, y, force_retrain=False, cache_key=None):
         """
-        Train LSTM model for time series prediction
+        Fit the forest, or warm-start the cached one: retire the oldest
+        `trees_per_update` trees and grow as many new ones on the current window.
+        `window_trees_` counts the trees (at the end of estimators_) fit on the
+        current window; only their bootstraps identify out-of-bag rows.
         """
-        try:
-            if not LSTM_AVAILABLE:
-                return None
-            
-            # Reshape data for LSTM (samples, timesteps, features)
-            sequence_length = min(self.lstm_params['sequence_length'], len(X) // 2)
-            
-            # Create sequences
-            X_sequences = []
-            y_sequences = []
-            
-            for i in range(sequence_length, len(X)):
-                X_sequences.append(X[i-sequence_length:i])
-                y_sequences.append(y[i])
-            
-            if len(X_sequences) < 10:  # Not enough data for LSTM
-                return None
-            
-            X_lstm = np.array(X_sequences)
-            y_lstm = np.array(y_sequences)
-            
-            # Build LSTM model
-            model = Sequential([
-                LSTM(self.lstm_params['units'], return_sequences=True, input_shape=(sequence_length, X.shape[1])),
-                Dropout(self.lstm_params['dropout']),
-                LSTM(self.lstm_params['units'] // 2, return_sequences=False),
-                Dropout(self.lstm_params['dropout']),
-                Dense(25, activation='relu'),
-                Dense(1)
-            ])
-            
-            model.compile(
-                optimizer=Adam(learning_rate=0.001),
-                loss='mse',
-                metrics=['mae']
-            )
-            
-            # Train model
-            history = model.fit(
-                X_lstm, y_lstm,
-                epochs=min(self.lstm_params['epochs'], 20),  # Limit epochs for speed
-                batch_size=self.lstm_params['batch_size'],
-                validation_split=0.2,
-                verbose=0
+        target = self.fit_target(y)
+        n_outputs = 1 if target.ndim == 1 else target.shape[1]
+        cache_file = None
+        forest = None
+        
+        if cache_key is not None:
+            cache_file = os.path.join(self.model_cache_path, f"random_forest_{cache_key}_{X.shape[1]}x{n_outputs}.joblib")
+            if not force_retrain and os.path.exists(cache_file):
+                try:
+                    forest = joblib.load(cache_file)
+                except Exception as e:
+                    print(f"⚠️ Could not load cached forest, retraining: {str(e)}")
+                    forest = None
+        
+        # Already trained on this exact window
+        if forest is not None and self.training_data_version is not None \
+                and getattr(forest, 'data_version_', None) == self.training_data_version:
+            print("🌲 Reusing cached Random Forest model...")
+            self.training_times['random_forest'] = {'seconds': 0.0, 'mode': 'cached'}
+            return forest
+        
+        started = time.perf_counter()
+        if forest is not None:
+            print("🌲 Warm-starting Random Forest model...")
+            n_new = min(self.warm_start_params['trees_per_update'], len(forest.estimators_))
+            forest.estimators_ = forest.estimators_[n_new:]
+            forest.set_params(
+                warm_start=True,
+                n_estimators=len(forest.estimators_) + n_new,
+                n_jobs=self.rf_params['n_jobs'],
+                random_state=int(np.random.randint(0, 2**31 - 1))  # fresh bootstraps for the new trees
             )
-            
-            return model
-            
-        except Exception as e:
-            print(f"⚠️ LSTM training error: {str(e)}")
+            forest.fit(X, target)
+            forest.window_trees_ = n_new
+            for attribute in ('oob_mse_', 'oob_r2_'):
+                if hasattr(forest, attribute):
+                    delattr(forest, attribute)
+            mode = 'warm_start'
+        else:
+            print("🌲 Training Random Forest model...")
+            forest = RandomForestRegressor(**self.rf_params)
+            forest.fit(X, target)
+            forest.window_trees_ = len(forest.estimators_)
+            mode = 'full'
+        self.record_training_time('random_forest', started, mode)
+        
+        if cache_file is not None:
+            try:
+                forest.data_version_ = self.training_data_version
+                os.makedirs(self.model_cache_path, exist_ok=True)
+                joblib.dump(forest, cache_file)
+            except Exception as e:
+                print(f"⚠️ Could not cache Random Forest model: {str(e)}")
+        
+        return forest
+
+    def record_training_time(self, model_name, started, mode='full'):
+        """Log and keep the wall-clock training time of one model"""
+        seconds = time.perf_counter() - started
+        self.training_times[model_name] = {'seconds': round(seconds, 4), 'mode': mode}
+        print(f"⏱️ {model_name} trained in {seconds:.3f}s ({mode})")
+
+    def get_serving_lstm(self, n_features, horizons):
+        """
+        Exported LSTM weights, if they were trained for this feature layout and horizons
+        """
+        if self.lstm_model is None:
             return None
+        
+        metadata = self.lstm_model.metadata
+        if metadata.get('n_features') != n_features or (horizons is not None and metadata.get('horizons') != list(horizons)):
+            print("⚠️ Exported LSTM does not match the requested horizons, using ensemble without LSTM")
+            return None
+        
+        return self.lstm_model
 
-    def make_ensemble_predictions(self, X, models, symbols, symbol_mapping, ensemble_weights):
+    def effective_ensemble_weights(self, ensemble_weights, models):
         """
-        Generate predictions using ensemble of models
+        Ensemble weights renormalized over the models actually trained or loaded,
+        so a missing model (e.g. a rejected LSTM) does not shrink the predictions
         """
-        predictions = {}
+        used = [name for name in ('random_forest', 'linear', 'lstm') if name in models]
+        total = sum(float(ensemble_weights.get(name, 0)) for name in used)
+        if total <= 0:
+            return dict(ensemble_weights)
+        return {name: (float(weight) / total if name in used else 0.0) for name, weight in ensemble_weights.items()}
+
+    def lstm_sequences(self, samples, sequence_length):
+        """
+        LSTM input (n_symbols, sequence_length, n_features): each symbol's last
+        stored rows in date order, ending at its latest row, like the training
+        sequences (symbol_sequences). A shorter stored history is padded with its
+        earliest row; symbols without one (request features) repeat their row.
+        """
+        sequences = np.repeat(samples[:, np.newaxis, :], sequence_length, axis=1)
+        if self.symbol_history is None:
+            return sequences
+        
+        features, order, bounds = self.symbol_history
+        for i, (start, end) in enumerate(bounds[:len(samples)]):
+            rows = order[max(start, end - sequence_length):end]
+            if len(rows):
+                history = np.asarray(features[rows], dtype=np.float64)
+                sequences[i, :sequence_length - len(rows)] = history[0]
+                sequences[i, sequence_length - len(rows):] = history
+        return sequences
+
+    def make_ensemble_predictions(self, X, models, symbols, symbol_mapping, ensemble_weights, horizons):
+        """
+        Generate predictions using ensemble of models.
+        Returns {horizon: {symbol: prediction}}; each model predicts all
+        symbols and horizons in a single call.
+        """
+        predictions = {horizon: {} for horizon in horizons}
         
         try:
-            for i, symbol in enumerate(symbols):
-                symbol_predictions = {}
-                prediction_values = []
-                model_contributions = {}
-                
-                # Get single sample for this symbol
-                sample = X[i:i+1] if len(X) > i else X[0:1]
-                
-                # Random Forest prediction
-                if 'random_forest' in models:
-                    rf_pred = models['random_forest'].predict(sample)[0]
-                    prediction_values.append(rf_pred * ensemble_weights.get('random_forest', 0))
-                    model_contributions['random_forest'] = rf_pred
-                
-                # Linear model prediction
-                if 'linear' in models:
-                    sample_scaled = models.get('scaler', StandardScaler()).transform(sample) if 'scaler' in models else sample
-                    linear_pred = models['linear'].predict(sample_scaled)[0]
-                    prediction_values.append(linear_pred * ensemble_weights.get('linear', 0))
-                    model_contributions['linear'] = linear_pred
-                
-                # LSTM prediction (if available)
-                if 'lstm' in models and LSTM_AVAILABLE:
-                    # For LSTM, we need sequence data - use repeated sample as fallback
-                    sequence_length = self.lstm_params['sequence_length']
-                    lstm_input = np.repeat(sample, sequence_length, axis=0).reshape(1, sequence_length, -1)
-                    lstm_pred = models['lstm'].predict(lstm_input, verbose=0)[0][0]
-                    prediction_values.append(lstm_pred * ensemble_weights.get('lstm', 0))
-                    model_contributions['lstm'] = lstm_pred
-                
-                # Ensemble prediction
-                ensemble_prediction = sum(prediction_values) if prediction_values else 0.0
-                
-                # Ensure prediction is reasonable (between -50% and +100% return)
-                ensemble_prediction = max(-0.5, min(1.0, ensemble_prediction))
-                
-                # Convert to percentage and add confidence metrics
-                predictions[symbol] = {
-                    "expected_return": ensemble_prediction,
-                    "expected_return_percent": ensemble_prediction * 100,
-                    "direction": "bullish" if ensemble_prediction > 0.02 else "bearish" if ensemble_prediction < -0.02 else "neutral",
-                    "confidence": min(0.9, max(0.1, abs(ensemble_prediction) * 2)),  # Higher magnitude = higher confidence
-                    "model_contributions": model_contributions,
-                    "ensemble_weight": ensemble_weights
-                }
+            n_outputs = len(horizons)
+            
+            # Rows for the requested symbols
+            rows = np.array([i if len(X) > i else 0 for i in range(len(symbols))])
+            samples = X[rows]
+            
+            # (n_symbols, n_horizons) prediction matrix per model
+            model_outputs = {}
+            
+            # Random Forest prediction
+            if 'random_forest' in models:
+                model_outputs['random_forest'] = self.as_output_matrix(models['random_forest'].predict(samples), n_outputs)
+            
+            # Linear model prediction
+            if 'linear' in models:
+                samples_scaled = models['scaler'].transform(samples) if 'scaler' in models else samples
+                model_outputs['linear'] = self.as_output_matrix(models['linear'].predict(samples_scaled), n_outputs)
+            
+            # LSTM prediction (if available)
+            if 'lstm' in models:
+                sequence_length = models['lstm'].sequence_length or self.lstm_params['sequence_length']
+                lstm_input = self.lstm_sequences(samples, sequence_length)
+                model_outputs['lstm'] = self.as_output_matrix(models['lstm'].predict(lstm_input, verbose=0), n_outputs)
+            
+            # Ensemble prediction
+            ensemble_matrix = np.zeros((len(symbols), n_outputs))
+            for model_name, output in model_outputs.items():
+                ensemble_matrix += output * ensemble_weights.get(model_name, 0)
+            
+            # Ensure prediction is reasonable (between -50% and +100% return)
+            ensemble_matrix = np.clip(ensemble_matrix, -0.5, 1.0)
+            
+            # Per-tree predictions for every symbol in one pass - their spread is
+            # the forest's uncertainty for that symbol
+            rf_dispersion = self.calculate_forest_dispersion(models, samples, n_outputs)
+            
+            for h_idx, horizon in enumerate(horizons):
+                for i, symbol in enumerate(symbols):
+                    ensemble_prediction = float(ensemble_matrix[i, h_idx])
+                    
+                    # Convert to percentage and add confidence metrics
+                    predictions[horizon][symbol] = {
+                        "expected_return": ensemble_prediction,
+                        "expected_return_percent": ensemble_prediction * 100,
+                        "direction": "bullish" if ensemble_prediction > 0.02 else "bearish" if ensemble_prediction < -0.02 else "neutral",
+                        "confidence": min(0.9, max(0.1, abs(ensemble_prediction) * 2)),  # Higher magnitude = higher confidence
+                        "model_contributions": {name: float(output[i, h_idx]) for name, output in model_outputs.items()},
+                        "ensemble_weight": ensemble_weights
+                    }
+                    
+                    if rf_dispersion is not None:
+                        predictions[horizon][symbol]["prediction_interval"] = {
+                            "lower": float(rf_dispersion['lower'][i, h_idx]),
+                            "upper": float(rf_dispersion['upper'][i, h_idx]),
+                            "tree_std": float(rf_dispersion['std'][i, h_idx]),
+                            "level": 0.9
+                        }
             
             return predictions
             
         except Exception as e:
             print(f"❌ Error making predictions: {str(e)}")
-            return self.generate_simple_fallback_predictions(symbols)
+            return {horizon: self.generate_simple_fallback_predictions(symbols) for horizon in horizons}
 
-    def calculate_confidence_scores(self, predictions, X, y, models):
+    def calculate_confidence_scores(self, predictions, X, y, models, horizon_index=0):
         """
-        Calculate confidence scores for predictions
+        Calculate confidence scores for predictions of one horizon
         """
         confidence_scores = {}
         
         try:
-            # Calculate cross-validation scores for model performance
-            if 'random_forest' in models and len(X) > 5:
-                cv_scores = cross_val_score(models['random_forest'], X, y, cv=min(5, len(X)), scoring='neg_mean_squared_error')
-                avg_cv_score = -cv_scores.mean()
-                
+            # Out-of-bag error comes free with the fitted forest - no refits
+            oob_mse = self.get_oob_mse(models, X, y)
+            if oob_mse is not None:
+                oob_mse = float(oob_mse[horizon_index])
                 # Convert MSE to confidence (lower MSE = higher confidence)
-                model_confidence = max(0.1, min(0.9, 1.0 / (1.0 + avg_cv_score)))
+                model_confidence = max(0.1, min(0.9, 1.0 / (1.0 + oob_mse)))
             else:
                 model_confidence = 0.5
             
@@ -414,14 +671,23 @@ class MLPredictionsService:
                 else:
                     agreement_confidence = 0.7
                 
-                # Combined confidence
-                combined_confidence = (magnitude_confidence * 0.4 + model_confidence * 0.3 + agreement_confidence * 0.3)
+                # Tree dispersion relative to the out-of-bag error (narrow forest = higher confidence)
+                interval = pred_data.get('prediction_interval')
+                if interval is not None and oob_mse is not None:
+                    dispersion_confidence = max(0.1, min(0.9, 1.0 / (1.0 + interval['tree_std'] / (np.sqrt(oob_mse) + 1e-6))))
+                    combined_confidence = (magnitude_confidence * 0.3 + model_confidence * 0.25 +
+                                           agreement_confidence * 0.2 + dispersion_confidence * 0.25)
+                else:
+                    dispersion_confidence = None
+                    combined_confidence = (magnitude_confidence * 0.4 + model_confidence * 0.3 + agreement_confidence * 0.3)
                 
                 confidence_scores[symbol] = {
                     "overall_confidence": combined_confidence,
                     "magnitude_confidence": magnitude_confidence,
                     "model_confidence": model_confidence,
-                    "agreement_confidence": agreement_confidence
+                    "agreement_confidence": agreement_confidence,
+                    "dispersion_confidence": dispersion_confidence,
+                    "prediction_interval": interval
                 }
             
             return confidence_scores
@@ -430,6 +696,95 @@ class MLPredictionsService:
             print(f"⚠️ Error calculating confidence: {str(e)}")
             return {symbol: {"overall_confidence": 0.5} for symbol in predictions.keys()}
 
+    def calculate_forest_dispersion(self, models, X, n_outputs=1):
+        """
+        Per-symbol spread of the individual tree predictions, combined with the
+        out-of-bag residual variance into a 90% prediction interval.
+        Arrays are (n_symbols, n_outputs).
+        """
+        try:
+            if 'random_forest' not in models or len(X) == 0:
+                return None
+            
+            forest = models['random_forest']
+            tree_predictions = np.stack([
+                self.as_output_matrix(tree.predict(X), n_outputs) for tree in forest.estimators_
+            ])
+            center = tree_predictions.mean(axis=0)
+            tree_std = tree_predictions.std(axis=0)
+            
+            oob_mse = getattr(forest, 'oob_mse_', None)
+            total_std = np.sqrt(tree_std ** 2 + (oob_mse if oob_mse is not None else 0.0))
+            
+            return {
+                'std': tree_std,
+                'lower': center - 1.645 * total_std,
+                'upper': center + 1.645 * total_std
+            }
+            
+        except Exception as e:
+            print(f"⚠️ Error calculating forest dispersion: {str(e)}")
+            return None
+
+    def get_oob_mse(self, models, X, y):
+        """
+        Out-of-bag mean squared error of the fitted forest, one value per target
+        column. After a warm start the older trees were bootstrapped from an
+        earlier window, so their "unsampled" rows of the current window may be
+        rows they were trained on: only the trees fit on this window are used.
+        """
+        forest = models.get('random_forest')
+        if forest is None or not hasattr(forest, 'estimators_'):
+            return None
+        
+        if not hasattr(forest, 'oob_mse_'):
+            window_trees = getattr(forest, 'window_trees_', len(forest.estimators_))
+            forest.oob_mse_, forest.oob_r2_ = self.compute_oob_errors(forest.estimators_[-window_trees:], X, y)
+        
+        return forest.oob_mse_
+
+    def compute_oob_errors(self, trees, X, y):
+        """
+        Out-of-bag MSE per target column and R² of a set of trees: each row is
+        predicted by the trees whose bootstrap left it out. Rows drawn into
+        every bootstrap have no out-of-bag prediction and are skipped.
+        """
+        X = np.asarray(X)
+        targets = np.asarray(y, dtype=float).reshape(len(y), -1)
+        n_samples, n_outputs = targets.shape
+        totals = np.zeros_like(targets)
+        counts = np.zeros(n_samples)
+        
+        for tree in trees:
+            unsampled = self.unsampled_rows(tree, n_samples)
+            if len(unsampled):
+                totals[unsampled] += self.as_output_matrix(tree.predict(X[unsampled]), n_outputs)
+                counts[unsampled] += 1
+        
+        valid = counts > 0
+        if not valid.any():
+            return None, None
+        
+        residuals = totals[valid] / counts[valid, None] - targets[valid]
+        mse = np.mean(residuals ** 2, axis=0)
+        variance = targets[valid].var(axis=0)
+        r2 = 1.0 - np.divide(mse, variance, out=np.zeros(n_outputs), where=variance > 0)
+        return mse, round(float(r2.mean()), 4)
+
+    def unsampled_rows(self, tree, n_samples):
+        """Rows left out of a tree's bootstrap (the same draw the forest made from the tree's seed)"""
+        drawn = np.random.RandomState(tree.random_state).randint(0, n_samples, n_samples)
+        return np.flatnonzero(np.bincount(drawn, minlength=n_samples) == 0)
+
+    def fit_target(self, y):
+        """Single-horizon targets are fitted as 1-D so the models stay single-output"""
+        y = np.asarray(y)
+        return y[:, 0] if y.ndim == 2 and y.shape[1] == 1 else y
+
+    def as_output_matrix(self, predictions, n_outputs):
+        """Reshape model output to (n_samples, n_outputs)"""
+        return np.asarray(predictions, dtype=float).reshape(-1, n_outputs)
+
     def validate_predictions(self, predictions, confidence_scores):
         """
         Validate and adjust predictions based on confidence and reasonableness
@@ -468,18 +823,21 @@ class MLPredictionsService:
         try:
             if 'random_forest' in models and len(X) > 5:
                 rf_pred = models['random_forest'].predict(X)
+                oob_mse = self.get_oob_mse(models, X, y)
                 metrics['random_forest'] = {
-                    'mse': mean_squared_error(y, rf_pred),
-                    'mae': mean_absolute_error(y, rf_pred),
-                    'feature_importance': models['random_forest'].feature_importances_.tolist()
+                    'mse': mean_squared_error(self.fit_target(y), rf_pred),
+                    'mae': mean_absolute_error(self.fit_target(y), rf_pred),
+                    'feature_importance': models['random_forest'].feature_importances_.tolist(),
+                    'oob_mse': oob_mse.tolist() if oob_mse is not None else None,
+                    'oob_r2': getattr(models['random_forest'], 'oob_r2_', None)
                 }
             
             if 'linear' in models and len(X) > 5:
                 X_scaled = models.get('scaler', StandardScaler()).transform(X) if 'scaler' in models else X
                 linear_pred = models['linear'].predict(X_scaled)
                 metrics['linear'] = {
-                    'mse': mean_squared_error(y, linear_pred),
-                    'mae': mean_absolute_error(y, linear_pred),
+                    'mse': mean_squared_error(self.fit_target(y), linear_pred),
+                    'mae': mean_absolute_error(self.fit_target(y), linear_pred),
                     'coefficients': models['linear'].coef_.tolist() if hasattr(models['linear'], 'coef_') else []
                 }
             
@@ -525,7 +883,22 @@ class MLPredictionsService:
         return max(-0.5, min(1.0, synthetic_return))
 
     def generate_fallback_predictions(self, symbols, horizon, error=None):
-        """Generate simple fallback predictions when ML fails"""
+        """Generate simple fallback predictions when ML fails (horizon may be a list)"""
+        if isinstance(horizon, (list, tuple)):
+            fallback_predictions = {f"{h}d": self.generate_fallback_horizon(symbols, h) for h in horizon}
+        else:
+            fallback_predictions = self.generate_fallback_horizon(symbols, horizon)
+        
+        return {
+            "success": False,
+            "error": error,
+            "predictions": fallback_predictions,
+            "fallback_mode": True,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def generate_fallback_horizon(self, symbols, horizon):
+        """Fallback predictions for a single horizon"""
         fallback_predictions = {}
         
         for symbol in symbols:
@@ -541,13 +914,7 @@ class MLPredictionsService:
                 "warning": "Using fallback prediction - ML models unavailable"
             }
         
-        return {
-            "success": False,
-            "error": error,
-            "predictions": fallback_predictions,
-            "fallback_mode": True,
-            "timestamp": datetime.now().isoformat()
-        }
+        return fallback_predictions
 
     def generate_simple_fallback_predictions(self, symbols):
         """Generate very simple predictions as last resort"""
@@ -567,15 +934,21 @@ class MLPredictionsService:
 def main():
     """Main entry point for the ML predictions service"""
     try:
-        # Read input from command line
-        if len(sys.argv) > 1:
+        # Read input from command line (inline JSON or the PythonBridge data file)
+        if len(sys.argv) > 1 and os.path.isfile(sys.argv[1]):
+            with open(sys.argv[1], 'r') as f:
+                input_data = json.load(f)
+        elif len(sys.argv) > 1:
             input_data = json.loads(sys.argv[1])
         else:
             input_data = json.loads(sys.stdin.read())
         
         # Create service instance and generate predictions
         ml_service = MLPredictionsService()
-        result = ml_service.generate_predictions(input_data)
+        if input_data.get('action') == 'update_feature_store':
+            result = ml_service.update_feature_store(input_data)
+        else:
+            result = ml_service.generate_predictions(input_data)
         
         # Output result as JSON
         print(json.dumps(result, indent=2))
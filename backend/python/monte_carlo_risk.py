@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Monte Carlo Portfolio Risk for Portfolio AI
+VaR and expected shortfall over several horizons and confidence levels:
+closed form for normal returns, simulated for Student-t tails in fixed-size
+chunks with a seeded generator and across all cores
+Part of Phase 5: AI-Powered Investment Intelligence
+"""
+
+import os
+import sys
+import json
+import numpy as np
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import norm
+
+from risk_model import TRADING_DAYS
+
+MONTE_CARLO_DEFAULTS = {
+    'method': 'auto',                   # 'auto' = closed form for normal returns, 'simulation' always simulates
+    'n_paths': 100000,
+    'horizons': [1, 10, 21],            # Trading days
+    'confidence_levels': [0.95, 0.99],
+    'student_t_dof': None,              # None = normal daily returns
+    'seed': 42,
+    'memory_budget_mb': 64,             # Per-chunk simulation buffer
+    'max_workers': None,                # Defaults to all cores
+    'min_parallel_paths': 500000        # Smaller runs stay in-process
+}
+
+
+def portfolio_daily_moments(weights, covariance, expected_returns=None):
+    """
+    Daily mean and volatility of the portfolio return w'r from annualized
+    inputs. The volatility is |L'w| for the Cholesky factor L of the
+    covariance (eigen-repaired when not positive definite).
+    """
+    weights = np.asarray(weights, dtype=float)
+    covariance = np.asarray(covariance, dtype=float)
+    try:
+        factor = np.linalg.cholesky(covariance)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        factor = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0.0))
+
+    daily_volatility = float(np.linalg.norm(factor.T @ weights)) / np.sqrt(TRADING_DAYS)
+    daily_mean = float(np.dot(weights, expected_returns)) / TRADING_DAYS if expected_returns is not None else 0.0
+    return daily_mean, daily_volatility
+
+
+def normal_var(daily_mean, daily_volatility, horizons, confidence_levels, portfolio_value=None):
+    """
+    VaR and expected shortfall of compounded normal daily returns without
+    simulation. Each day's growth 1 + r is taken as lognormal with the same
+    mean and variance, so h-day log growth is N(h m, h s^2) and
+        VaR = 1 - exp(h m - z_c s sqrt(h))
+        ES  = 1 - exp(h m + h s^2 / 2) Phi(-z_c - s sqrt(h)) / (1 - c)
+    This matches simulated compounding to within about 1% of the loss for
+    daily volatilities up to a few percent.
+    """
+    log_variance = np.log1p(daily_volatility ** 2 / (1.0 + daily_mean) ** 2)
+    log_mean = np.log1p(daily_mean) - log_variance / 2
+    results = {}
+    for horizon in horizons:
+        mean, volatility = horizon * log_mean, np.sqrt(horizon * log_variance)
+        levels = {}
+        for confidence in confidence_levels:
+            z = norm.ppf(confidence)
+            var = float(1.0 - np.exp(mean - z * volatility))
+            expected_shortfall = float(
+                1.0 - np.exp(mean + volatility ** 2 / 2) * norm.cdf(-z - volatility) / (1 - confidence)
+            )
+            levels[f"{confidence:g}"] = {
+                'var_percent': round(var * 100, 4),
+                'expected_shortfall_percent': round(expected_shortfall * 100, 4),
+                'var': round(var * portfolio_value, 2) if portfolio_value else None,
+                'expected_shortfall': round(expected_shortfall * portfolio_value, 2) if portfolio_value else None
+            }
+        results[f"{horizon}d"] = levels
+    return results
+
+
+def simulate_tail_losses(task):
+    """
+    Simulate one chunk of paths and keep only its largest `tail_size` losses
+    per horizon, which is all VaR and expected shortfall need.
+
+    Each day the correlated asset returns are L z (scaled by sqrt((dof - 2) / chi2)
+    for Student-t tails); projected on the weights that is exactly
+    mean + |L'w| * z with one scalar draw, so a path costs one number per day
+    instead of one per holding.
+    """
+    seed_sequence, n_paths, horizons, daily_mean, daily_volatility, dof, tail_size = task
+    rng = np.random.default_rng(seed_sequence)
+    max_horizon = max(horizons)
+
+    shocks = rng.standard_normal((n_paths, max_horizon))
+    if dof and dof > 2:
+        shocks *= np.sqrt((dof - 2) / rng.chisquare(dof, size=(n_paths, max_horizon)))
+    growth = np.cumprod(1.0 + daily_mean + daily_volatility * shocks, axis=1)
+
+    tails = {}
+    for horizon in horizons:
+        losses = 1.0 - growth[:, horizon - 1]
+        keep = min(tail_size, n_paths)
+        tails[horizon] = np.partition(losses, n_paths - keep)[n_paths - keep:]
+    return tails
+
+
+def merge_tails(running, chunk_tails, tail_size):
+    """Fold a chunk's tail losses into the running largest `tail_size` per horizon"""
+    for horizon, losses in chunk_tails.items():
+        combined = np.concatenate([running[horizon], losses]) if horizon in running else losses
+        if len(combined) > tail_size:
+            combined = np.partition(combined, len(combined) - tail_size)[len(combined) - tail_size:]
+        running[horizon] = combined
+    return running
+
+
+def monte_carlo_var(weights, covariance, expected_returns=None, portfolio_value=None, params=None):
+    """
+    VaR and expected shortfall of the portfolio return over each horizon at
+    each confidence level. Weights are fractions; covariance and expected
+    returns are annualized. The portfolio return only depends on sqrt(w'Σw),
+    so normal returns use the closed form (normal_var) unless method is
+    'simulation'. Simulations hold one chunk of paths plus the worst
+    (1 - min confidence) share of outcomes per horizon, whatever the path count.
+    """
+    params = {**MONTE_CARLO_DEFAULTS, **(params or {})}
+    n_paths = int(params['n_paths'])
+    horizons = sorted({max(1, int(h)) for h in params['horizons']})
+    confidence_levels = sorted(float(c) for c in params['confidence_levels'])
+    dof = params['student_t_dof']
+
+    daily_mean, daily_volatility = portfolio_daily_moments(weights, covariance, expected_returns)
+
+    if params['method'] != 'simulation' and not (dof and dof > 2):
+        return {
+            'horizons': normal_var(daily_mean, daily_volatility, horizons, confidence_levels, portfolio_value),
+            'method': 'closed_form',
+            'distribution': 'normal',
+            'daily_volatility': round(daily_volatility, 6)
+        }
+
+    # Chunk size from the memory budget: shocks, chi-square draws and growth per path-day
+    bytes_per_path = max(horizons) * 8 * 3
+    chunk_size = max(1000, int(params['memory_budget_mb'] * 1024 * 1024 // bytes_per_path))
+    chunk_sizes = [chunk_size] * (n_paths // chunk_size) + ([n_paths % chunk_size] if n_paths % chunk_size else [])
+    tail_size = int(np.ceil((1 - confidence_levels[0]) * n_paths))
+
+    # One child seed per chunk: results do not depend on the number of workers
+    seeds = np.random.SeedSequence(params['seed']).spawn(len(chunk_sizes))
+    tasks = [
+        (seed, size, horizons, daily_mean, daily_volatility, dof, tail_size)
+        for seed, size in zip(seeds, chunk_sizes)
+    ]
+
+    workers = 1
+    if n_paths >= params['min_parallel_paths']:
+        workers = max(1, min(int(params['max_workers'] or os.cpu_count() or 1), len(tasks)))
+
+    tails = {}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_tails in executor.map(simulate_tail_losses, tasks):
+                merge_tails(tails, chunk_tails, tail_size)
+    else:
+        for task in tasks:
+            merge_tails(tails, simulate_tail_losses(task), tail_size)
+
+    results = {}
+    for horizon in horizons:
+        worst_first = np.sort(tails[horizon])[::-1]
+        levels = {}
+        for confidence in confidence_levels:
+            k = max(1, int(np.ceil((1 - confidence) * n_paths)))
+            var = float(worst_first[k - 1])
+            expected_shortfall = float(worst_first[:k].mean())
+            levels[f"{confidence:g}"] = {
+                'var_percent': round(var * 100, 4),
+                'expected_shortfall_percent': round(expected_shortfall * 100, 4),
+                'var': round(var * portfolio_value, 2) if portfolio_value else None,
+                'expected_shortfall': round(expected_shortfall * portfolio_value, 2) if portfolio_value else None
+            }
+        results[f"{horizon}d"] = levels
+
+    return {
+        'horizons': results,
+        'method': 'simulation',
+        'paths': n_paths,
+        'chunks': len(tasks),
+        'chunk_size': chunk_size,
+        'workers': workers,
+        'distribution': f"student_t({dof})" if dof and dof > 2 else 'normal',
+        'daily_volatility': round(daily_volatility, 6),
+        'seed': params['seed']
+    }
+
+
+def main():
+    """Monte Carlo VaR from a JSON file with weights and an annualized covariance"""
+    try:
+        if len(sys.argv) < 2:
+            print(json.dumps({'error': 'Usage: python monte_carlo_risk.py <input.json>'}))
+            sys.exit(1)
+
+        with open(sys.argv[1], 'r') as f:
+            input_data = json.load(f)
+
+        result = monte_carlo_var(
+            input_data['weights'], input_data['covariance'],
+            expected_returns=input_data.get('expected_returns'),
+            portfolio_value=input_data.get('portfolio_value'),
+            params=input_data.get('monte_carlo', {})
+        )
+        print(json.dumps({'success': True, **result, 'timestamp': datetime.now().isoformat()}, indent=2))
+
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': str(e)}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Performance Attribution for Portfolio AI
+Brinson-Fachler sector attribution (allocation, selection, interaction) of a
+portfolio against a benchmark such as the S&P 500 snapshot in data-backups,
+computed daily as group-bys over sector codes and linked across periods
+Part of Phase 5: AI-Powered Investment Intelligence
+"""
+
+import os
+import sys
+import json
+import glob
+import numpy as np
+from datetime import datetime
+
+from risk_model import TRADING_DAYS, align_returns, history_coverage
+
+BENCHMARK_BACKUP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data-backups')
+BENCHMARK_PATTERN = 'sp500_*.json'
+
+
+def load_benchmark_snapshot(path=None):
+    """
+    Constituents of a benchmark snapshot (the newest S&P 500 backup by default)
+    as {symbol: {'sector', 'weight'}} with market-cap weights, plus its source
+    """
+    if path is None:
+        snapshots = sorted(glob.glob(os.path.join(BENCHMARK_BACKUP_DIR, BENCHMARK_PATTERN)))
+        if not snapshots:
+            raise FileNotFoundError(f"No benchmark snapshot matching {BENCHMARK_PATTERN} in {BENCHMARK_BACKUP_DIR}")
+        path = snapshots[-1]
+
+    with open(path, 'r') as f:
+        snapshot = json.load(f)
+    companies = snapshot.get('companies', snapshot) if isinstance(snapshot, dict) else snapshot
+
+    constituents = {}
+    for company in companies:
+        market_cap = float(company.get('marketCap') or company.get('market_cap') or 0)
+        if company.get('symbol') and market_cap > 0:
+            constituents[company['symbol']] = {'sector': company.get('sector') or 'Unknown', 'weight': market_cap}
+    total = sum(c['weight'] for c in constituents.values())
+    for constituent in constituents.values():
+        constituent['weight'] /= total
+    return constituents, os.path.basename(path)
+
+
+def drifted_weights(end_values, returns):
+    """
+    Beginning-of-day weights[T, n] of a buy-and-hold position set that is
+    worth `end_values` after the last day: values at the start of day t are
+    end_values * G[t-1] / G[T-1] with G the cumulative growth.
+    """
+    growth = np.cumprod(1.0 + returns, axis=0)
+    start_of_day = np.vstack([np.ones((1, returns.shape[1])), growth[:-1]])
+    values = start_of_day / growth[-1] * end_values
+    totals = values.sum(axis=1, keepdims=True)
+    return np.divide(values, totals, out=np.zeros_like(values), where=totals > 0)
+
+
+def brinson_fachler(portfolio_weights, benchmark_weights, returns, sector_codes, n_sectors):
+    """
+    Daily Brinson-Fachler effects[T, k] by sector, with security weights and
+    returns [T, n] aggregated to sectors by one matrix product each:
+
+        allocation  = (wp - wb)(rb - Rb)
+        selection   = wb (rp - rb)
+        interaction = (wp - wb)(rp - rb)
+
+    Sectors the portfolio does not hold take rp = rb, and sectors outside the
+    benchmark take rb = rp, so off-benchmark bets count as allocation. The
+    three effects sum to Rp - Rb each day.
+    """
+    membership = np.zeros((len(sector_codes), n_sectors))
+    membership[np.arange(len(sector_codes)), sector_codes] = 1.0
+
+    wp = portfolio_weights @ membership
+    wb = benchmark_weights @ membership
+    contribution_p = (portfolio_weights * returns) @ membership
+    contribution_b = (benchmark_weights * returns) @ membership
+
+    rp = np.divide(contribution_p, wp, out=np.zeros_like(wp), where=wp > 0)
+    rb = np.divide(contribution_b, wb, out=np.zeros_like(wb), where=wb > 0)
+    rp = np.where(wp > 0, rp, rb)
+    rb = np.where(wb > 0, rb, rp)
+
+    portfolio_return = contribution_p.sum(axis=1)
+    benchmark_return = contribution_b.sum(axis=1)
+    active_weight = wp - wb
+    effects = {
+        'allocation': active_weight * (rb - benchmark_return[:, None]),
+        'selection': wb * (rp - rb),
+        'interaction': active_weight * (rp - rb)
+    }
+    return effects, portfolio_return, benchmark_return, {'wp': wp, 'wb': wb, 'rp': rp, 'rb': rb}
+
+
+def carino_factors(portfolio_return, benchmark_return):
+    """
+    Carino log-linking coefficients k_t / K so that daily arithmetic effects
+    sum to the compounded active return over the whole period
+    """
+    def log_ratio(rp, rb):
+        rp, rb = np.asarray(rp, dtype=float), np.asarray(rb, dtype=float)
+        difference = rp - rb
+        same = np.abs(difference) < 1e-12
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = (np.log1p(rp) - np.log1p(rb)) / np.where(same, 1.0, difference)
+        return np.where(same, 1.0 / (1.0 + rp), ratio)
+
+    total_p = np.prod(1.0 + portfolio_return) - 1.0
+    total_b = np.prod(1.0 + benchmark_return) - 1.0
+    return log_ratio(portfolio_return, benchmark_return) / log_ratio(total_p, total_b), total_p, total_b
+
+
+def sector_attribution(holdings, price_histories, benchmark=None, benchmark_path=None, window=TRADING_DAYS):
+    """
+    Linked Brinson-Fachler attribution of a portfolio against a benchmark over
+    the last `window` days of aligned returns.
+
+    holdings: list of {symbol, market_value, sector}; benchmark: {symbol:
+    {'sector', 'weight'}} or the snapshot at benchmark_path (newest S&P 500
+    backup by default). Positions and benchmark weights are held through the
+    window, so earlier weights drift back from the current ones. Benchmark
+    constituents without a price history, and constituents or holdings whose
+    history does not cover the window (history_coverage), are left out and
+    the rest reweighted, so one short history does not shorten the window.
+    """
+    source = 'input'
+    if benchmark is None:
+        benchmark, source = load_benchmark_snapshot(benchmark_path)
+
+    # Portfolio values per symbol; benchmark members keep the benchmark's sector
+    portfolio_values, sectors = {}, {}
+    for holding in holdings:
+        symbol = holding['symbol']
+        portfolio_values[symbol] = portfolio_values.get(symbol, 0.0) + float(holding['market_value'])
+        sectors.setdefault(symbol, holding.get('sector') or 'Unknown')
+    for symbol, constituent in benchmark.items():
+        sectors[symbol] = constituent.get('sector') or 'Unknown'
+
+    missing = [symbol for symbol in portfolio_values if not price_histories.get(symbol)]
+    if missing:
+        raise ValueError(f"Missing price history for holdings: {', '.join(missing[:10])}")
+    priced = list(dict.fromkeys(list(portfolio_values) + [symbol for symbol in benchmark if price_histories.get(symbol)]))
+    covered = history_coverage([len(price_histories[symbol]) for symbol in priced], window)
+    universe = [symbol for symbol, full in zip(priced, covered) if full]
+    short_history = [symbol for symbol, full in zip(priced, covered) if not full]
+    excluded_holdings = [symbol for symbol in short_history if symbol in portfolio_values]
+    if len(excluded_holdings) == len(portfolio_values):
+        raise ValueError("No holding has enough price history for attribution")
+    benchmark_symbols = [symbol for symbol in universe if symbol in benchmark]
+    if not benchmark_symbols:
+        raise ValueError("No benchmark constituent has enough price history for attribution")
+
+    dates, returns = align_returns(price_histories, universe, window)
+    if len(returns) < 2:
+        raise ValueError("Not enough aligned price history for attribution")
+
+    sector_names = list(dict.fromkeys(sectors[symbol] for symbol in universe))
+    sector_index = {name: k for k, name in enumerate(sector_names)}
+    sector_codes = np.array([sector_index[sectors[symbol]] for symbol in universe])
+
+    portfolio_end = np.array([portfolio_values.get(symbol, 0.0) for symbol in universe])
+    benchmark_end = np.array([benchmark[symbol]['weight'] if symbol in benchmark else 0.0 for symbol in universe])
+    portfolio_weights = drifted_weights(portfolio_end, returns)
+    benchmark_weights = drifted_weights(benchmark_end, returns)
+
+    effects, portfolio_return, benchmark_return, sector_series = brinson_fachler(
+        portfolio_weights, benchmark_weights, returns, sector_codes, len(sector_names)
+    )
+    linking, total_p, total_b = carino_factors(portfolio_return, benchmark_return)
+    linked = {name: linking @ daily for name, daily in effects.items()}
+
+    sector_results = []
+    for k, name in enumerate(sector_names):
+        total = float(sum(linked[effect][k] for effect in linked))
+        sector_results.append({
+            'sector': name,
+            'portfolio_weight': round(float(sector_series['wp'][:, k].mean() * 100), 2),
+            'benchmark_weight': round(float(sector_series['wb'][:, k].mean() * 100), 2),
+            'portfolio_return': round(float(np.prod(1.0 + sector_series['rp'][:, k]) - 1.0) * 100, 2),
+            'benchmark_return': round(float(np.prod(1.0 + sector_series['rb'][:, k]) - 1.0) * 100, 2),
+            **{effect: round(float(linked[effect][k]) * 100, 4) for effect in linked},
+            'total': round(total * 100, 4)
+        })
+    sector_results.sort(key=lambda s: abs(s['total']), reverse=True)
+
+    return {
+        'portfolio_return': round(float(total_p) * 100, 4),
+        'benchmark_return': round(float(total_b) * 100, 4),
+        'active_return': round(float(total_p - total_b) * 100, 4),
+        'effects': {effect: round(float(values.sum()) * 100, 4) for effect, values in linked.items()},
+        'sectors': sector_results,
+        'periods': int(len(returns)),
+        'start_date': dates[0] if dates else None,
+        'end_date': dates[-1] if dates else None,
+        'linking': 'carino',
+        'excluded_holdings': excluded_holdings,
+        'excluded_weight': round(sum(portfolio_values[symbol] for symbol in excluded_holdings)
+                                 / sum(portfolio_values.values()) * 100, 2) if excluded_holdings else 0.0,
+        'benchmark': {
+            'source': source,
+            'constituents': len(benchmark_symbols),
+            'missing_history': sum(1 for symbol in benchmark if not price_histories.get(symbol)),
+            'short_history': sum(1 for symbol in short_history if symbol in benchmark)
+        }
+    }
+
+
+def main():
+    """Sector attribution of holdings against a benchmark from a JSON file"""
+    try:
+        if len(sys.argv) < 2:
+            print(json.dumps({'error': 'Usage: python performance_attribution.py <input.json>'}))
+            sys.exit(1)
+
+        with open(sys.argv[1], 'r') as f:
+            input_data = json.load(f)
+
+        holdings = [
+            {**h, 'market_value': h.get('market_value', float(h.get('shares', 0)) * float(h.get('price', 0)))}
+            for h in input_data.get('holdings', [])
+        ]
+        result = sector_attribution(
+            holdings, input_data.get('price_history', {}),
+            benchmark=input_data.get('benchmark'), benchmark_path=input_data.get('benchmark_path'),
+            window=int(input_data.get('window', TRADING_DAYS))
+        )
+        print(json.dumps({'success': True, **result, 'timestamp': datetime.now().isoformat()}, indent=2))
+
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': str(e)}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
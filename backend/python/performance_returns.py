@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Performance Returns for Portfolio AI
+Daily NAV, time-weighted returns and money-weighted IRR of accounts from a
+transaction ledger and daily prices; valuations are cumulative sums over the
+ledger and the IRR of every account is one vectorized Newton solve
+Part of Phase 5: AI-Powered Investment Intelligence
+"""
+
+import sys
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from risk_model import parse_price_history
+
+DAYS_PER_YEAR = 365.25
+
+# Ledger actions (same records as the portfolio routes: date, symbol, action,
+# quantity, price, fees, account). DEPOSIT/WITHDRAWAL are external cash flows;
+# accounts without them are valued as securities only, with every trade and
+# dividend treated as money moving in or out of the account.
+CASH_ACTIONS = ('DIVIDEND', 'DEPOSIT', 'WITHDRAWAL', 'FEE')
+
+IRR_DEFAULTS = {
+    'guess': 0.1,           # Starting annual rate
+    'tolerance': 1e-10,     # On the continuous rate
+    'max_iterations': 100
+}
+
+
+def parse_ledger(transactions):
+    """
+    Ledger as columns: account, date, symbol and per-row quantity change, cash
+    change and external flow (contributions positive)
+    """
+    ledger = pd.DataFrame(transactions)
+    if ledger.empty:
+        raise ValueError('No transactions provided')
+
+    for column, default in (('account', 'default'), ('symbol', ''), ('quantity', 0.0), ('price', 0.0), ('fees', 0.0)):
+        if column not in ledger:
+            ledger[column] = default
+    ledger['account'] = ledger['account'].fillna('default').astype(str)
+    ledger['date'] = ledger['date'].astype(str).str[:10]
+    ledger['symbol'] = ledger['symbol'].fillna('').astype(str).str.upper()
+    action = ledger['action'].astype(str).str.upper()
+    quantity = pd.to_numeric(ledger['quantity'], errors='coerce').fillna(0.0).abs().to_numpy()
+    price = pd.to_numeric(ledger['price'], errors='coerce').fillna(0.0).to_numpy()
+    fees = pd.to_numeric(ledger['fees'], errors='coerce').fillna(0.0).to_numpy()
+    amount = quantity * price
+    if 'amount' in ledger:
+        amount = pd.to_numeric(ledger['amount'], errors='coerce').abs().fillna(pd.Series(amount)).to_numpy()
+
+    buy, sell = (action == 'BUY').to_numpy(), (action == 'SELL').to_numpy()
+    unknown = ~(action.isin(('BUY', 'SELL') + CASH_ACTIONS)).to_numpy()
+    if unknown.any():
+        raise ValueError(f"Unsupported transaction actions: {', '.join(sorted(set(action[unknown])))}")
+
+    ledger['quantity_change'] = np.where(buy, quantity, 0.0) - np.where(sell, quantity, 0.0)
+    ledger['cash_change'] = (
+        np.where(sell, quantity * price, 0.0) - np.where(buy, quantity * price, 0.0) - fees
+        + np.where((action == 'DIVIDEND') | (action == 'DEPOSIT'), amount, 0.0)
+        - np.where((action == 'WITHDRAWAL') | (action == 'FEE'), amount, 0.0)
+    )
+    ledger['external_flow'] = np.where(action == 'DEPOSIT', amount, 0.0) - np.where(action == 'WITHDRAWAL', amount, 0.0)
+    ledger['trade_price'] = np.where(buy | sell, price, np.nan)
+    return ledger.sort_values('date', kind='stable').reset_index(drop=True)
+
+
+def price_matrix(price_histories, ledger):
+    """
+    Calendar (price dates and ledger dates from the first transaction on) and
+    prices[T, n] for the traded symbols, forward-filled; before a symbol's
+    history starts it is valued at its last trade price
+    """
+    symbols = sorted(set(ledger['symbol'][ledger['quantity_change'] != 0]))
+    series = {}
+    for symbol in symbols:
+        dates, prices = parse_price_history(price_histories.get(symbol) or [])
+        if dates is not None and len(dates):
+            series[symbol] = pd.Series(prices, index=dates).groupby(level=0).last()
+
+    start = ledger['date'].iloc[0]
+    calendar = sorted(set(ledger['date']).union(*(s.index for s in series.values())))
+    calendar = [date for date in calendar if date >= start]
+
+    history = pd.DataFrame(series, index=calendar, columns=symbols, dtype=float)
+    traded = ledger.dropna(subset=['trade_price'])
+    seeds = traded.pivot_table(index='date', columns='symbol', values='trade_price', aggfunc='last')
+    seeds = seeds.reindex(index=calendar, columns=symbols)
+    prices = history.ffill().combine_first(seeds.ffill())
+    return calendar, symbols, prices.fillna(0.0).to_numpy()
+
+
+def account_nav(rows, calendar_length, prices, column_of):
+    """
+    Daily valuation of one account from its ledger rows, from its first
+    transaction day: positions and cash are cumulative sums of the per-day
+    changes. Returns (first day, nav, external flows), both arrays per day.
+    """
+    days = rows['day'].to_numpy()
+    first = int(days.min())
+    offsets = days - first
+    length = calendar_length - first
+
+    traded = rows['quantity_change'].to_numpy() != 0
+    symbols = rows['symbol'][traded].to_numpy()
+    columns = np.array([column_of[symbol] for symbol in symbols], dtype=int)
+    account_columns, local = np.unique(columns, return_inverse=True)
+    quantity_changes = np.zeros((length, len(account_columns)))
+    np.add.at(quantity_changes, (offsets[traded], local), rows['quantity_change'].to_numpy()[traded])
+    positions = np.cumsum(quantity_changes, axis=0)
+    holdings_value = np.einsum('ij,ij->i', positions, prices[first:, account_columns])
+
+    cash_changes = np.bincount(offsets, weights=rows['cash_change'].to_numpy(), minlength=length)
+    if (rows['external_flow'] != 0).any():
+        flows = np.bincount(offsets, weights=rows['external_flow'].to_numpy(), minlength=length)
+        nav = holdings_value + np.cumsum(cash_changes)
+    else:
+        flows = -cash_changes
+        nav = holdings_value
+    return first, nav, flows
+
+
+def daily_returns(nav, flows):
+    """
+    Daily returns net of external flows, booked at the end of the day: the
+    day's return is earned on the previous NAV, r = (nav - flow) / previous - 1.
+    From an empty account the day's inflow is the base instead, so a purchase
+    returns its close against the trade price.
+    """
+    previous = np.concatenate([[0.0], nav[:-1]])
+    base = np.where(previous > 0, previous, np.maximum(flows, 0.0))
+    return np.divide(nav - previous - flows, base, out=np.zeros_like(nav), where=base > 0)
+
+
+def solve_irr(account_index, times, amounts, n_accounts, params=None):
+    """
+    Annual money-weighted return of many accounts at once: Newton iterations on
+    the continuous rate x of NPV(x) = sum(amount * exp(-x * t)) = 0, with the
+    NPV and its derivative of every account as one bincount over all cash
+    flows. Accounts whose flows never change sign have no IRR (NaN).
+    Returns (irr, converged)
+    """
+    params = {**IRR_DEFAULTS, **(params or {})}
+    rate = np.full(n_accounts, np.log1p(params['guess']))
+    converged = np.zeros(n_accounts, dtype=bool)
+
+    has_inflow = np.bincount(account_index, weights=(amounts > 0).astype(float), minlength=n_accounts) > 0
+    has_outflow = np.bincount(account_index, weights=(amounts < 0).astype(float), minlength=n_accounts) > 0
+    solvable = has_inflow & has_outflow
+
+    for _ in range(int(params['max_iterations'])):
+        discounted = amounts * np.exp(-rate[account_index] * times)
+        npv = np.bincount(account_index, weights=discounted, minlength=n_accounts)
+        slope = np.bincount(account_index, weights=-times * discounted, minlength=n_accounts)
+        step = np.divide(npv, slope, out=np.zeros(n_accounts), where=slope != 0)
+        step = np.clip(step, -1.0, 1.0) * (solvable & ~converged)
+        rate = np.clip(rate - step, -20.0, 20.0)
+        converged |= solvable & (np.abs(step) < params['tolerance'])
+        if converged[solvable].all():
+            break
+
+    irr = np.where(solvable, np.expm1(rate), np.nan)
+    return irr, converged
+
+
+def calculate_account_returns(transactions, price_histories, include_series=False, irr_params=None):
+    """
+    NAV, time-weighted and money-weighted returns of every account in the
+    ledger, valued on the price calendar through its last date. Both returns
+    cover the whole period; their annualized forms need at least a year.
+    """
+    ledger = parse_ledger(transactions)
+    calendar, symbols, prices = price_matrix(price_histories or {}, ledger)
+    column_of = {symbol: j for j, symbol in enumerate(symbols)}
+    ledger['day'] = np.minimum(np.searchsorted(np.array(calendar), ledger['date'].to_numpy(dtype=str)), len(calendar) - 1)
+    calendar_times = pd.to_datetime(pd.Series(calendar)).to_numpy()
+
+    accounts, valuations = [], []
+    flow_accounts, flow_times, flow_amounts = [], [], []
+    for index, (account, rows) in enumerate(ledger.groupby('account', sort=False)):
+        first, nav, flows = account_nav(rows, len(calendar), prices, column_of)
+        years = (calendar_times[first:] - calendar_times[first]) / np.timedelta64(1, 'D') / DAYS_PER_YEAR
+
+        # Investor's cash flows: contributions out, the ending NAV back in
+        moved = np.flatnonzero(flows)
+        flow_accounts.append(np.full(len(moved) + 1, index))
+        flow_times.append(np.append(years[moved], years[-1]))
+        flow_amounts.append(np.append(-flows[moved], nav[-1]))
+
+        accounts.append(account)
+        valuations.append((first, nav, flows, years))
+
+    irr, converged = solve_irr(np.concatenate(flow_accounts), np.concatenate(flow_times),
+                               np.concatenate(flow_amounts), len(accounts), irr_params)
+
+    results = {}
+    for index, (account, (first, nav, flows, years)) in enumerate(zip(accounts, valuations)):
+        growth = np.cumprod(1.0 + daily_returns(nav, flows))
+        twr = float(growth[-1] - 1.0)
+        period_years = float(years[-1])
+        contributions = float(flows.sum())
+        result = {
+            'start_date': calendar[first],
+            'end_date': calendar[-1],
+            'ending_nav': round(float(nav[-1]), 2),
+            'net_contributions': round(contributions, 2),
+            'total_gain': round(float(nav[-1]) - contributions, 2),
+            'time_weighted_return': round(twr * 100, 4),
+            'annualized_time_weighted_return': (
+                round(((1.0 + twr) ** (1.0 / period_years) - 1.0) * 100, 4) if period_years >= 1 else None
+            ),
+            'money_weighted_return': (
+                round(((1.0 + float(irr[index])) ** period_years - 1.0) * 100, 4) if converged[index] else None
+            ),
+            'annualized_money_weighted_return': (
+                round(float(irr[index]) * 100, 4) if converged[index] and period_years >= 1 else None
+            ),
+            'irr_converged': bool(converged[index]),
+            'years': round(period_years, 4)
+        }
+        if include_series:
+            result['daily'] = [
+                {'date': date, 'nav': round(float(value), 2), 'flow': round(float(flow), 2),
+                 'twr_index': round(float(index_value), 6)}
+                for date, value, flow, index_value in zip(calendar[first:], nav, flows, growth)
+            ]
+        results[account] = result
+
+    return {
+        'accounts': results,
+        'summary': {
+            'accounts': len(accounts),
+            'irr_converged': int(converged.sum()),
+            'symbols': len(symbols),
+            'calendar_days': len(calendar),
+            'valuation_date': calendar[-1]
+        }
+    }
+
+
+def main():
+    """Account returns from a transaction ledger and price histories in a JSON file"""
+    try:
+        if len(sys.argv) < 2:
+            print(json.dumps({'error': 'Usage: python performance_returns.py <input.json>'}))
+            sys.exit(1)
+
+        with open(sys.argv[1], 'r') as f:
+            input_data = json.load(f)
+
+        result = calculate_account_returns(
+            input_data.get('transactions', []), input_data.get('price_history', {}),
+            include_series=bool(input_data.get('include_series', False)), irr_params=input_data.get('irr')
+        )
+        print(json.dumps({'success': True, **result, 'timestamp': datetime.now().isoformat()}, indent=2))
+
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': str(e)}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,38 @@ portfolio_metrics.py - Advanced Portfolio Performance Metrics
 Calculates comprehensive portfolio analytics and risk metrics using scientific Python libraries
 """
 
+import os
 import sys
 import json
 import numpy as np
 import pandas as pd
 from scipy import stats
 from scipy.optimize import minimize
+from concurrent.futures import ProcessPoolExecutor
 import warnings
 warnings.filterwarnings('ignore')
 
-def calculate_portfolio_metrics(portfolio_data):
+from risk_model import TRADING_DAYS, parse_price_history, align_returns, history_coverage, RollingCovariance
+from monte_carlo_risk import monte_carlo_var
+from stress_testing import estimate_stress_model, stress_test, summarize_stress_results
+from factor_model import estimate_factor_model, slice_factor_model, portfolio_exposures
+from performance_attribution import sector_attribution
+from performance_returns import calculate_account_returns
+
+FALLBACK_CORRELATION = 0.3  # For holdings whose histories do not cover the covariance window
+
+# Report VaR is closed form for normal returns; Student-t tails (student_t_dof)
+# are simulated with this many paths per account unless the caller asks for more
+REPORT_MONTE_CARLO = {'n_paths': 20000}
+
+BATCH_DEFAULTS = {
+    'max_workers': None,            # Defaults to all cores
+    'chunk_size': 25,               # Accounts per worker task
+    'min_parallel_accounts': 50     # Smaller batches run in-process
+}
+
+def calculate_portfolio_metrics(portfolio_data, monte_carlo_params=None, stress_params=None, factor_history=None,
+                                attribution_params=None, transactions=None):
     """
     Calculate comprehensive portfolio performance and risk metrics
     Returns detailed portfolio analytics and optimization insights
@@ -30,30 +52,17 @@ def calculate_portfolio_metrics(portfolio_data):
         # Process portfolio holdings
         holdings = process_portfolio_holdings(portfolio_data)
         
-        # Calculate performance metrics
-        performance_metrics = calculate_performance_metrics(holdings)
-        
-        # Calculate risk metrics
-        risk_metrics = calculate_risk_metrics(holdings)
-        
-        # Calculate diversification metrics
-        diversification_metrics = calculate_diversification_metrics(holdings)
-        
-        # Portfolio optimization analysis
-        optimization_analysis = analyze_portfolio_optimization(holdings)
+        # Covariance and factor model of the holdings, shared by the analyses
+        stress_params = {'factor_history': factor_history, **(stress_params or {})}
+        report = portfolio_report(holdings, estimate_holdings_covariance(holdings), monte_carlo_params,
+                                  estimate_holdings_stress_model(holdings, stress_params),
+                                  estimate_holdings_factor_model(holdings, factor_history), attribution_params)
         
-        # Risk-adjusted performance
-        risk_adjusted_metrics = calculate_risk_adjusted_metrics(performance_metrics, risk_metrics)
+        # Time- and money-weighted returns when the transaction ledger is available
+        if transactions:
+            report['performance']['transaction_returns'] = calculate_transaction_returns(holdings, transactions)
         
-        return {
-            'performance': performance_metrics,
-            'risk_analysis': risk_metrics,
-            'diversification': diversification_metrics,
-            'optimization': optimization_analysis,
-            'risk_adjusted': risk_adjusted_metrics,
-            'holdings_count': len(holdings),
-            'timestamp': pd.Timestamp.now().isoformat()
-        }
+        return report
         
     except Exception as e:
         return {
@@ -63,86 +72,180 @@ def calculate_portfolio_metrics(portfolio_data):
             'optimization': {}
         }
 
+def portfolio_report(holdings, covariance_model, monte_carlo_params=None, stress_model=None, factor_model=None,
+                     attribution_params=None):
+    """Performance, risk, diversification and optimization metrics of a holdings table"""
+    # Calculate performance metrics
+    performance_metrics = calculate_performance_metrics(holdings)
+    
+    # Calculate risk metrics
+    risk_metrics = calculate_risk_metrics(holdings, covariance_model, monte_carlo_params, stress_model, factor_model,
+                                          attribution_params)
+    
+    # Calculate diversification metrics
+    diversification_metrics = calculate_diversification_metrics(holdings)
+    
+    # Portfolio optimization analysis
+    optimization_analysis = analyze_portfolio_optimization(holdings, covariance_model)
+    
+    # Risk-adjusted performance
+    risk_adjusted_metrics = calculate_risk_adjusted_metrics(performance_metrics, risk_metrics)
+    
+    return {
+        'performance': performance_metrics,
+        'risk_analysis': risk_metrics,
+        'diversification': diversification_metrics,
+        'optimization': optimization_analysis,
+        'risk_adjusted': risk_adjusted_metrics,
+        'holdings_count': len(holdings),
+        'timestamp': pd.Timestamp.now().isoformat()
+    }
+
+class HoldingsTable:
+    """
+    Portfolio holdings as NumPy columns (struct of arrays), normalized once from
+    the input list. Metrics are vectorized reductions over these columns.
+    Sector codes index sector_names in order of first appearance.
+    """
+
+    def __init__(self, portfolio_data):
+        records = [holding for holding in portfolio_data or [] if isinstance(holding, dict)]
+
+        self.symbols = np.array([r.get('symbol', r.get('ticker', 'UNKNOWN')) for r in records], dtype=object)
+        self.shares = np.array([float(r.get('shares', r.get('quantity', 0))) for r in records], dtype=float)
+        self.price = np.array([float(r.get('price', r.get('current_price', 0))) for r in records], dtype=float)
+        self.cost_basis = np.array([
+            float(r.get('cost_basis', r.get('avg_cost', price))) for r, price in zip(records, self.price)
+        ], dtype=float)
+        self.industries = np.array([r.get('industry', 'Unknown') for r in records], dtype=object)
+        self.market_cap = np.array([float(r.get('market_cap', 0) or 0) for r in records], dtype=float)
+        self.beta = np.array([float(r.get('beta', 1.0)) for r in records], dtype=float)
+        self.dividend_yield = np.array([float(r.get('dividend_yield', 0) or 0) for r in records], dtype=float)
+
+        self.set_sectors([r.get('sector', 'Unknown') for r in records])
+
+        # Historical price data for calculations
+        self.price_histories = []
+        for record, price in zip(records, self.price):
+            history = record.get('price_history', [price])
+            if not isinstance(history, list) or len(history) == 0:
+                history = [price]
+            self.price_histories.append(history)
+        self.history_lengths = np.array([len(history) for history in self.price_histories], dtype=int)
+        self.volatility = calculate_holding_volatilities(self.price_histories)
+
+        self.derive_values()
+
+    def set_sectors(self, sectors):
+        codes, names = pd.factorize(pd.Series(sectors, dtype=object))
+        self.sector_codes = codes.astype(int) if len(sectors) else np.zeros(0, dtype=int)
+        self.sector_names = list(names)
+
+    def derive_values(self):
+        """Market values, gains and weights from shares, prices and cost basis"""
+        n_holdings = len(self.symbols)
+
+        # Holding metrics
+        self.market_value = self.shares * self.price
+        self.cost_value = self.shares * self.cost_basis
+        self.unrealized_gain_loss = self.market_value - self.cost_value
+        self.unrealized_return = np.divide(
+            self.unrealized_gain_loss * 100, self.cost_value,
+            out=np.zeros(n_holdings), where=self.cost_value > 0
+        )
+
+        # Portfolio weights (percent)
+        total_market_value = self.market_value.sum()
+        self.weight = self.market_value / total_market_value * 100 if total_market_value > 0 else np.zeros(n_holdings)
+
+    def select(self, index, shares, cost_basis):
+        """
+        Positions in this table's securities: rows `index` with an account's
+        shares and cost basis, without re-reading prices or histories
+        """
+        index = np.asarray(index, dtype=int)
+        table = HoldingsTable([])
+        for column in ('symbols', 'price', 'industries', 'market_cap', 'beta', 'dividend_yield',
+                       'history_lengths', 'volatility'):
+            setattr(table, column, getattr(self, column)[index])
+        table.price_histories = [self.price_histories[i] for i in index]
+        table.set_sectors([self.sector_names[code] for code in self.sector_codes[index]])
+        table.shares = np.asarray(shares, dtype=float)
+        table.cost_basis = np.asarray(cost_basis, dtype=float)
+        table.derive_values()
+        return table
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def sector_weights(self):
+        """Weight (percent) per sector code"""
+        return np.bincount(self.sector_codes, weights=self.weight, minlength=len(self.sector_names))
+
+def top_k(values, k, largest=True):
+    """
+    Indices of the k largest (or smallest) values, best first, via argpartition;
+    ties keep holding order
+    """
+    values = np.asarray(values, dtype=float)
+    k = min(k, len(values))
+    if k == 0:
+        return np.zeros(0, dtype=int)
+    keys = -values if largest else values
+    candidates = np.argpartition(keys, k - 1)[:k] if k < len(values) else np.arange(len(values))
+    candidates = np.sort(candidates)
+    return candidates[np.argsort(keys[candidates], kind='stable')]
+
 def process_portfolio_holdings(portfolio_data):
     """Process and standardize portfolio holdings data"""
     try:
-        holdings = []
-        
-        for holding in portfolio_data:
-            if isinstance(holding, dict):
-                # Extract holding information
-                symbol = holding.get('symbol', holding.get('ticker', 'UNKNOWN'))
-                shares = float(holding.get('shares', holding.get('quantity', 0)))
-                price = float(holding.get('price', holding.get('current_price', 0)))
-                cost_basis = float(holding.get('cost_basis', holding.get('avg_cost', price)))
-                
-                # Calculate holding metrics
-                market_value = shares * price
-                cost_value = shares * cost_basis
-                unrealized_gain_loss = market_value - cost_value
-                unrealized_return = (unrealized_gain_loss / cost_value * 100) if cost_value > 0 else 0
-                
-                # Extract additional data if available
-                sector = holding.get('sector', 'Unknown')
-                industry = holding.get('industry', 'Unknown')
-                market_cap = holding.get('market_cap', 0)
-                beta = holding.get('beta', 1.0)
-                dividend_yield = holding.get('dividend_yield', 0)
-                
-                # Historical price data for calculations
-                price_history = holding.get('price_history', [price])
-                if not isinstance(price_history, list) or len(price_history) == 0:
-                    price_history = [price]
-                
-                holdings.append({
-                    'symbol': symbol,
-                    'shares': shares,
-                    'price': price,
-                    'cost_basis': cost_basis,
-                    'market_value': market_value,
-                    'cost_value': cost_value,
-                    'unrealized_gain_loss': unrealized_gain_loss,
-                    'unrealized_return': unrealized_return,
-                    'sector': sector,
-                    'industry': industry,
-                    'market_cap': market_cap,
-                    'beta': beta,
-                    'dividend_yield': dividend_yield,
-                    'price_history': price_history,
-                    'volatility': calculate_holding_volatility(price_history),
-                    'weight': 0  # Will be calculated later
-                })
-        
-        # Calculate portfolio weights
-        total_market_value = sum(h['market_value'] for h in holdings)
-        if total_market_value > 0:
-            for holding in holdings:
-                holding['weight'] = (holding['market_value'] / total_market_value) * 100
-        
-        return holdings
+        return HoldingsTable(portfolio_data)
         
     except Exception as e:
-        return []
+        return HoldingsTable([])
 
-def calculate_holding_volatility(price_history):
-    """Calculate volatility for individual holding"""
-    try:
-        if len(price_history) < 2:
-            return 0
-        
-        prices = pd.Series(price_history, dtype=float)
-        returns = prices.pct_change().dropna()
-        
-        if len(returns) == 0:
-            return 0
-        
-        daily_vol = returns.std()
-        annual_vol = daily_vol * np.sqrt(252)  # Annualized
-        
-        return annual_vol
-        
-    except Exception:
-        return 0
+def calculate_holding_volatilities(price_histories):
+    """
+    Annualized volatility of every holding in one pass: histories are
+    right-aligned into a NaN-padded matrix and reduced with nanstd.
+    Holdings with fewer than two returns get 0.
+    """
+    n_holdings = len(price_histories)
+    if n_holdings == 0:
+        return np.zeros(0)
+    
+    series = []
+    for history in price_histories:
+        try:
+            series.append(parse_price_history(history)[1])
+        except (TypeError, ValueError):
+            series.append(np.array([]))
+    max_length = max(len(prices) for prices in series)
+    if max_length < 3:
+        return np.zeros(n_holdings)
+    
+    prices = np.full((n_holdings, max_length), np.nan)
+    for i, values in enumerate(series):
+        if len(values):
+            prices[i, max_length - len(values):] = values
+    
+    returns = prices[:, 1:] / prices[:, :-1] - 1
+    counts = np.sum(np.isfinite(returns), axis=1)
+    daily_vol = np.nanstd(np.where(counts[:, None] >= 2, returns, 0.0), axis=1, ddof=1)
+    
+    return np.where(counts >= 2, np.nan_to_num(daily_vol) * np.sqrt(252), 0.0)  # Annualized
+
+def performer_summary(holdings, indices):
+    """Return, gain/loss and weight of the given holdings"""
+    return [
+        {
+            'symbol': holdings.symbols[i],
+            'return_percent': round(float(holdings.unrealized_return[i]), 2),
+            'gain_loss': round(float(holdings.unrealized_gain_loss[i]), 2),
+            'weight': round(float(holdings.weight[i]), 2)
+        }
+        for i in indices
+    ]
 
 def calculate_performance_metrics(holdings):
     """Calculate portfolio performance metrics"""
@@ -158,38 +261,21 @@ def calculate_performance_metrics(holdings):
             }
         
         # Portfolio totals
-        total_market_value = sum(h['market_value'] for h in holdings)
-        total_cost_basis = sum(h['cost_value'] for h in holdings)
+        total_market_value = float(holdings.market_value.sum())
+        total_cost_basis = float(holdings.cost_value.sum())
         total_unrealized_gain_loss = total_market_value - total_cost_basis
         total_return_percent = (total_unrealized_gain_loss / total_cost_basis * 100) if total_cost_basis > 0 else 0
         
-        # Sort holdings by performance
-        holdings_by_return = sorted(holdings, key=lambda x: x['unrealized_return'], reverse=True)
-        
-        # Top and worst performers
-        top_performers = [
-            {
-                'symbol': h['symbol'],
-                'return_percent': round(h['unrealized_return'], 2),
-                'gain_loss': round(h['unrealized_gain_loss'], 2),
-                'weight': round(h['weight'], 2)
-            }
-            for h in holdings_by_return[:5]
-        ]
-        
-        worst_performers = [
-            {
-                'symbol': h['symbol'],
-                'return_percent': round(h['unrealized_return'], 2),
-                'gain_loss': round(h['unrealized_gain_loss'], 2),
-                'weight': round(h['weight'], 2)
-            }
-            for h in holdings_by_return[-5:]
-        ]
+        # Top and worst performers; the worst are the tail of the best-first
+        # ranking, so among ties the later holdings are picked
+        returns = holdings.unrealized_return
+        top_performers = performer_summary(holdings, top_k(returns, 5))
+        worst_from_end = top_k(returns[::-1], 5, largest=False)
+        worst_performers = performer_summary(holdings, (len(holdings) - 1 - worst_from_end)[::-1])
         
         # Calculate weighted average metrics
-        weighted_beta = sum(h['beta'] * h['weight'] / 100 for h in holdings) if holdings else 1.0
-        weighted_dividend_yield = sum(h['dividend_yield'] * h['weight'] / 100 for h in holdings) if holdings else 0
+        weighted_beta = float(holdings.beta @ holdings.weight) / 100
+        weighted_dividend_yield = float(holdings.dividend_yield @ holdings.weight) / 100
         
         return {
             'total_market_value': round(total_market_value, 2),
@@ -210,7 +296,21 @@ def calculate_performance_metrics(holdings):
             'total_return_percent': 0
         }
 
-def calculate_risk_metrics(holdings):
+def calculate_transaction_returns(holdings, transactions):
+    """Daily NAV based TWR and IRR of the whole ledger (all accounts as one) on the holdings' price histories"""
+    try:
+        price_histories = {}
+        for symbol, history in zip(holdings.symbols, holdings.price_histories):
+            price_histories.setdefault(symbol, history)
+        result = calculate_account_returns([{**transaction, 'account': 'portfolio'} for transaction in transactions],
+                                           price_histories)
+        return result['accounts']['portfolio']
+        
+    except Exception as e:
+        return {'error': f'Transaction returns failed: {str(e)}'}
+
+def calculate_risk_metrics(holdings, covariance_model=None, monte_carlo_params=None, stress_model=None,
+                           factor_model=None, attribution_params=None):
     """Calculate portfolio risk metrics"""
     try:
         if not holdings:
@@ -221,36 +321,50 @@ def calculate_risk_metrics(holdings):
                 'risk_metrics': {}
             }
         
-        # Calculate portfolio volatility
-        portfolio_volatility = calculate_portfolio_volatility(holdings)
+        # Portfolio volatility and its split across holdings
+        covariance_model = covariance_model or estimate_holdings_covariance(holdings)
+        risk_decomposition = calculate_risk_decomposition(holdings, covariance_model)
+        portfolio_volatility = risk_decomposition['portfolio_volatility']
         
         # Value at Risk (95% confidence)
-        portfolio_value = sum(h['market_value'] for h in holdings)
+        portfolio_value = float(holdings.market_value.sum())
         var_95 = portfolio_value * portfolio_volatility * 1.645 / np.sqrt(252)  # 1-day VaR
         
+        # VaR and expected shortfall over several horizons and confidence levels
+        try:
+            monte_carlo = monte_carlo_var(holdings.weight / 100, covariance_model[0], portfolio_value=portfolio_value,
+                                          params={**REPORT_MONTE_CARLO, **(monte_carlo_params or {})})
+        except Exception as e:
+            monte_carlo = {'error': f'Monte Carlo VaR failed: {str(e)}'}
+        
         # Risk concentration
         concentration_risk = calculate_concentration_risk(holdings)
         
         # Beta analysis
-        beta_analysis = analyze_portfolio_beta(holdings)
+        beta_analysis = analyze_portfolio_beta(holdings, factor_model)
         
         # Sector risk
-        sector_risk = analyze_sector_risk(holdings)
+        sector_risk = analyze_sector_risk(holdings, attribution_params)
+        
+        # Historical and hypothetical scenario losses
+        stress_tests = calculate_stress_tests(holdings, stress_model)
         
-        # Calculate maximum potential loss (largest holding volatility impact)
-        max_single_holding_risk = max(
-            h['market_value'] * h['volatility'] * 2 for h in holdings  # 2 std dev
-        ) if holdings else 0
+        # Calculate maximum potential loss (largest holding volatility impact, 2 std dev)
+        max_single_holding_risk = float(np.max(holdings.market_value * holdings.volatility * 2))
         
         return {
             'portfolio_volatility': round(portfolio_volatility, 4),
             'portfolio_volatility_percent': round(portfolio_volatility * 100, 2),
             'value_at_risk_1day': round(var_95, 2),
             'value_at_risk_percent': round(var_95 / portfolio_value * 100, 2) if portfolio_value > 0 else 0,
+            'monte_carlo_var': monte_carlo,
             'concentration_risk': concentration_risk,
             'beta_analysis': beta_analysis,
             'sector_risk': sector_risk,
+            'stress_tests': stress_tests,
             'max_single_holding_risk': round(max_single_holding_risk, 2),
+            'risk_contributions': risk_decomposition['contributions'],
+            'covariance_model': risk_decomposition['covariance_model'],
             'risk_score': calculate_overall_risk_score(portfolio_volatility, concentration_risk, sector_risk)
         }
         
@@ -261,77 +375,173 @@ def calculate_risk_metrics(holdings):
             'value_at_risk': 0
         }
 
-def calculate_portfolio_volatility(holdings):
+def constant_correlation_covariance(volatility, correlation=FALLBACK_CORRELATION):
+    """Covariance from volatilities and one pairwise correlation"""
+    correlations = np.full((len(volatility), len(volatility)), correlation)
+    np.fill_diagonal(correlations, 1.0)
+    return np.outer(volatility, volatility) * correlations
+
+def estimate_holdings_covariance(holdings, window=TRADING_DAYS, min_observations=30, short_history='fallback'):
+    """
+    Annualized covariance of the holdings. The sample covariance is estimated
+    from the aligned returns of the holdings whose histories cover the window
+    (history_coverage), so one short history does not truncate the rest.
+    Short-history holdings are listed in details['short_history'] and get rows
+    from their own volatility and the fallback correlation, or with
+    short_history='overlap' their sample covariances with the in-window
+    holdings over the dates they share (overlap_covariance_rows). Holdings
+    without a history keep zero rows, like their zero volatility. If too few
+    returns align, every pair uses the constant correlation.
+    Returns (covariance, details)
+    """
+    covariance = constant_correlation_covariance(holdings.volatility)
+    in_window = np.flatnonzero(history_coverage(holdings.history_lengths, window))
+    
+    if len(in_window):
+        try:
+            keys = [str(i) for i in in_window]
+            dates, returns = align_returns({str(i): holdings.price_histories[i] for i in in_window}, keys, window)
+            if len(returns) >= min_observations:
+                cov, details = RollingCovariance.from_returns(keys, returns, window=window, method='sample').covariance()
+                covariance[np.ix_(in_window, in_window)] = cov
+                short = np.flatnonzero((holdings.history_lengths >= 2) & ~np.isin(np.arange(len(holdings)), in_window))
+                details.update({
+                    'source': 'returns',
+                    'holdings_with_history': int(len(in_window) + len(short)),
+                    'holdings_in_window': int(len(in_window)),
+                    'short_history': [str(holdings.symbols[i]) for i in short]
+                })
+                if len(short):
+                    details['short_history_correlation'] = FALLBACK_CORRELATION
+                    if short_history == 'overlap':
+                        details['short_history_overlap'] = overlap_covariance_rows(
+                            covariance, holdings, in_window, short, dates, returns, min_observations
+                        )
+                return covariance, details
+        except Exception:
+            pass
+    
+    return covariance, {'source': 'constant_correlation', 'correlation': FALLBACK_CORRELATION}
+
+def overlap_covariance_rows(covariance, holdings, in_window, short, dates, returns, min_observations=30):
+    """
+    Fill (in place) the Σ rows of each short-history holding from the dates
+    it shares with the in-window returns: its variance and its covariances
+    with the in-window holdings over that overlap. Pairs of short holdings
+    keep the fallback correlation at the overlap volatilities; holdings with
+    fewer than min_observations shared returns keep their fallback rows.
+    Returns the number of holdings filled from an overlap.
+    """
+    positions = pd.Index(dates) if dates is not None else None
+    filled = []
+    for i in short:
+        history_dates, prices = parse_price_history(holdings.price_histories[i])
+        valid = np.isfinite(prices) & (prices > 0)
+        own_returns = prices[valid][1:] / prices[valid][:-1] - 1.0
+        if positions is not None and history_dates is not None:
+            rows = positions.get_indexer(np.asarray(history_dates)[valid][1:])
+            own_returns, rows = own_returns[rows >= 0], rows[rows >= 0]
+        else:
+            overlap = min(len(own_returns), len(returns))
+            own_returns, rows = own_returns[len(own_returns) - overlap:], np.arange(len(returns) - overlap, len(returns))
+        if len(rows) < min_observations:
+            continue
+        
+        shared = returns[rows] - returns[rows].mean(axis=0)
+        centered = own_returns - own_returns.mean()
+        scale = TRADING_DAYS / (len(rows) - 1)
+        covariance[in_window, i] = covariance[i, in_window] = shared.T @ centered * scale
+        covariance[i, i] = centered @ centered * scale
+        filled.append(i)
+    
+    if filled:
+        others = np.setdiff1d(short, filled)
+        volatility = np.sqrt(np.diag(covariance)[filled])
+        pairs = FALLBACK_CORRELATION * np.outer(volatility, volatility)
+        np.fill_diagonal(pairs, volatility ** 2)
+        covariance[np.ix_(filled, filled)] = pairs
+        covariance[np.ix_(filled, others)] = FALLBACK_CORRELATION * np.outer(volatility, holdings.volatility[others])
+        covariance[np.ix_(others, filled)] = covariance[np.ix_(filled, others)].T
+    return len(filled)
+
+def calculate_risk_decomposition(holdings, covariance_model=None):
+    """
+    Portfolio volatility sqrt(w'Σw) with marginal (Σw / σ) and component
+    (w · Σw / σ) risk per holding; components sum to the portfolio volatility
+    """
+    covariance, details = covariance_model or estimate_holdings_covariance(holdings)
+    weights = holdings.weight / 100
+    
+    sigma_w = covariance @ weights
+    portfolio_volatility = float(np.sqrt(max(weights @ sigma_w, 0.0)))
+    marginal = sigma_w / portfolio_volatility if portfolio_volatility > 0 else np.zeros(len(holdings))
+    component = weights * marginal
+    
+    order = np.argsort(-component)
+    contributions = [
+        {
+            'symbol': holdings.symbols[i],
+            'weight': round(float(holdings.weight[i]), 2),
+            'marginal_risk': round(float(marginal[i]), 6),
+            'component_risk': round(float(component[i]), 6),
+            'percent_of_risk': round(float(component[i] / portfolio_volatility * 100), 2) if portfolio_volatility > 0 else 0
+        }
+        for i in order
+    ]
+    
+    return {
+        'portfolio_volatility': portfolio_volatility,
+        'contributions': contributions,
+        'covariance_model': details
+    }
+
+def calculate_portfolio_volatility(holdings, covariance_model=None):
     """Calculate portfolio-level volatility"""
     try:
         if not holdings:
             return 0
         
-        # Simplified portfolio volatility calculation
-        # In practice, you'd need correlation matrix between holdings
-        
-        weights = np.array([h['weight'] / 100 for h in holdings])
-        volatilities = np.array([h['volatility'] for h in holdings])
-        
-        # Simplified calculation assuming 0.3 average correlation
-        avg_correlation = 0.3
-        
-        # Portfolio variance calculation
-        portfolio_variance = 0
-        
-        # Individual variances
-        for i, w_i in enumerate(weights):
-            portfolio_variance += (w_i * volatilities[i]) ** 2
-        
-        # Covariance terms (simplified)
-        for i, w_i in enumerate(weights):
-            for j, w_j in enumerate(weights):
-                if i != j:
-                    portfolio_variance += w_i * w_j * volatilities[i] * volatilities[j] * avg_correlation
-        
-        portfolio_volatility = np.sqrt(portfolio_variance)
-        
-        return portfolio_volatility
+        return calculate_risk_decomposition(holdings, covariance_model)['portfolio_volatility']
         
     except Exception:
         return 0
 
-def calculate_concentration_risk(holdings):
-    """Calculate portfolio concentration risk"""
+def estimate_holdings_stress_model(holdings, stress_params=None):
+    """
+    Scenario shocks per holding from factor betas on their price histories
+    (reference betas without factor data). Returns (shocks, scenarios, details)
+    """
+    stress_params = stress_params or {}
+    price_histories = {}
+    for symbol, history in zip(holdings.symbols, holdings.price_histories):
+        price_histories.setdefault(symbol, history)
+    return estimate_stress_model(list(holdings.symbols), price_histories, holdings.beta,
+                                 stress_params.get('factor_history'), stress_params.get('scenarios'))
+
+def calculate_stress_tests(holdings, stress_model=None):
+    """Portfolio profit and loss in each stress scenario"""
     try:
         if not holdings:
-            return {'score': 0, 'level': 'unknown'}
-        
-        weights = [h['weight'] for h in holdings]
-        
-        # Herfindahl-Hirschman Index (HHI)
-        hhi = sum(w**2 for w in weights)
+            return {'scenarios': {}, 'worst_scenario': None}
         
-        # Single largest holding
-        max_weight = max(weights)
-        
-        # Top 3 holdings concentration
-        top_3_weights = sorted(weights, reverse=True)[:3]
-        top_3_concentration = sum(top_3_weights)
-        
-        # Concentration score (0-100, higher = more concentrated)
-        concentration_score = min(100, hhi / 100 + max_weight)
-        
-        # Risk level
-        if concentration_score > 70:
-            risk_level = 'high'
-        elif concentration_score > 40:
-            risk_level = 'moderate'
-        else:
-            risk_level = 'low'
+        shocks, scenarios, details = stress_model or estimate_holdings_stress_model(holdings)
+        pnl, percent = stress_test(holdings.market_value.reshape(1, -1), shocks)
+        return {**summarize_stress_results(pnl[0], percent[0], scenarios), 'model': details}
         
+    except Exception as e:
         return {
-            'hhi_index': round(hhi, 1),
-            'max_single_weight': round(max_weight, 1),
-            'top_3_concentration': round(top_3_concentration, 1),
-            'concentration_score': round(concentration_score, 1),
-            'risk_level': risk_level
+            'error': f'Stress testing failed: {str(e)}',
+            'scenarios': {},
+            'worst_scenario': None
         }
+
+def calculate_concentration_risk(holdings):
+    """Calculate portfolio concentration risk"""
+    try:
+        if not holdings:
+            return {'score': 0, 'level': 'unknown'}
+        
+        return summarize_concentration(holdings.weight)
         
     except Exception as e:
         return {
@@ -340,18 +550,60 @@ def calculate_concentration_risk(holdings):
             'level': 'unknown'
         }
 
-def analyze_portfolio_beta(holdings):
+def summarize_concentration(weights):
+    """Concentration measures and risk level from holding weights (percent)"""
+    # Herfindahl-Hirschman Index (HHI)
+    hhi = float(weights @ weights)
+    
+    # Single largest holding
+    max_weight = float(weights.max())
+    
+    # Top 3 holdings concentration
+    top_3_concentration = float(weights[top_k(weights, 3)].sum())
+    
+    # Concentration score (0-100, higher = more concentrated)
+    concentration_score = min(100, hhi / 100 + max_weight)
+    
+    # Risk level
+    if concentration_score > 70:
+        risk_level = 'high'
+    elif concentration_score > 40:
+        risk_level = 'moderate'
+    else:
+        risk_level = 'low'
+    
+    return {
+        'hhi_index': round(hhi, 1),
+        'max_single_weight': round(max_weight, 1),
+        'top_3_concentration': round(top_3_concentration, 1),
+        'concentration_score': round(concentration_score, 1),
+        'risk_level': risk_level
+    }
+
+def estimate_holdings_factor_model(holdings, factor_history=None):
+    """Factor betas, alpha and residual risk of the holdings (reference betas without factor data)"""
+    price_histories = {}
+    for symbol, history in zip(holdings.symbols, holdings.price_histories):
+        price_histories.setdefault(symbol, history)
+    return estimate_factor_model(price_histories, list(holdings.symbols), factor_history or {}, holdings.beta)
+
+def analyze_portfolio_beta(holdings, factor_model=None):
     """Analyze portfolio beta characteristics"""
     try:
         if not holdings:
             return {'weighted_beta': 1.0, 'beta_distribution': {}}
         
+        # Regressed market betas when a factor model is available, else the holdings' beta field
+        betas, beta_source = holdings.beta, 'reference'
+        if factor_model and 'market' in factor_model['factors'] and factor_model['regressed'].any():
+            betas, beta_source = factor_model['betas'][:, factor_model['factors'].index('market')], 'regression'
+        
         # Weighted portfolio beta
-        weighted_beta = sum(h['beta'] * h['weight'] / 100 for h in holdings)
+        weighted_beta = float(betas @ holdings.weight) / 100
         
         # Beta distribution
-        high_beta_weight = sum(h['weight'] for h in holdings if h['beta'] > 1.2)
-        low_beta_weight = sum(h['weight'] for h in holdings if h['beta'] < 0.8)
+        high_beta_weight = float(holdings.weight[betas > 1.2].sum())
+        low_beta_weight = float(holdings.weight[betas < 0.8].sum())
         neutral_beta_weight = 100 - high_beta_weight - low_beta_weight
         
         # Beta risk assessment
@@ -362,61 +614,42 @@ def analyze_portfolio_beta(holdings):
         else:
             beta_risk = 'moderate'
         
-        return {
+        beta_analysis = {
             'weighted_beta': round(weighted_beta, 3),
             'beta_risk': beta_risk,
             'high_beta_allocation': round(high_beta_weight, 1),
             'low_beta_allocation': round(low_beta_weight, 1),
-            'neutral_beta_allocation': round(neutral_beta_weight, 1)
+            'neutral_beta_allocation': round(neutral_beta_weight, 1),
+            'beta_source': beta_source
         }
         
+        # Exposures to every factor, portfolio alpha and residual risk
+        if factor_model and factor_model['factors']:
+            beta_analysis['factor_exposures'] = portfolio_exposures(holdings.weight / 100, factor_model)
+            beta_analysis['factor_model'] = factor_model['details']
+        
+        return beta_analysis
+        
     except Exception as e:
         return {
             'error': f'Beta analysis failed: {str(e)}',
             'weighted_beta': 1.0
         }
 
-def analyze_sector_risk(holdings):
-    """Analyze sector concentration and risk"""
+def analyze_sector_risk(holdings, attribution_params=None):
+    """Analyze sector concentration and risk, with benchmark attribution when requested"""
     try:
         if not holdings:
             return {'sector_concentration': {}, 'risk_level': 'unknown'}
         
-        # Group by sector
-        sector_weights = {}
-        for holding in holdings:
-            sector = holding['sector']
-            sector_weights[sector] = sector_weights.get(sector, 0) + holding['weight']
+        # Group by sector code
+        sector_risk = summarize_sector_risk(holdings.sector_names, holdings.sector_weights())
         
-        # Find largest sector exposure
-        max_sector_weight = max(sector_weights.values()) if sector_weights else 0
+        # Allocation, selection and interaction effects against the benchmark
+        if attribution_params:
+            sector_risk['attribution'] = calculate_sector_attribution(holdings, attribution_params)
         
-        # Count sectors
-        num_sectors = len(sector_weights)
-        
-        # Sector concentration risk
-        if max_sector_weight > 50:
-            concentration_risk = 'high'
-        elif max_sector_weight > 30:
-            concentration_risk = 'moderate'
-        else:
-            concentration_risk = 'low'
-        
-        # Diversification score
-        if num_sectors >= 8:
-            diversification = 'high'
-        elif num_sectors >= 5:
-            diversification = 'moderate'
-        else:
-            diversification = 'low'
-        
-        return {
-            'sector_weights': {k: round(v, 1) for k, v in sector_weights.items()},
-            'max_sector_weight': round(max_sector_weight, 1),
-            'num_sectors': num_sectors,
-            'concentration_risk': concentration_risk,
-            'diversification_level': diversification
-        }
+        return sector_risk
         
     except Exception as e:
         return {
@@ -425,6 +658,60 @@ def analyze_sector_risk(holdings):
             'risk_level': 'unknown'
         }
 
+def calculate_sector_attribution(holdings, attribution_params):
+    """
+    Brinson-Fachler attribution of the holdings against a benchmark (the S&P 500
+    snapshot by default); benchmark constituent histories come in
+    attribution_params['price_history'], the holdings bring their own
+    """
+    try:
+        price_histories = dict(attribution_params.get('price_history') or {})
+        for symbol, history in zip(holdings.symbols, holdings.price_histories):
+            price_histories[symbol] = history
+        return sector_attribution(
+            [{'symbol': symbol, 'market_value': value, 'sector': holdings.sector_names[code]}
+             for symbol, value, code in zip(holdings.symbols, holdings.market_value, holdings.sector_codes)],
+            price_histories,
+            benchmark=attribution_params.get('benchmark'),
+            benchmark_path=attribution_params.get('benchmark_path'),
+            window=int(attribution_params.get('window', TRADING_DAYS))
+        )
+        
+    except Exception as e:
+        return {'error': f'Sector attribution failed: {str(e)}'}
+
+def summarize_sector_risk(sector_names, sector_weights):
+    """Sector concentration and diversification levels from sector weights (percent)"""
+    # Find largest sector exposure
+    max_sector_weight = float(sector_weights.max()) if len(sector_weights) else 0
+    
+    # Count sectors
+    num_sectors = len(sector_names)
+    
+    # Sector concentration risk
+    if max_sector_weight > 50:
+        concentration_risk = 'high'
+    elif max_sector_weight > 30:
+        concentration_risk = 'moderate'
+    else:
+        concentration_risk = 'low'
+    
+    # Diversification score
+    if num_sectors >= 8:
+        diversification = 'high'
+    elif num_sectors >= 5:
+        diversification = 'moderate'
+    else:
+        diversification = 'low'
+    
+    return {
+        'sector_weights': {name: round(float(weight), 1) for name, weight in zip(sector_names, sector_weights)},
+        'max_sector_weight': round(max_sector_weight, 1),
+        'num_sectors': num_sectors,
+        'concentration_risk': concentration_risk,
+        'diversification_level': diversification
+    }
+
 def calculate_diversification_metrics(holdings):
     """Calculate portfolio diversification metrics"""
     try:
@@ -435,17 +722,16 @@ def calculate_diversification_metrics(holdings):
         num_holdings = len(holdings)
         
         # Sector diversification
-        sectors = set(h['sector'] for h in holdings)
-        num_sectors = len(sectors)
+        num_sectors = len(holdings.sector_names)
         
         # Market cap diversification
-        large_cap_weight = sum(h['weight'] for h in holdings if h['market_cap'] > 10_000_000_000)
-        mid_cap_weight = sum(h['weight'] for h in holdings if 2_000_000_000 <= h['market_cap'] <= 10_000_000_000)
-        small_cap_weight = sum(h['weight'] for h in holdings if h['market_cap'] < 2_000_000_000)
+        market_cap = holdings.market_cap
+        large_cap_weight = float(holdings.weight[market_cap > 10_000_000_000].sum())
+        mid_cap_weight = float(holdings.weight[(market_cap >= 2_000_000_000) & (market_cap <= 10_000_000_000)].sum())
+        small_cap_weight = float(holdings.weight[market_cap < 2_000_000_000].sum())
         
         # Weight distribution analysis
-        weights = [h['weight'] for h in holdings]
-        weight_std = np.std(weights)
+        weight_std = float(np.std(holdings.weight))
         
         # Calculate diversification score (0-100)
         diversification_score = 0
@@ -551,7 +837,7 @@ def generate_diversification_recommendations(num_holdings, num_sectors, weight_s
     
     return recommendations
 
-def analyze_portfolio_optimization(holdings):
+def analyze_portfolio_optimization(holdings, covariance_model=None):
     """Analyze portfolio optimization opportunities"""
     try:
         if not holdings or len(holdings) < 2:
@@ -561,14 +847,9 @@ def analyze_portfolio_optimization(holdings):
                 'rebalancing_suggestions': []
             }
         
-        # Calculate current portfolio metrics
-        weights = np.array([h['weight'] / 100 for h in holdings])
-        returns = np.array([h['unrealized_return'] / 100 for h in holdings])
-        volatilities = np.array([h['volatility'] for h in holdings])
-        
         # Current portfolio return and risk
-        portfolio_return = np.sum(weights * returns)
-        portfolio_volatility = calculate_portfolio_volatility(holdings)
+        portfolio_return = float(holdings.weight @ holdings.unrealized_return) / 10000
+        portfolio_volatility = calculate_portfolio_volatility(holdings, covariance_model)
         
         # Current Sharpe ratio (assuming 2% risk-free rate)
         risk_free_rate = 0.02
@@ -600,43 +881,40 @@ def identify_rebalancing_opportunities(holdings):
     """Identify portfolio rebalancing opportunities"""
     try:
         suggestions = []
+        weights = holdings.weight
+        returns = holdings.unrealized_return
         
-        # Sort by weight
-        holdings_by_weight = sorted(holdings, key=lambda x: x['weight'], reverse=True)
-        
-        # Check for overweight positions
-        for holding in holdings_by_weight[:5]:  # Top 5 positions
-            if holding['weight'] > 15:  # More than 15% in single position
+        # Check for overweight positions among the top 5
+        for i in top_k(weights, 5):
+            if weights[i] > 15:  # More than 15% in single position
                 suggestions.append({
                     'action': 'reduce',
-                    'symbol': holding['symbol'],
-                    'current_weight': round(holding['weight'], 1),
+                    'symbol': holdings.symbols[i],
+                    'current_weight': round(float(weights[i]), 1),
                     'suggested_weight': 10.0,
                     'reason': 'Position size concentration risk'
                 })
         
         # Check for underweight high performers
-        top_performers = sorted(holdings, key=lambda x: x['unrealized_return'], reverse=True)[:3]
-        for holding in top_performers:
-            if holding['weight'] < 5 and holding['unrealized_return'] > 10:
+        for i in top_k(returns, 3):
+            if weights[i] < 5 and returns[i] > 10:
                 suggestions.append({
                     'action': 'increase',
-                    'symbol': holding['symbol'],
-                    'current_weight': round(holding['weight'], 1),
+                    'symbol': holdings.symbols[i],
+                    'current_weight': round(float(weights[i]), 1),
                     'suggested_weight': 7.0,
-                    'reason': f'Strong performer with low allocation (+{holding["unrealized_return"]:.1f}%)'
+                    'reason': f'Strong performer with low allocation (+{returns[i]:.1f}%)'
                 })
         
         # Check for poor performers with high allocation
-        worst_performers = sorted(holdings, key=lambda x: x['unrealized_return'])[:3]
-        for holding in worst_performers:
-            if holding['weight'] > 8 and holding['unrealized_return'] < -15:
+        for i in top_k(returns, 3, largest=False):
+            if weights[i] > 8 and returns[i] < -15:
                 suggestions.append({
                     'action': 'reduce',
-                    'symbol': holding['symbol'],
-                    'current_weight': round(holding['weight'], 1),
+                    'symbol': holdings.symbols[i],
+                    'current_weight': round(float(weights[i]), 1),
                     'suggested_weight': 5.0,
-                    'reason': f'Poor performer with high allocation ({holding["unrealized_return"]:.1f}%)'
+                    'reason': f'Poor performer with high allocation ({returns[i]:.1f}%)'
                 })
         
         return suggestions[:5]  # Return top 5 suggestions
@@ -647,30 +925,33 @@ def identify_rebalancing_opportunities(holdings):
 def analyze_risk_return_efficiency(holdings):
     """Analyze risk-return efficiency of holdings"""
     try:
-        efficient_holdings = []
-        inefficient_holdings = []
-        
-        for holding in holdings:
-            # Risk-adjusted return (simple Sharpe-like ratio)
-            risk_adjusted_return = holding['unrealized_return'] / (holding['volatility'] * 100) if holding['volatility'] > 0 else 0
-            
-            holding_analysis = {
-                'symbol': holding['symbol'],
-                'return': holding['unrealized_return'],
-                'volatility': holding['volatility'] * 100,
-                'risk_adjusted_return': round(risk_adjusted_return, 3),
-                'weight': holding['weight']
-            }
-            
-            if risk_adjusted_return > 0.5:  # Arbitrary threshold
-                efficient_holdings.append(holding_analysis)
-            else:
-                inefficient_holdings.append(holding_analysis)
+        # Risk-adjusted return (simple Sharpe-like ratio)
+        volatility_percent = holdings.volatility * 100
+        risk_adjusted_return = np.divide(
+            holdings.unrealized_return, volatility_percent,
+            out=np.zeros(len(holdings)), where=holdings.volatility > 0
+        )
+        rounded = np.round(risk_adjusted_return, 3)
+        
+        def summarize(indices):
+            return [
+                {
+                    'symbol': holdings.symbols[i],
+                    'return': float(holdings.unrealized_return[i]),
+                    'volatility': float(volatility_percent[i]),
+                    'risk_adjusted_return': float(rounded[i]),
+                    'weight': float(holdings.weight[i])
+                }
+                for i in indices
+            ]
+        
+        efficient = np.flatnonzero(risk_adjusted_return > 0.5)  # Arbitrary threshold
+        inefficient = np.flatnonzero(risk_adjusted_return <= 0.5)
         
         return {
-            'efficient_holdings': sorted(efficient_holdings, key=lambda x: x['risk_adjusted_return'], reverse=True),
-            'inefficient_holdings': sorted(inefficient_holdings, key=lambda x: x['risk_adjusted_return']),
-            'efficiency_ratio': len(efficient_holdings) / len(holdings) if holdings else 0
+            'efficient_holdings': summarize(efficient[np.argsort(-rounded[efficient], kind='stable')]),
+            'inefficient_holdings': summarize(inefficient[np.argsort(rounded[inefficient], kind='stable')]),
+            'efficiency_ratio': len(efficient) / len(holdings) if holdings else 0
         }
         
     except Exception as e:
@@ -768,6 +1049,486 @@ def calculate_overall_risk_score(volatility, concentration_risk, sector_risk):
     except Exception:
         return 5
 
+class PortfolioAnalytics:
+    """
+    Live portfolio analytics for editing one position at a time (trade entry).
+    Holdings sit in slots of preallocated columns next to the covariance Σ of
+    the slots. With m the dollar market values, the running totals, sector and
+    bucket aggregates and the risk vector Σm are updated in O(n) when one
+    holding moves by Δ:
+
+        Σm += Δ Σ[:, i],   m'Σm += 2Δ (Σm)_i + Δ² Σ_ii
+
+    Σ rows are estimated when a holding is added; refresh() rebuilds
+    everything from fresh holdings data (price refresh).
+    """
+
+    ATTRIBUTE_DEFAULTS = {'sector': 'Unknown', 'market_cap': 0.0, 'beta': 1.0, 'dividend_yield': 0.0}
+    COLUMNS = ('shares', 'price', 'cost_basis', 'market_value', 'market_cap', 'beta', 'dividend_yield',
+               'volatility', 'risk_vector')
+
+    def __init__(self, portfolio_data, window=TRADING_DAYS, capacity=16):
+        self.window = window
+        self.refresh(portfolio_data, capacity)
+
+    def refresh(self, portfolio_data, capacity=16):
+        """Full recompute from holdings data with current prices and histories"""
+        table = HoldingsTable(portfolio_data)
+        n_holdings = len(table)
+        self.allocate(max(capacity, 2 * n_holdings))
+        
+        # Slot i holds table row i; a repeated symbol keeps its first row
+        for i in range(n_holdings):
+            if table.symbols[i] not in self.slots:
+                self.fill_slot(i, table.symbols[i], table.shares[i], table.price[i], table.cost_basis[i], {
+                    'sector': table.sector_names[table.sector_codes[i]],
+                    'market_cap': table.market_cap[i],
+                    'beta': table.beta[i],
+                    'dividend_yield': table.dividend_yield[i]
+                }, table.price_histories[i], table.volatility[i])
+        self.free_slots = [slot for slot in range(self.capacity - 1, -1, -1) if not self.active[slot]]
+        
+        covariance, self.covariance_details = estimate_holdings_covariance(table, self.window)
+        self.covariance[:n_holdings, :n_holdings] = covariance
+        
+        # The aligned returns behind a sample covariance give exact rows for added holdings
+        self.returns = None
+        if self.covariance_details['source'] == 'returns':
+            in_window = np.flatnonzero(history_coverage(table.history_lengths, self.window))
+            _, returns = align_returns({str(i): table.price_histories[i] for i in in_window},
+                                       [str(i) for i in in_window], self.window)
+            self.returns = np.zeros((len(returns), self.capacity))
+            self.returns[:, in_window] = returns
+            self.returns[:, ~self.active] = 0.0
+            self.in_window[in_window] = True
+            self.in_window &= self.active
+        
+        self.recompute()
+
+    def allocate(self, capacity):
+        self.capacity = capacity
+        self.slots = {}
+        self.free_slots = []
+        self.active = np.zeros(capacity, dtype=bool)
+        self.in_window = np.zeros(capacity, dtype=bool)  # Slots whose returns make up self.returns
+        self.symbols = np.empty(capacity, dtype=object)
+        self.sector_codes = np.zeros(capacity, dtype=int)
+        for column in self.COLUMNS:
+            setattr(self, column, np.zeros(capacity))
+        self.price_histories = [[] for _ in range(capacity)]
+        self.covariance = np.zeros((capacity, capacity))
+        self.sector_names = []
+        self.sector_index = {}
+        self.sector_values = np.zeros(0)
+        self.sector_counts = np.zeros(0, dtype=int)
+
+    def grow(self):
+        """Double the slot capacity (amortized O(n) per added holding)"""
+        old = self.capacity
+        for column in ('active', 'in_window', 'symbols', 'sector_codes') + self.COLUMNS:
+            values = getattr(self, column)
+            extended = np.empty(2 * old, dtype=object) if values.dtype == object else np.zeros(2 * old, dtype=values.dtype)
+            extended[:old] = values
+            setattr(self, column, extended)
+        covariance = np.zeros((2 * old, 2 * old))
+        covariance[:old, :old] = self.covariance
+        self.covariance = covariance
+        if self.returns is not None:
+            self.returns = np.hstack([self.returns, np.zeros((len(self.returns), old))])
+        self.price_histories.extend([] for _ in range(old))
+        self.free_slots = list(range(2 * old - 1, old - 1, -1)) + self.free_slots
+        self.capacity = 2 * old
+
+    def sector_code(self, sector):
+        if sector not in self.sector_index:
+            self.sector_index[sector] = len(self.sector_names)
+            self.sector_names.append(sector)
+            self.sector_values = np.append(self.sector_values, 0.0)
+            self.sector_counts = np.append(self.sector_counts, 0)
+        return self.sector_index[sector]
+
+    def fill_slot(self, slot, symbol, shares, price, cost_basis, attributes, price_history, volatility):
+        self.slots[symbol] = slot
+        self.active[slot] = True
+        self.symbols[slot] = symbol
+        self.shares[slot] = shares
+        self.price[slot] = price
+        self.cost_basis[slot] = cost_basis
+        self.price_histories[slot] = price_history
+        self.volatility[slot] = volatility
+        self.set_attributes(slot, attributes)
+
+    def attributes(self, slot):
+        return {
+            'sector': self.sector_names[self.sector_codes[slot]],
+            'market_cap': self.market_cap[slot],
+            'beta': self.beta[slot],
+            'dividend_yield': self.dividend_yield[slot]
+        }
+
+    def set_attributes(self, slot, attributes):
+        self.sector_codes[slot] = self.sector_code(attributes['sector'])
+        self.market_cap[slot] = float(attributes['market_cap'] or 0)
+        self.beta[slot] = float(attributes['beta'])
+        self.dividend_yield[slot] = float(attributes['dividend_yield'] or 0)
+
+    def recompute(self):
+        """Exact aggregates from the slot columns (O(n^2) for the risk vector)"""
+        self.market_value = np.where(self.active, self.shares * self.price, 0.0)
+        self.total_market_value = float(self.market_value.sum())
+        self.total_cost = float(np.where(self.active, self.shares * self.cost_basis, 0.0).sum())
+        self.beta_value = float(self.beta @ self.market_value)
+        self.dividend_value = float(self.dividend_yield @ self.market_value)
+        self.sector_values = np.bincount(self.sector_codes, weights=self.market_value, minlength=len(self.sector_names))
+        self.sector_counts = np.bincount(self.sector_codes[self.active], minlength=len(self.sector_names))
+        self.risk_vector = self.covariance @ self.market_value
+        self.variance = float(self.market_value @ self.risk_vector)
+
+    def move(self, slot, market_value):
+        """Change one holding's market value, updating every aggregate in O(n)"""
+        delta = market_value - self.market_value[slot]
+        self.variance += 2 * delta * self.risk_vector[slot] + delta * delta * self.covariance[slot, slot]
+        self.risk_vector += delta * self.covariance[:, slot]
+        self.market_value[slot] = market_value
+        self.total_market_value += delta
+        self.beta_value += delta * self.beta[slot]
+        self.dividend_value += delta * self.dividend_yield[slot]
+        self.sector_values[self.sector_codes[slot]] += delta
+
+    def covariance_row(self, slot, price_history, volatility):
+        """
+        Σ row of a newly added holding, as estimate_holdings_covariance would
+        give it: sample covariances with the in-window holdings when its
+        history covers the aligned window, otherwise its volatility with the
+        fallback correlation against every other holding
+        """
+        row = np.zeros(self.capacity)
+        row[slot] = volatility * volatility
+        others = self.active.copy()
+        others[slot] = False
+        row[others] = FALLBACK_CORRELATION * volatility * self.volatility[others]
+        if self.covariance_details['source'] != 'returns':
+            return row
+        
+        if len(price_history) >= 2:
+            try:
+                window_slots = [s for s in np.flatnonzero(self.in_window) if s != slot]
+                histories = {str(s): self.price_histories[s] for s in window_slots}
+                histories['new'] = price_history
+                _, returns = align_returns(histories, [str(s) for s in window_slots] + ['new'], self.window)
+                if len(returns) == len(self.returns) and np.array_equal(returns[:, :-1], self.returns[:, window_slots]):
+                    self.returns[:, slot] = returns[:, -1]
+                    self.in_window[slot] = True
+                    centered = self.returns - self.returns.mean(axis=0)
+                    sample_row = centered.T @ centered[:, slot] / max(len(centered) - 1, 1) * TRADING_DAYS
+                    row[self.in_window] = sample_row[self.in_window]
+            except Exception:
+                pass
+        
+        return row
+
+    def set_position(self, symbol, shares, price=None, cost_basis=None, **attributes):
+        """
+        Add or resize a position. New holdings take sector, market_cap, beta,
+        dividend_yield and price_history keywords; an existing holding keeps
+        its covariance until refresh()
+        """
+        slot = self.slots.get(symbol)
+        
+        if slot is None:
+            if not self.free_slots:
+                self.grow()
+            slot = self.free_slots.pop()
+            price = float(price or 0)
+            price_history = attributes.get('price_history') or [price]
+            volatility = float(calculate_holding_volatilities([price_history])[0])
+            self.fill_slot(slot, symbol, 0.0, price, float(cost_basis if cost_basis is not None else price),
+                           {key: attributes.get(key, default) for key, default in self.ATTRIBUTE_DEFAULTS.items()},
+                           price_history, volatility)
+            self.sector_counts[self.sector_codes[slot]] += 1
+            
+            row = self.covariance_row(slot, price_history, volatility)
+            self.covariance[slot, :] = row
+            self.covariance[:, slot] = row
+            self.risk_vector[slot] = float(row @ self.market_value)
+        else:
+            changed = {key: attributes[key] for key in self.ATTRIBUTE_DEFAULTS if key in attributes}
+            if changed:
+                # Take the holding out under its old attributes and back in under the new
+                self.move(slot, 0.0)
+                self.sector_counts[self.sector_codes[slot]] -= 1
+                self.set_attributes(slot, {**self.attributes(slot), **changed})
+                self.sector_counts[self.sector_codes[slot]] += 1
+            self.total_cost -= self.shares[slot] * self.cost_basis[slot]
+            if price is not None:
+                self.price[slot] = float(price)
+            if cost_basis is not None:
+                self.cost_basis[slot] = float(cost_basis)
+        
+        self.shares[slot] = float(shares)
+        self.total_cost += self.shares[slot] * self.cost_basis[slot]
+        self.move(slot, self.shares[slot] * self.price[slot])
+
+    def remove_position(self, symbol):
+        """Close a position and free its slot"""
+        slot = self.slots.pop(symbol, None)
+        if slot is None:
+            return
+        
+        self.total_cost -= self.shares[slot] * self.cost_basis[slot]
+        self.move(slot, 0.0)
+        self.sector_counts[self.sector_codes[slot]] -= 1
+        self.active[slot] = False
+        self.shares[slot] = 0.0
+        self.covariance[slot, :] = 0.0
+        self.covariance[:, slot] = 0.0
+        self.risk_vector[slot] = 0.0
+        if self.returns is not None:
+            self.returns[:, slot] = 0.0
+        self.in_window[slot] = False
+        self.price_histories[slot] = []
+        self.free_slots.append(slot)
+
+    def preview_position(self, symbol, shares, price=None, **attributes):
+        """Live metrics as if the order were filled, leaving the portfolio unchanged"""
+        slot = self.slots.get(symbol)
+        previous = None
+        if slot is not None:
+            previous = (self.shares[slot], self.price[slot], self.cost_basis[slot], self.attributes(slot))
+        
+        self.set_position(symbol, shares, price, **attributes)
+        metrics = self.live_metrics()
+        
+        if previous is None:
+            self.remove_position(symbol)
+        else:
+            old_shares, old_price, old_cost_basis, old_attributes = previous
+            self.set_position(symbol, old_shares, old_price, old_cost_basis, **old_attributes)
+        return metrics
+
+    def live_metrics(self, top_contributors=5):
+        """Totals, risk, concentration, beta and sector exposure of the current positions"""
+        try:
+            slots = np.flatnonzero(self.active)
+            total = self.total_market_value
+            if len(slots) == 0 or total <= 0:
+                return {'total_market_value': 0, 'number_of_holdings': int(len(slots)), 'portfolio_volatility': 0}
+            
+            weights = self.market_value[slots] / total * 100
+            portfolio_volatility = float(np.sqrt(max(self.variance, 0.0))) / total
+            var_95 = total * portfolio_volatility * 1.645 / np.sqrt(252)  # 1-day VaR
+            gain_loss = total - self.total_cost
+            
+            # Beta buckets as in analyze_portfolio_beta
+            beta = self.beta[slots]
+            high_beta_weight = float(weights[beta > 1.2].sum())
+            low_beta_weight = float(weights[beta < 0.8].sum())
+            
+            # Share of m'Σm from each holding
+            component = self.market_value[slots] * self.risk_vector[slots]
+            contributors = [
+                {
+                    'symbol': self.symbols[slots[i]],
+                    'weight': round(float(weights[i]), 2),
+                    'percent_of_risk': round(float(component[i] / self.variance * 100), 2)
+                }
+                for i in (top_k(component, top_contributors) if self.variance > 0 else [])
+            ]
+            
+            held = np.flatnonzero(self.sector_counts > 0)
+            concentration_risk = summarize_concentration(weights)
+            sector_risk = summarize_sector_risk([self.sector_names[code] for code in held],
+                                                self.sector_values[held] / total * 100)
+            
+            return {
+                'total_market_value': round(total, 2),
+                'total_cost_basis': round(self.total_cost, 2),
+                'total_unrealized_gain_loss': round(gain_loss, 2),
+                'total_return_percent': round(gain_loss / self.total_cost * 100, 2) if self.total_cost > 0 else 0,
+                'number_of_holdings': int(len(slots)),
+                'portfolio_volatility': round(portfolio_volatility, 4),
+                'portfolio_volatility_percent': round(portfolio_volatility * 100, 2),
+                'value_at_risk_1day': round(var_95, 2),
+                'value_at_risk_percent': round(var_95 / total * 100, 2),
+                'weighted_beta': round(self.beta_value / total, 3),
+                'weighted_dividend_yield': round(self.dividend_value / total, 3),
+                'high_beta_allocation': round(high_beta_weight, 1),
+                'low_beta_allocation': round(low_beta_weight, 1),
+                'concentration_risk': concentration_risk,
+                'sector_risk': sector_risk,
+                'top_risk_contributors': contributors,
+                'risk_score': calculate_overall_risk_score(portfolio_volatility, concentration_risk, sector_risk),
+                'covariance_model': self.covariance_details
+            }
+            
+        except Exception as e:
+            return {
+                'error': f'Live metrics failed: {str(e)}',
+                'total_market_value': 0,
+                'portfolio_volatility': 0
+            }
+
+def apply_position_changes(portfolio_data, position_changes):
+    """
+    Live metrics after each change in an order ticket. Each change is
+    {symbol, shares, price?, ...} with action 'set' (default), 'remove' or
+    'preview' (metrics as if filled, not applied)
+    """
+    analytics = PortfolioAnalytics(portfolio_data)
+    results = []
+    for change in position_changes:
+        change = dict(change)
+        action = change.pop('action', 'set')
+        symbol = change.pop('symbol')
+        if action == 'remove':
+            analytics.remove_position(symbol)
+            metrics = analytics.live_metrics()
+        elif action == 'preview':
+            metrics = analytics.preview_position(symbol, change.pop('shares', 0), **change)
+        else:
+            analytics.set_position(symbol, change.pop('shares', 0), **change)
+            metrics = analytics.live_metrics()
+        results.append({'action': action, 'symbol': symbol, 'metrics': metrics})
+    
+    return {
+        'position_changes': results,
+        'portfolio': analytics.live_metrics(),
+        'timestamp': pd.Timestamp.now().isoformat()
+    }
+
+def build_universe_holdings(accounts, price_histories=None, securities=None):
+    """
+    One row per distinct symbol across the accounts (first-seen order) with the
+    security fields, price and history; shares are per account. Reference data
+    comes from `securities`, else from the first holding of that symbol.
+    Returns (table, {symbol: row})
+    """
+    price_histories = price_histories or {}
+    securities = securities or {}
+    records = {}
+    for account in accounts:
+        for holding in account.get('holdings', []):
+            symbol = holding.get('symbol', holding.get('ticker', 'UNKNOWN'))
+            if symbol not in records:
+                records[symbol] = {**holding, **securities.get(symbol, {}), 'symbol': symbol, 'shares': 0}
+                if price_histories.get(symbol):
+                    records[symbol]['price_history'] = price_histories[symbol]
+    
+    universe = HoldingsTable(list(records.values()))
+    return universe, {symbol: i for i, symbol in enumerate(records)}
+
+def evaluate_batch_chunk(context, chunk):
+    """Metrics of a chunk of accounts on slices of the shared universe and covariance"""
+    universe, position = context['universe'], context['position']
+    results = []
+    for account_id, holdings in chunk:
+        try:
+            index, shares, cost_basis = [], [], []
+            for holding in holdings:
+                row = position[holding.get('symbol', holding.get('ticker', 'UNKNOWN'))]
+                index.append(row)
+                shares.append(float(holding.get('shares', holding.get('quantity', 0))))
+                cost_basis.append(float(holding.get('cost_basis', holding.get('avg_cost', universe.price[row]))))
+            if not index:
+                raise ValueError('No holdings provided')
+            
+            table = universe.select(index, shares, cost_basis)
+            covariance_model = (context['covariance'][np.ix_(index, index)], dict(context['covariance_details']))
+            if covariance_model[1].get('short_history'):
+                held = set(table.symbols)
+                covariance_model[1]['short_history'] = [symbol for symbol in covariance_model[1]['short_history'] if symbol in held]
+            shocks, scenarios, stress_details = context['stress_model']
+            results.append({'account_id': account_id, **portfolio_report(
+                table, covariance_model, context['monte_carlo_params'], (shocks[index], scenarios, stress_details),
+                slice_factor_model(context['factor_model'], index)
+            )})
+        except Exception as e:
+            results.append({'account_id': account_id, 'error': f'Portfolio metrics calculation failed: {str(e)}'})
+    return results
+
+def calculate_batch_metrics(input_data, output):
+    """
+    Portfolio metrics for many accounts over a shared symbol universe. Price
+    histories are read and the covariance estimated once; accounts are
+    evaluated in chunks, in worker processes for large batches, and each
+    account is written to `output` as one JSON line as soon as its chunk is
+    done. Returns the batch summary.
+    """
+    started = pd.Timestamp.now()
+    params = {**BATCH_DEFAULTS, **input_data.get('batch', {})}
+    accounts = input_data.get('accounts', input_data.get('portfolios', []))
+    
+    universe, position = build_universe_holdings(accounts, input_data.get('price_history'), input_data.get('securities'))
+    covariance, covariance_details = estimate_holdings_covariance(universe, short_history='overlap')
+    stress_params = {'factor_history': input_data.get('factor_history'), **input_data.get('stress_test', {})}
+    shocks, scenarios, stress_details = estimate_holdings_stress_model(universe, stress_params)
+    factor_model = estimate_holdings_factor_model(universe, input_data.get('factor_history'))
+    risk_model_seconds = (pd.Timestamp.now() - started).total_seconds()
+    
+    tasks = [(str(account.get('id', account.get('account_id', index))), account.get('holdings', []))
+             for index, account in enumerate(accounts)]
+    chunk_size = max(1, int(params['chunk_size']))
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    
+    workers = 1
+    if len(tasks) >= params['min_parallel_accounts']:
+        workers = max(1, min(int(params['max_workers'] or os.cpu_count() or 1), len(chunks)))
+    
+    # Workers get the columns, covariance, shocks and factor model only; histories are already reduced
+    universe.price_histories = [[] for _ in range(len(universe))]
+    monte_carlo_params = dict(input_data.get('monte_carlo') or {})
+    if workers > 1:
+        monte_carlo_params['max_workers'] = 1
+    context = {
+        'universe': universe,
+        'position': position,
+        'covariance': covariance,
+        'covariance_details': covariance_details,
+        'stress_model': (shocks, scenarios, stress_details),
+        'factor_model': factor_model,
+        'monte_carlo_params': monte_carlo_params
+    }
+    
+    accounts_written = 0
+    failed = 0
+    def write(chunk_results):
+        nonlocal accounts_written, failed
+        for result in chunk_results:
+            output.write(json.dumps(result) + '\n')
+            accounts_written += 1
+            failed += 'error' in result
+        output.flush()
+    
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker, initargs=(context,)) as executor:
+            for chunk_results in executor.map(run_batch_chunk, chunks):
+                write(chunk_results)
+    else:
+        for chunk in chunks:
+            write(evaluate_batch_chunk(context, chunk))
+    
+    total_seconds = (pd.Timestamp.now() - started).total_seconds()
+    return {
+        'accounts': accounts_written,
+        'failed': int(failed),
+        'universe_size': len(universe),
+        'covariance_model': covariance_details,
+        'workers': workers,
+        'risk_model_seconds': round(risk_model_seconds, 4),
+        'total_seconds': round(total_seconds, 4),
+        'accounts_per_second': round(accounts_written / total_seconds, 2) if total_seconds > 0 else None,
+        'timestamp': pd.Timestamp.now().isoformat()
+    }
+
+# Batch worker state: the shared universe and covariance per worker process
+BATCH_CONTEXT = {}
+
+def init_batch_worker(context):
+    BATCH_CONTEXT['context'] = context
+
+def run_batch_chunk(chunk):
+    return evaluate_batch_chunk(BATCH_CONTEXT['context'], chunk)
+
 def main():
     """Main execution function"""
     try:
@@ -780,11 +1541,28 @@ def main():
         with open(data_file, 'r') as f:
             input_data = json.load(f)
         
+        # Many accounts: one JSON line per account, then the batch summary
+        if input_data.get('action') == 'batch' or 'accounts' in input_data:
+            output_path = input_data.get('output_path')
+            if output_path:
+                with open(output_path, 'w') as output:
+                    summary = calculate_batch_metrics(input_data, output)
+                print(json.dumps({'batch_summary': {**summary, 'output_path': output_path}}, indent=2))
+            else:
+                summary = calculate_batch_metrics(input_data, sys.stdout)
+                print(json.dumps({'batch_summary': summary}))
+            return
+        
         # Extract portfolio data
         portfolio_data = input_data.get('portfolio_data', input_data.get('holdings', []))
         
         # Perform analysis
-        result = calculate_portfolio_metrics(portfolio_data)
+        if input_data.get('position_changes'):
+            result = apply_position_changes(portfolio_data, input_data['position_changes'])
+        else:
+            result = calculate_portfolio_metrics(portfolio_data, input_data.get('monte_carlo'),
+                                                 input_data.get('stress_test'), input_data.get('factor_history'),
+                                                 input_data.get('attribution'), input_data.get('transactions'))
         
         # Output result
         print(json.dumps(result, indent=2))
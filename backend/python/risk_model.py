@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Return-Based Risk Model for Portfolio AI
+Covariance estimated from aligned return histories (sample, Ledoit-Wolf
+shrinkage or EWMA), cached per (universe, window) and rolled forward one
+trading day at a time instead of being recomputed
+Part of Phase 5: AI-Powered Investment Intelligence
+"""
+
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+from datetime import datetime
+
+TRADING_DAYS = 252
+COVARIANCE_METHODS = ('ledoit_wolf', 'ewma', 'sample')
+
+
+def parse_price_history(history):
+    """
+    Accept a list of prices or a list of {date, close|price|adjClose} records.
+    Returns (dates or None, prices)
+    """
+    if not history:
+        return None, np.array([])
+
+    if isinstance(history[0], dict):
+        records = [r for r in history if r.get('date') is not None]
+        dated = len(records) == len(history)
+        if not dated:
+            records = history
+        prices = np.array([
+            float(r.get('adjClose', r.get('close', r.get('price', np.nan))) or np.nan) for r in records
+        ])
+        dates = [str(r['date'])[:10] for r in records] if dated else None
+        if dates is not None:
+            order = np.argsort(dates, kind='stable')
+            dates = [dates[i] for i in order]
+            prices = prices[order]
+        return dates, prices
+
+    return None, np.asarray(history, dtype=float)
+
+
+def align_returns(price_histories, symbols, window=None, differenced=()):
+    """
+    Align per-symbol price histories and convert them to simple daily returns.
+    Dated histories are aligned on their common dates; undated ones on their
+    most recent observations. Series named in `differenced` (yields, spreads)
+    get daily level changes instead. Returns (dates or None, returns[T, n]).
+    """
+    parsed = [parse_price_history(price_histories.get(symbol, [])) for symbol in symbols]
+
+    if all(dates is not None for dates, _ in parsed):
+        common = set(parsed[0][0])
+        for dates, _ in parsed[1:]:
+            common &= set(dates)
+        common_dates = sorted(common)
+        prices = np.empty((len(common_dates), len(symbols)))
+        for j, (dates, series) in enumerate(parsed):
+            position = {date: i for i, date in enumerate(dates)}
+            prices[:, j] = series[[position[date] for date in common_dates]]
+    else:
+        common_dates = None
+        length = min(len(series) for _, series in parsed)
+        prices = np.column_stack([series[len(series) - length:] for _, series in parsed]) if length else np.empty((0, len(symbols)))
+
+    # Drop rows with missing or non-positive prices before differencing
+    levels = np.array([symbol in differenced for symbol in symbols], dtype=bool)
+    valid = np.all(np.isfinite(prices) & ((prices > 0) | levels), axis=1)
+    prices = prices[valid]
+    if common_dates is not None:
+        common_dates = [date for date, ok in zip(common_dates, valid) if ok]
+
+    if len(prices) < 2:
+        return (common_dates[1:] if common_dates else None), np.empty((0, len(symbols)))
+
+    returns = prices[1:] / prices[:-1] - 1.0 if not levels.any() else np.where(
+        levels, prices[1:] - prices[:-1], prices[1:] / np.where(levels, 1.0, prices[:-1]) - 1.0
+    )
+    dates = common_dates[1:] if common_dates is not None else None
+    if window is not None and len(returns) > window:
+        returns = returns[-window:]
+        dates = dates[-window:] if dates is not None else None
+    return dates, returns
+
+
+def history_coverage(history_lengths, window=None):
+    """
+    Which histories cover an estimation window: at least window + 1 prices, or
+    as many as the longest history when none is that long. Shorter histories
+    would cut an inner join (align_returns) down to their own length.
+    """
+    lengths = np.asarray(history_lengths, dtype=int)
+    if len(lengths) == 0:
+        return np.zeros(0, dtype=bool)
+    needed = lengths.max() if window is None else min(int(window) + 1, lengths.max())
+    return lengths >= max(needed, 2)
+
+
+def covariance_version(cov):
+    """Content hash identifying a covariance matrix (for downstream caches)"""
+    return hashlib.sha1(np.ascontiguousarray(cov).tobytes()).hexdigest()[:12]
+
+
+class RollingCovariance:
+    """
+    Covariance over a rolling window of daily returns, kept as sufficient
+    statistics so adding a day (and dropping the oldest) costs O(n^2):
+
+        count, sum r, sum r r', sum |r|^2, sum |r|^2 r, sum |r|^4
+
+    The fourth-moment terms give the Ledoit-Wolf shrinkage intensity without
+    revisiting the window. The EWMA estimate is a RiskMetrics recursion
+    cov <- lambda * cov + (1 - lambda) * r r', seeded from the first rows.
+    """
+
+    def __init__(self, symbols, window, method='ledoit_wolf', ewma_lambda=0.94):
+        if method not in COVARIANCE_METHODS:
+            raise ValueError(f"Unknown covariance method: {method}")
+        self.symbols = list(symbols)
+        self.window = int(window)
+        self.method = method
+        self.ewma_lambda = float(ewma_lambda)
+
+        n = len(self.symbols)
+        self.buffer = np.empty((0, n))
+        self.last_date = None
+        self.count = 0
+        self.sum_r = np.zeros(n)
+        self.sum_rr = np.zeros((n, n))
+        self.sum_sq = 0.0
+        self.sum_sq_r = np.zeros(n)
+        self.sum_quartic = 0.0
+        self.ewma_cov = None
+        self.updates = 0
+
+    @classmethod
+    def from_returns(cls, symbols, returns, dates=None, window=TRADING_DAYS, method='ledoit_wolf', ewma_lambda=0.94):
+        model = cls(symbols, window, method, ewma_lambda)
+        returns = np.asarray(returns, dtype=float)[-model.window:]
+        model.buffer = returns.copy()
+        model.count = len(returns)
+        model.sum_r = returns.sum(axis=0)
+        model.sum_rr = returns.T @ returns
+        squared = np.einsum('ij,ij->i', returns, returns)
+        model.sum_sq = float(squared.sum())
+        model.sum_sq_r = squared @ returns
+        model.sum_quartic = float(squared @ squared)
+
+        # The EWMA state is only read by the EWMA method
+        seed = min(20, len(returns))
+        if method == 'ewma' and seed >= 2:
+            model.ewma_cov = np.cov(returns[:seed], rowvar=False).reshape(len(symbols), len(symbols))
+            for r in returns[seed:]:
+                model.ewma_cov = model.ewma_lambda * model.ewma_cov + (1 - model.ewma_lambda) * np.outer(r, r)
+
+        model.last_date = dates[-1] if dates else None
+        return model
+
+    def update(self, r, date=None):
+        """Roll the window forward by one day of returns"""
+        r = np.asarray(r, dtype=float)
+        self.add_row(r, 1.0)
+        self.buffer = np.vstack([self.buffer, r])
+        if len(self.buffer) > self.window:
+            self.add_row(self.buffer[0], -1.0)
+            self.buffer = self.buffer[1:]
+
+        if self.ewma_cov is None:
+            self.ewma_cov = np.outer(r, r)
+        else:
+            self.ewma_cov = self.ewma_lambda * self.ewma_cov + (1 - self.ewma_lambda) * np.outer(r, r)
+
+        self.last_date = date if date is not None else self.last_date
+        self.updates += 1
+
+    def add_row(self, r, sign):
+        squared = float(r @ r)
+        self.count += int(sign)
+        self.sum_r += sign * r
+        self.sum_rr += sign * np.outer(r, r)
+        self.sum_sq += sign * squared
+        self.sum_sq_r += sign * squared * r
+        self.sum_quartic += sign * squared * squared
+
+    def sample_moments(self):
+        """Mean and biased (1/T) covariance of the window"""
+        mean = self.sum_r / self.count
+        return mean, self.sum_rr / self.count - np.outer(mean, mean)
+
+    def ledoit_wolf(self):
+        """
+        Ledoit-Wolf shrinkage toward a scaled identity.
+        Returns (covariance, shrinkage intensity)
+        """
+        n = len(self.symbols)
+        T = self.count
+        mean, S = self.sample_moments()
+        mu = np.trace(S) / n
+        delta = np.sum((S - mu * np.eye(n)) ** 2) / n
+        if delta <= 0:
+            return S, 0.0
+
+        # sum_t |x_t|^4 for centered x_t = r_t - mean, expanded in the raw moments
+        c = float(mean @ mean)
+        sum_a_b = float(self.sum_sq_r @ mean)
+        sum_b_sq = float(mean @ self.sum_rr @ mean)
+        sum_b = float(self.sum_r @ mean)
+        centered_quartic = (self.sum_quartic + 4 * sum_b_sq + T * c * c
+                            - 4 * sum_a_b + 2 * c * self.sum_sq - 4 * c * sum_b)
+
+        beta = max(centered_quartic - T * np.sum(S ** 2), 0.0) / (n * T * T)
+        shrinkage = min(beta, delta) / delta
+        return (1 - shrinkage) * S + shrinkage * mu * np.eye(n), float(shrinkage)
+
+    def covariance(self):
+        """Annualized covariance for the configured method, plus estimator details"""
+        details = {'method': self.method, 'observations': int(self.count)}
+        if self.method == 'ewma' and self.ewma_cov is not None:
+            cov = self.ewma_cov
+            details['ewma_lambda'] = self.ewma_lambda
+        elif self.method == 'ledoit_wolf':
+            cov, shrinkage = self.ledoit_wolf()
+            details['shrinkage'] = round(shrinkage, 6)
+        else:
+            cov = self.sample_moments()[1] * self.count / max(self.count - 1, 1)
+        cov = (cov + cov.T) / 2
+        return cov * TRADING_DAYS, details
+
+    def to_arrays(self):
+        return {
+            'buffer': self.buffer,
+            'sum_r': self.sum_r,
+            'sum_rr': self.sum_rr,
+            'sum_sq_r': self.sum_sq_r,
+            'ewma_cov': self.ewma_cov if self.ewma_cov is not None else np.empty((0, 0)),
+            'meta': np.array(json.dumps({
+                'symbols': self.symbols,
+                'window': self.window,
+                'method': self.method,
+                'ewma_lambda': self.ewma_lambda,
+                'last_date': self.last_date,
+                'count': self.count,
+                'sum_sq': self.sum_sq,
+                'sum_quartic': self.sum_quartic,
+                'updates': self.updates
+            }))
+        }
+
+    @classmethod
+    def from_arrays(cls, data):
+        meta = json.loads(str(data['meta']))
+        model = cls(meta['symbols'], meta['window'], meta['method'], meta['ewma_lambda'])
+        model.buffer = data['buffer']
+        model.sum_r = data['sum_r']
+        model.sum_rr = data['sum_rr']
+        model.sum_sq_r = data['sum_sq_r']
+        model.ewma_cov = data['ewma_cov'] if data['ewma_cov'].size else None
+        model.last_date = meta['last_date']
+        model.count = meta['count']
+        model.sum_sq = meta['sum_sq']
+        model.sum_quartic = meta['sum_quartic']
+        model.updates = meta['updates']
+        return model
+
+
+class RiskModelCache:
+    """
+    Covariance models cached per (universe, window, method): in memory for the
+    life of the process and as .npz files under cache_path across processes.
+    Dated histories roll a cached model forward by the new days only.
+    """
+
+    def __init__(self, cache_path='/tmp/risk_model_cache/', min_observations=30):
+        self.cache_path = cache_path
+        self.min_observations = min_observations
+        self.models = {}
+        if cache_path:
+            os.makedirs(cache_path, exist_ok=True)
+
+    def cache_key(self, universe, window, method):
+        digest = hashlib.sha1(json.dumps(universe).encode()).hexdigest()[:16]
+        return f"{method}_{window}_{digest}"
+
+    def load(self, key):
+        if key in self.models:
+            return self.models[key]
+        path = os.path.join(self.cache_path, f"{key}.npz") if self.cache_path else None
+        if path and os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    self.models[key] = RollingCovariance.from_arrays(data)
+                return self.models[key]
+            except Exception as e:
+                print(f"⚠️ Could not load cached risk model {key}: {str(e)}")
+        return None
+
+    def save(self, key, model):
+        self.models[key] = model
+        if not self.cache_path:
+            return
+        path = os.path.join(self.cache_path, f"{key}.npz")
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **model.to_arrays())
+        os.replace(tmp_path, path)
+
+    def get_covariance(self, symbols, price_histories, window=TRADING_DAYS, method='ledoit_wolf', ewma_lambda=0.94):
+        """
+        Annualized covariance for `symbols` (in that order) from their price
+        histories, or (None, details) when there is not enough aligned data.
+        """
+        universe = sorted(set(symbols))
+        key = self.cache_key(universe, window, method)
+        dates, returns = align_returns(price_histories, universe)
+
+        if len(returns) < self.min_observations:
+            return None, {'method': method, 'observations': int(len(returns)), 'source': 'insufficient_history'}
+
+        model = self.load(key) if dates is not None else None
+        source = 'rebuilt'
+        if model is not None and model.last_date in dates:
+            new_rows = dates.index(model.last_date) + 1
+            if new_rows == len(dates):
+                source = 'cache'
+            elif len(dates) - new_rows <= window:
+                for date, r in zip(dates[new_rows:], returns[new_rows:]):
+                    model.update(r, date)
+                source = 'incremental'
+            else:
+                model = None
+        else:
+            model = None
+
+        if model is None:
+            model = RollingCovariance.from_returns(universe, returns, dates, window, method, ewma_lambda)
+        if source != 'cache':
+            self.save(key, model)
+
+        cov, details = model.covariance()
+        order = np.array([universe.index(symbol) for symbol in symbols])
+        cov = cov[np.ix_(order, order)]
+
+        details.update({
+            'source': source,
+            'window': model.window,
+            'as_of': model.last_date,
+            'version': covariance_version(cov)
+        })
+        return cov, details
+
+
+def main():
+    """Build or roll forward a cached covariance from a JSON file of price histories"""
+    try:
+        if len(sys.argv) < 2:
+            print(json.dumps({'error': 'Usage: python risk_model.py <input.json>'}))
+            sys.exit(1)
+
+        with open(sys.argv[1], 'r') as f:
+            input_data = json.load(f)
+
+        price_histories = input_data.get('price_history', {})
+        symbols = input_data.get('symbols') or list(price_histories.keys())
+        cache = RiskModelCache(input_data.get('cache_path', '/tmp/risk_model_cache/'))
+        cov, details = cache.get_covariance(
+            symbols, price_histories,
+            window=int(input_data.get('window', TRADING_DAYS)),
+            method=input_data.get('method', 'ledoit_wolf')
+        )
+
+        print(json.dumps({
+            'success': cov is not None,
+            'symbols': symbols,
+            'covariance': cov.tolist() if cov is not None else None,
+            'details': details,
+            'timestamp': datetime.now().isoformat()
+        }, indent=2))
+
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': str(e)}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
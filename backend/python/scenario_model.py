@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Return Scenarios for Portfolio AI
+Historical and Monte Carlo return scenarios for scenario-based risk (CVaR),
+generated once per universe and cached in memory and as .npz files
+Part of Phase 5: AI-Powered Investment Intelligence
+"""
+
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+from datetime import datetime
+
+from risk_model import TRADING_DAYS, align_returns, covariance_version
+
+SCENARIO_SOURCES = ('historical', 'monte_carlo')
+
+
+def historical_scenarios(price_histories, symbols, n_scenarios, horizon_days=1):
+    """
+    The most recent aligned returns as scenarios[S, n]; multi-day horizons use
+    overlapping compounded returns
+    """
+    horizon_days = max(1, int(horizon_days))
+    _, returns = align_returns(price_histories, symbols, window=n_scenarios + horizon_days - 1)
+    if horizon_days > 1 and len(returns) >= horizon_days:
+        growth = np.vstack([np.ones((1, returns.shape[1])), np.cumprod(1.0 + returns, axis=0)])
+        returns = growth[horizon_days:] / growth[:-horizon_days] - 1.0
+    return returns
+
+
+def monte_carlo_innovations(cov, n_scenarios, horizon_days=1, dof=None, seed=42):
+    """
+    Zero-mean horizon returns[S, n] with covariance cov * horizon / 252.
+    With dof > 2 the draws are multivariate Student-t, scaled so the covariance
+    is unchanged but the tails are fatter than the normal.
+    """
+    rng = np.random.default_rng(seed)
+    scale = max(1, int(horizon_days)) / TRADING_DAYS
+    try:
+        factor = np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(cov)
+        factor = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0.0))
+
+    innovations = rng.standard_normal((int(n_scenarios), cov.shape[0])) @ factor.T
+    innovations *= np.sqrt(scale)
+    if dof and dof > 2:
+        innovations *= np.sqrt((dof - 2) / rng.chisquare(dof, size=(int(n_scenarios), 1)))
+    return innovations
+
+
+class ScenarioCache:
+    """
+    Scenario matrices cached per universe: historical scenarios keyed by the
+    price histories they came from, Monte Carlo innovations by covariance
+    version and draw settings (expected returns are added on lookup, so new
+    forecasts reuse the same draws).
+    """
+
+    def __init__(self, cache_path='/tmp/scenario_cache/', min_historical_scenarios=250):
+        self.cache_path = cache_path
+        self.min_historical_scenarios = min_historical_scenarios
+        self.matrices = {}
+        if cache_path:
+            os.makedirs(cache_path, exist_ok=True)
+
+    def cache_key(self, source, universe, fingerprint):
+        digest = hashlib.sha1(json.dumps([universe, fingerprint], default=str).encode()).hexdigest()[:16]
+        return f"{source}_{digest}"
+
+    def load(self, key):
+        if key in self.matrices:
+            return self.matrices[key]
+        path = os.path.join(self.cache_path, f"{key}.npz") if self.cache_path else None
+        if path and os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    self.matrices[key] = data['scenarios']
+                return self.matrices[key]
+            except Exception as e:
+                print(f"⚠️ Could not load cached scenarios {key}: {str(e)}")
+        return None
+
+    def save(self, key, scenarios):
+        self.matrices[key] = scenarios
+        if not self.cache_path:
+            return
+        path = os.path.join(self.cache_path, f"{key}.npz")
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, scenarios=scenarios)
+        os.replace(tmp_path, path)
+
+    def get_scenarios(self, symbols, source='auto', price_histories=None, mu=None, cov=None,
+                      n_scenarios=10000, horizon_days=1, dof=5, seed=42):
+        """
+        Scenario returns[S, n] for `symbols` (in that order) and details.
+        'auto' uses history when every symbol has at least
+        min_historical_scenarios aligned returns, else Monte Carlo from (mu, cov),
+        both annualized.
+        """
+        if source != 'auto' and source not in SCENARIO_SOURCES:
+            raise ValueError(f"Unknown scenario source '{source}' (expected 'auto' or one of {', '.join(SCENARIO_SOURCES)})")
+        universe = sorted(set(symbols))
+        order = np.array([universe.index(symbol) for symbol in symbols])
+        price_histories = price_histories or {}
+        has_history = all(price_histories.get(symbol) for symbol in universe)
+
+        if source in ('auto', 'historical') and has_history:
+            fingerprint = [[len(price_histories[symbol]), price_histories[symbol][-1]] for symbol in universe]
+            key = self.cache_key('historical', universe, [fingerprint, n_scenarios, horizon_days])
+            scenarios = self.load(key)
+            cached = scenarios is not None
+            if not cached:
+                scenarios = historical_scenarios(price_histories, universe, n_scenarios, horizon_days)
+            if len(scenarios) >= self.min_historical_scenarios or source == 'historical':
+                if not cached:
+                    self.save(key, scenarios)
+                return scenarios[:, order], {
+                    'source': 'historical', 'scenarios': int(len(scenarios)),
+                    'horizon_days': int(horizon_days), 'cache': 'hit' if cached else 'miss'
+                }
+
+        if mu is None or cov is None:
+            raise ValueError("Monte Carlo scenarios need expected returns and a covariance matrix")
+
+        # Draws live in sorted-universe order so every caller ordering shares them
+        inverse = np.argsort(order)
+        cov_sorted = np.asarray(cov)[np.ix_(inverse, inverse)]
+        key = self.cache_key('monte_carlo', universe,
+                             [covariance_version(cov_sorted), n_scenarios, horizon_days, dof, seed])
+        innovations = self.load(key)
+        cached = innovations is not None
+        if not cached:
+            innovations = monte_carlo_innovations(cov_sorted, n_scenarios, horizon_days, dof, seed)
+            self.save(key, innovations)
+
+        scale = max(1, int(horizon_days)) / TRADING_DAYS
+        return innovations[:, order] + np.asarray(mu) * scale, {
+            'source': 'monte_carlo', 'scenarios': int(len(innovations)), 'horizon_days': int(horizon_days),
+            'student_t_dof': dof, 'seed': seed, 'cache': 'hit' if cached else 'miss'
+        }
+
+
+def main():
+    """Generate (or load) cached scenarios from a JSON file of price histories"""
+    try:
+        if len(sys.argv) < 2:
+            print(json.dumps({'error': 'Usage: python scenario_model.py <input.json>'}))
+            sys.exit(1)
+
+        with open(sys.argv[1], 'r') as f:
+            input_data = json.load(f)
+
+        price_histories = input_data.get('price_history', {})
+        symbols = input_data.get('symbols') or list(price_histories.keys())
+        cache = ScenarioCache(input_data.get('cache_path', '/tmp/scenario_cache/'))
+        cov = np.array(input_data['covariance']) if input_data.get('covariance') else None
+        scenarios, details = cache.get_scenarios(
+            symbols, source=input_data.get('source', 'auto'), price_histories=price_histories,
+            mu=input_data.get('expected_returns'), cov=cov,
+            n_scenarios=int(input_data.get('n_scenarios', 10000)),
+            horizon_days=int(input_data.get('horizon_days', 1))
+        )
+
+        print(json.dumps({
+            'success': True,
+            'symbols': symbols,
+            'details': details,
+            'mean': scenarios.mean(axis=0).tolist(),
+            'worst': scenarios.min(axis=0).tolist(),
+            'timestamp': datetime.now().isoformat()
+        }, indent=2))
+
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': str(e)}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
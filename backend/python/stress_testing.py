@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Portfolio Stress Testing for Portfolio AI
+Historical scenarios (2008, 2020 COVID crash, 2022 rate shock) and hypothetical
+factor shocks applied to holdings through factor betas estimated from return
+history; many portfolios x many scenarios are one matrix product
+Part of Phase 5: AI-Powered Investment Intelligence
+"""
+
+import sys
+import json
+import numpy as np
+from datetime import datetime
+from scipy import sparse
+
+from risk_model import TRADING_DAYS, parse_price_history
+from factor_model import estimate_factor_model
+
+# Factor moves: 'market' and 'oil' are returns, 'rates' is the change in the
+# 10-year Treasury yield in percentage points
+FACTORS = ('market', 'rates', 'oil')
+
+# Approximate peak-to-trough factor moves over each window (S&P 500, 10Y yield, WTI)
+HISTORICAL_SCENARIOS = {
+    'financial_crisis_2008': {
+        'name': '2008 Financial Crisis',
+        'start': '2008-09-12',
+        'end': '2009-03-09',
+        'factor_shocks': {'market': -0.46, 'rates': -0.85, 'oil': -0.53}
+    },
+    'covid_crash_2020': {
+        'name': '2020 COVID Crash',
+        'start': '2020-02-19',
+        'end': '2020-03-23',
+        'factor_shocks': {'market': -0.34, 'rates': -0.80, 'oil': -0.56}
+    },
+    'rate_shock_2022': {
+        'name': '2022 Rate Shock',
+        'start': '2022-01-03',
+        'end': '2022-10-12',
+        'factor_shocks': {'market': -0.25, 'rates': 2.32, 'oil': 0.15}
+    }
+}
+
+HYPOTHETICAL_SCENARIOS = {
+    'rates_up_100bp': {'name': 'Rates +100bp', 'factor_shocks': {'rates': 1.0}},
+    'oil_down_30': {'name': 'Oil -30%', 'factor_shocks': {'oil': -0.30}},
+    'equities_down_20': {'name': 'Equities -20%', 'factor_shocks': {'market': -0.20}}
+}
+
+
+def scenario_set(custom_scenarios=None):
+    """Built-in historical and hypothetical scenarios plus custom ones, keyed by id"""
+    scenarios = {key: {**scenario, 'type': 'historical'} for key, scenario in HISTORICAL_SCENARIOS.items()}
+    scenarios.update({key: {**scenario, 'type': 'hypothetical'} for key, scenario in HYPOTHETICAL_SCENARIOS.items()})
+    for key, scenario in (custom_scenarios or {}).items():
+        scenarios[key] = {'name': key, 'type': 'custom', **scenario}
+    return scenarios
+
+
+def estimate_factor_betas(price_histories, symbols, factor_history, reference_betas=None,
+                          window=TRADING_DAYS, min_observations=60):
+    """
+    Betas[n, k] on the stress factors from the factor model's single
+    least-squares fit. Factors without history, and symbols without enough
+    aligned history, keep the reference market beta and zero on the other
+    factors; details['estimated_factors'] lists the factors with betas (the
+    market always has its reference beta). Returns (betas, factors, details)
+    """
+    model = estimate_factor_model(
+        price_histories, symbols, {factor: factor_history[factor] for factor in FACTORS if factor_history.get(factor)},
+        reference_betas, window, min_observations
+    )
+    betas = np.zeros((len(symbols), len(FACTORS)))
+    betas[:, 0] = reference_betas if reference_betas is not None else 1.0
+    for j, factor in enumerate(model['factors']):
+        betas[:, FACTORS.index(factor)] = model['betas'][:, j]
+    regressed = [factor for factor in model['factors'] if model['regressed'].any()]
+    estimated = [factor for factor in FACTORS if factor == 'market' or factor in regressed]
+    return betas, list(FACTORS), {**model['details'], 'estimated_factors': estimated}
+
+
+def realized_return(dates, prices, start, end):
+    """Price return over [start, end] from a dated history covering the window, else None"""
+    if not dates or dates[0] > start or dates[-1] < end:
+        return None
+    first = prices[np.searchsorted(dates, start, side='right') - 1]
+    last = prices[np.searchsorted(dates, end, side='right') - 1]
+    if not (np.isfinite(first) and np.isfinite(last) and first > 0):
+        return None
+    return float(last / first - 1.0)
+
+
+def security_shocks(symbols, betas, factors, scenarios, price_histories=None):
+    """
+    Return of every security in every scenario: shocks[n, m] = betas @ F with F
+    the factor moves per scenario. Historical scenarios use a security's own
+    return over the window when its dated history covers it, counted per
+    scenario in details['realized_by_scenario']. Long positions cannot lose
+    more than everything, so shocks are floored at -100%.
+    """
+    keys = list(scenarios)
+    factor_moves = np.array([
+        [scenarios[key].get('factor_shocks', {}).get(factor, 0.0) for key in keys] for factor in factors
+    ], dtype=float).reshape(len(factors), len(keys))
+    shocks = betas @ factor_moves
+
+    realized = np.zeros(len(keys), dtype=int)
+    windows = [(column, scenarios[key]['start'], scenarios[key]['end']) for column, key in enumerate(keys)
+               if scenarios[key].get('start') and scenarios[key].get('end')]
+    if windows and price_histories:
+        for row, symbol in enumerate(symbols):
+            dates, prices = parse_price_history(price_histories.get(symbol) or [])
+            if dates is None:
+                continue
+            for column, start, end in windows:
+                actual = realized_return(dates, prices, start, end)
+                if actual is not None:
+                    shocks[row, column] = actual
+                    realized[column] += 1
+
+    return np.maximum(shocks, -1.0), keys, {
+        'realized_returns': int(realized.sum()),
+        'realized_by_scenario': {key: int(count) for key, count in zip(keys, realized) if count}
+    }
+
+
+def estimate_stress_model(symbols, price_histories=None, reference_betas=None, factor_history=None,
+                          custom_scenarios=None):
+    """
+    Scenario shocks for the symbols and their provenance: (shocks[n, m],
+    scenarios, details). Factors a scenario moves without estimated betas
+    are listed in its missing_factors; when that is all of them (and not
+    every security has its realized return over the window) the scenario
+    has no modelled exposure and is marked 'estimated': False.
+    """
+    price_histories = price_histories or {}
+    scenarios = scenario_set(custom_scenarios)
+    betas, factors, beta_details = estimate_factor_betas(price_histories, symbols, factor_history or {},
+                                                         reference_betas)
+    shocks, keys, shock_details = security_shocks(symbols, betas, factors, scenarios, price_histories)
+
+    estimated_factors = set(beta_details['estimated_factors'])
+    stressed = {}
+    for key in keys:
+        moved = [factor for factor, move in scenarios[key].get('factor_shocks', {}).items() if move]
+        missing = [] if len(symbols) and shock_details['realized_by_scenario'].get(key, 0) == len(symbols) else [
+            factor for factor in moved if factor not in estimated_factors
+        ]
+        stressed[key] = {**scenarios[key], 'estimated': not moved or len(missing) < len(moved),
+                         'missing_factors': missing}
+    return shocks, stressed, {**beta_details, **shock_details}
+
+
+def stress_test(position_values, shocks):
+    """
+    Profit and loss of every portfolio in every scenario as one product:
+    pnl[p, m] = V[p, n] @ shocks[n, m], with V the dollar positions (dense or
+    sparse). Returns (pnl, percent of portfolio value)
+    """
+    pnl = np.asarray(position_values @ shocks)
+    totals = np.asarray(position_values.sum(axis=1)).reshape(-1, 1)
+    percent = np.divide(pnl * 100, totals, out=np.zeros_like(pnl), where=totals > 0)
+    return pnl, percent
+
+
+def summarize_stress_results(pnl, percent, scenarios):
+    """
+    Per-scenario P&L of one portfolio and its worst scenario, chosen among the
+    scenarios with estimated exposure
+    """
+    keys = list(scenarios)
+    results = {
+        key: {
+            'name': scenarios[key]['name'],
+            'type': scenarios[key]['type'],
+            'pnl': round(float(pnl[j]), 2),
+            'percent': round(float(percent[j]), 2),
+            'estimated': scenarios[key].get('estimated', True),
+            **({'missing_factors': scenarios[key]['missing_factors']} if scenarios[key].get('missing_factors') else {})
+        }
+        for j, key in enumerate(keys)
+    }
+    candidates = [j for j, key in enumerate(keys) if results[key]['estimated']]
+    worst = min(candidates, key=lambda j: pnl[j]) if candidates else None
+    return {
+        'scenarios': results,
+        'worst_scenario': keys[worst] if worst is not None else None,
+        'worst_scenario_pnl': round(float(pnl[worst]), 2) if worst is not None else 0
+    }
+
+
+def main():
+    """Stress many portfolios against the scenario set from a JSON file"""
+    try:
+        if len(sys.argv) < 2:
+            print(json.dumps({'error': 'Usage: python stress_testing.py <input.json>'}))
+            sys.exit(1)
+
+        with open(sys.argv[1], 'r') as f:
+            input_data = json.load(f)
+
+        # Universe of symbols across portfolios (first-seen order) with reference data
+        portfolios = input_data.get('portfolios', [])
+        securities = input_data.get('securities', {})
+        position = {}
+        rows, columns, values = [], [], []
+        for row, portfolio in enumerate(portfolios):
+            for holding in portfolio.get('holdings', []):
+                symbol = holding['symbol']
+                if symbol not in position:
+                    position[symbol] = len(position)
+                    securities.setdefault(symbol, {}).setdefault('beta', holding.get('beta', 1.0))
+                value = holding.get('market_value')
+                if value is None:
+                    value = float(holding.get('shares', 0)) * float(holding.get('price', securities[symbol].get('price', 0)))
+                rows.append(row)
+                columns.append(position[symbol])
+                values.append(float(value))
+
+        symbols = list(position)
+        position_values = sparse.csr_matrix((values, (rows, columns)), shape=(len(portfolios), len(symbols)))
+        shocks, scenarios, details = estimate_stress_model(
+            symbols, input_data.get('price_history', {}),
+            np.array([float(securities[symbol].get('beta', 1.0)) for symbol in symbols]),
+            input_data.get('factor_history', {}), input_data.get('scenarios')
+        )
+        pnl, percent = stress_test(position_values, shocks)
+
+        print(json.dumps({
+            'success': True,
+            'results': {
+                str(portfolio.get('id', index)): summarize_stress_results(pnl[index], percent[index], scenarios)
+                for index, portfolio in enumerate(portfolios)
+            },
+            'model': details,
+            'timestamp': datetime.now().isoformat()
+        }, indent=2))
+
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': str(e)}))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
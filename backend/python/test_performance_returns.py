@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Returns of the transaction-ledger engine: trades are booked at the end of the
+day, so the time-weighted return of a traded position is the price return of
+what was held, and money-weighted returns under a year are period returns
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from performance_returns import calculate_account_returns, daily_returns
+
+DATES = ['2025-03-03', '2025-03-04', '2025-03-05', '2025-03-06', '2025-03-07']
+CLOSES = [100.0, 110.0, 99.0, 110.0, 121.0]
+
+
+def traded_ledger():
+    """Buy 10 @ 100, buy 10 @ 110, sell 5 @ 110 while the stock goes 100 -> 121"""
+    return [
+        {'date': DATES[0], 'symbol': 'ABC', 'action': 'BUY', 'quantity': 10, 'price': 100.0},
+        {'date': DATES[1], 'symbol': 'ABC', 'action': 'BUY', 'quantity': 10, 'price': 110.0},
+        {'date': DATES[3], 'symbol': 'ABC', 'action': 'SELL', 'quantity': 5, 'price': 110.0}
+    ]
+
+
+def price_histories(closes=CLOSES):
+    return {'ABC': [{'date': date, 'close': close} for date, close in zip(DATES, closes)]}
+
+
+def test_trades_do_not_bias_time_weighted_return():
+    result = calculate_account_returns(traded_ledger(), price_histories(), include_series=True)['accounts']['default']
+
+    # Every share held earns the stock's 100 -> 121, whatever the trades
+    assert result['time_weighted_return'] == pytest.approx(21.0, abs=1e-9)
+    assert result['ending_nav'] == pytest.approx(15 * 121.0)
+    assert [day['twr_index'] for day in result['daily']] == pytest.approx(np.array(CLOSES) / 100.0)
+
+
+def test_end_of_day_flows():
+    nav = np.array([1000.0, 2200.0, 1980.0, 1650.0])
+    flows = np.array([1000.0, 1100.0, 0.0, -550.0])
+    np.testing.assert_allclose(daily_returns(nav, flows), [0.0, 0.1, -0.1, 1.0 / 9.0])
+
+
+def test_short_period_money_weighted_return_is_not_annualized():
+    result = calculate_account_returns(traded_ledger(), price_histories())['accounts']['default']
+
+    assert result['years'] < 1
+    assert result['annualized_time_weighted_return'] is None
+    assert result['annualized_money_weighted_return'] is None
+    assert result['irr_converged']
+    # Same order of magnitude as the TWR rather than an annualized 10^6 %
+    assert 10.0 < result['money_weighted_return'] < 30.0
+
+
+def test_money_weighted_return_over_a_year():
+    dates = ['2024-01-02', '2025-01-02']
+    ledger = [{'date': dates[0], 'symbol': 'ABC', 'action': 'BUY', 'quantity': 10, 'price': 100.0}]
+    histories = {'ABC': [{'date': dates[0], 'close': 100.0}, {'date': dates[1], 'close': 110.0}]}
+    result = calculate_account_returns(ledger, histories)['accounts']['default']
+
+    assert result['money_weighted_return'] == pytest.approx(10.0, abs=1e-6)
+    assert result['annualized_money_weighted_return'] == pytest.approx(
+        100 * (1.1 ** (1 / result['years']) - 1), abs=1e-3
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Invariants of the portfolio metrics engine: incremental position edits agree
+with a full refresh, previews leave the portfolio untouched, and the columnar
+report reproduces the values of the earlier list-of-dicts implementation
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from portfolio_metrics import PortfolioAnalytics, calculate_portfolio_metrics
+
+SPECS = [
+    ('AAPL', 'Technology', 1.2, 3.0e12, 0.005),
+    ('MSFT', 'Technology', 1.1, 3.1e12, 0.007),
+    ('JNJ', 'Healthcare', 0.6, 4.0e11, 0.03),
+    ('XOM', 'Energy', 0.9, 4.5e11, 0.034),
+    ('TLT', 'Fixed Income', 0.2, 0, 0.038),
+    ('NVDA', 'Technology', 1.7, 2.9e12, 0.0003)
+]
+
+
+def sample_portfolio(dated=False):
+    """Six holdings with 300 seeded daily prices each"""
+    rng = np.random.default_rng(7)
+    dates = [str(d.date()) for d in pd.bdate_range('2024-01-01', periods=300)]
+    holdings = []
+    for i, (symbol, sector, beta, market_cap, dividend_yield) in enumerate(SPECS):
+        prices = 100 * np.cumprod(1 + rng.normal(0.0004, 0.01 + 0.004 * i, len(dates)))
+        history = ([{'date': d, 'close': float(p)} for d, p in zip(dates, prices)] if dated
+                   else [float(p) for p in prices])
+        holdings.append({
+            'symbol': symbol, 'shares': 10 + 7 * i, 'current_price': float(prices[-1]),
+            'cost_basis': float(prices[0]), 'sector': sector, 'beta': beta,
+            'market_cap': market_cap, 'dividend_yield': dividend_yield, 'price_history': history
+        })
+    return holdings
+
+
+def position_arguments(holding):
+    return dict(
+        price=holding['current_price'], cost_basis=holding['cost_basis'], sector=holding['sector'],
+        beta=holding['beta'], market_cap=holding['market_cap'], dividend_yield=holding['dividend_yield'],
+        price_history=holding['price_history']
+    )
+
+
+def comparable(metrics):
+    """Live metrics without the covariance details, which only refresh() rebuilds"""
+    return {key: value for key, value in metrics.items() if key != 'covariance_model'}
+
+
+def risk_by_symbol(analytics):
+    return {analytics.symbols[slot]: analytics.risk_vector[slot] for slot in np.flatnonzero(analytics.active)}
+
+
+@pytest.mark.parametrize('dated', [False, True])
+def test_incremental_edits_match_refresh(dated):
+    holdings = sample_portfolio(dated)
+    analytics = PortfolioAnalytics(holdings[:4], capacity=4)
+
+    # Add two holdings (growing the slots), resize one and close another
+    for holding in holdings[4:]:
+        analytics.set_position(holding['symbol'], holding['shares'], **position_arguments(holding))
+    analytics.set_position('JNJ', 40, price=holdings[2]['current_price'])
+    analytics.remove_position('MSFT')
+
+    final = [dict(h, shares=40) if h['symbol'] == 'JNJ' else h for h in holdings if h['symbol'] != 'MSFT']
+    refreshed = PortfolioAnalytics(final)
+
+    assert analytics.variance == pytest.approx(refreshed.variance, rel=1e-9)
+    assert analytics.total_market_value == pytest.approx(refreshed.total_market_value, rel=1e-12)
+    incremental_risk, refreshed_risk = risk_by_symbol(analytics), risk_by_symbol(refreshed)
+    assert incremental_risk.keys() == refreshed_risk.keys()
+    for symbol, value in refreshed_risk.items():
+        assert incremental_risk[symbol] == pytest.approx(value, rel=1e-9, abs=1e-9)
+    assert comparable(analytics.live_metrics()) == comparable(refreshed.live_metrics())
+
+
+def test_short_history_holding_matches_refresh():
+    holdings = sample_portfolio(dated=True)
+    short = dict(holdings[5], price_history=holdings[5]['price_history'][-40:])
+    analytics = PortfolioAnalytics(holdings[:5])
+    analytics.set_position(short['symbol'], short['shares'], **position_arguments(short))
+
+    refreshed = PortfolioAnalytics(holdings[:5] + [short])
+    assert refreshed.covariance_details['short_history'] == ['NVDA']
+    assert analytics.variance == pytest.approx(refreshed.variance, rel=1e-9)
+
+
+@pytest.mark.parametrize('symbol, shares, extra', [
+    ('XOM', 120, {}),                                            # resize
+    ('XOM', 25, {'sector': 'Utilities', 'beta': 0.4}),           # resize with new attributes
+    ('MSFT', 0, {}),                                             # close out
+    ('KO', 50, {'price': 60.0, 'sector': 'Consumer Staples'})    # new holding
+])
+def test_preview_leaves_portfolio_unchanged(symbol, shares, extra):
+    analytics = PortfolioAnalytics(sample_portfolio(dated=True))
+    before = analytics.live_metrics()
+    active = np.flatnonzero(analytics.active)
+    columns = {column: np.copy(getattr(analytics, column)[active])
+               for column in ('shares', 'price', 'cost_basis', 'market_value', 'beta', 'risk_vector')}
+    covariance = analytics.covariance[np.ix_(active, active)].copy()
+    slots, free_slots = dict(analytics.slots), list(analytics.free_slots)
+    sector_values, variance = analytics.sector_values.copy(), analytics.variance
+
+    preview = analytics.preview_position(symbol, shares, **extra)
+
+    assert preview != before
+    assert analytics.live_metrics() == before
+    assert analytics.slots == slots and analytics.free_slots == free_slots
+    np.testing.assert_array_equal(np.flatnonzero(analytics.active), active)
+    for column, values in columns.items():
+        np.testing.assert_allclose(getattr(analytics, column)[active], values, rtol=1e-12, atol=1e-9)
+    np.testing.assert_allclose(analytics.covariance[np.ix_(active, active)], covariance, rtol=0, atol=0)
+    np.testing.assert_allclose(analytics.sector_values[:len(sector_values)], sector_values, atol=1e-9)
+    assert analytics.variance == pytest.approx(variance, rel=1e-12)
+
+
+# Report values of the list-of-dicts implementation (before the NumPy
+# column refactor) for sample_portfolio(); Monte Carlo VaR has changed since
+BASELINE_REPORT = {
+    ('holdings_count',): 6,
+    ('performance', 'total_market_value'): 14447.23,
+    ('performance', 'total_cost_basis'): 16249.67,
+    ('performance', 'total_unrealized_gain_loss'): -1802.44,
+    ('performance', 'total_return_percent'): -11.09,
+    ('performance', 'weighted_beta'): 0.838,
+    ('performance', 'weighted_dividend_yield'): 0.024,
+    ('risk_analysis', 'portfolio_volatility'): 0.1848,
+    ('risk_analysis', 'value_at_risk_1day'): 276.68,
+    ('risk_analysis', 'value_at_risk_percent'): 1.92,
+    ('risk_analysis', 'max_single_holding_risk'): 3779.37,
+    ('risk_analysis', 'risk_score'): 5,
+    ('risk_analysis', 'concentration_risk', 'hhi_index'): 2094.2,
+    ('risk_analysis', 'concentration_risk', 'top_3_concentration'): 71.9,
+    ('risk_analysis', 'concentration_risk', 'concentration_score'): 50.3,
+    ('risk_analysis', 'beta_analysis', 'high_beta_allocation'): 20.0,
+    ('risk_analysis', 'beta_analysis', 'low_beta_allocation'): 44.9,
+    ('risk_analysis', 'sector_risk', 'sector_weights'): {
+        'Energy': 22.6, 'Fixed Income': 29.4, 'Healthcare': 15.6, 'Technology': 32.5
+    },
+    ('diversification', 'diversification_score'): 55.6,
+    ('diversification', 'weight_distribution_std'): 8.44,
+    ('diversification', 'market_cap_allocation'): {'large_cap': 70.6, 'mid_cap': 0, 'small_cap': 29.4},
+    ('optimization', 'current_sharpe_ratio'): -0.442,
+    ('optimization', 'optimization_score'): 40.0,
+    ('risk_adjusted', 'sharpe_ratio'): -0.708,
+    ('risk_adjusted', 'sortino_ratio'): -0.567
+}
+
+BASELINE_ORDERS = {
+    ('performance', 'top_performers'): ['TLT', 'XOM', 'JNJ', 'AAPL', 'NVDA'],
+    ('performance', 'worst_performers'): ['XOM', 'JNJ', 'AAPL', 'NVDA', 'MSFT'],
+    ('risk_analysis', 'risk_contributions'): ['TLT', 'NVDA', 'XOM', 'JNJ', 'MSFT', 'AAPL'],
+    ('optimization', 'rebalancing_suggestions'): ['TLT', 'XOM', 'NVDA', 'JNJ', 'NVDA']
+}
+
+
+def lookup(report, path):
+    for key in path:
+        report = report[key]
+    return report
+
+
+def test_report_matches_list_of_dicts_baseline():
+    report = calculate_portfolio_metrics(sample_portfolio())
+    for path, expected in BASELINE_REPORT.items():
+        assert lookup(report, path) == expected, path
+    for path, symbols in BASELINE_ORDERS.items():
+        assert [entry['symbol'] for entry in lookup(report, path)] == symbols, path
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
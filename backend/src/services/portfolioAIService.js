@@ -418,33 +418,35 @@ class PortfolioAIService {
       // Prepare feature data for ML models
       const featureData = await this.prepareMLFeatures(portfolio, marketData);
       
-      // Generate predictions for each horizon with timeout
-      for (const horizon of horizons) {
-        console.log(`🔮 Generating ${horizon}-day predictions...`);
-        
-        try {
-          // Add timeout to Python bridge calls
-          const horizonPredictions = await Promise.race([
-            pythonBridge.runScript('ml_predictions', {
-              feature_data: featureData,
-              symbols: symbols,
-              prediction_horizon: horizon,
-              ensemble_weights: this.mlConfig.ensembleWeights,
-              model_config: {
-                retrain: this.shouldRetrainModels(),
-                validation_split: 0.2,
-                walk_forward: true
-              }
-            }),
-            new Promise((_, reject) => 
-              setTimeout(() => reject(new Error('Python bridge timeout')), 10000)
-            )
-          ]);
-
-          predictions[`${horizon}d`] = horizonPredictions;
-        } catch (error) {
-          console.error(`❌ Failed to generate ${horizon}-day predictions:`, error.message);
-          // Generate fallback for this horizon
+      // One multi-horizon call: the Python service trains once and serves every horizon
+      console.log(`🔮 Generating ${horizons.join('/')}-day predictions...`);
+      
+      try {
+        // Add timeout to Python bridge calls
+        const horizonPredictions = await Promise.race([
+          pythonBridge.runScript('ml_predictions', {
+            feature_data: featureData,
+            symbols: symbols,
+            prediction_horizons: horizons,
+            ensemble_weights: this.mlConfig.ensembleWeights,
+            model_config: {
+              retrain: this.shouldRetrainModels(),
+              validation_split: 0.2,
+              walk_forward: true
+            }
+          }),
+          new Promise((_, reject) => 
+            setTimeout(() => reject(new Error('Python bridge timeout')), 10000)
+          )
+        ]);
+
+        for (const horizon of horizons) {
+          predictions[`${horizon}d`] = horizonPredictions.predictions?.[`${horizon}d`] || {};
+        }
+      } catch (error) {
+        console.error(`❌ Failed to generate ${horizons.join('/')}-day predictions:`, error.message);
+        // Generate fallback for every horizon
+        for (const horizon of horizons) {
           predictions[`${horizon}d`] = {};
           symbols.forEach(symbol => {
             predictions[`${horizon}d`][symbol] = {